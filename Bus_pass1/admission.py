@@ -0,0 +1,178 @@
+# admission.py
+#
+# In-process admission control. Every request is put in a route class (public,
+# admin, static or gateway) with its own concurrency cap, so admins keep their reserved
+# slots when riders swamp the site. Only requests from a logged-in admin session are
+# in the admin class: anonymous /admin/* requests, /admin/login included, are public
+# like any other. Public requests additionally pass a per-client and a global token
+# bucket. Requests over a limit are refused straight away with
+# 429 (this client is too fast) or 503 (the site is full) and a Retry-After
+# header, instead of queueing in the WSGI server until they time out.
+#
+# Limits are per process: the effective site-wide rate is the configured rate
+# times the number of worker processes.
+
+import math
+import time
+import threading
+from collections import OrderedDict
+
+from flask import g, request, session, jsonify, Response
+
+from config import (
+    ADMISSION_ENABLED, ADMISSION_GLOBAL_RATE, ADMISSION_GLOBAL_BURST, ADMISSION_CLIENT_RATE,
+    ADMISSION_CLIENT_BURST, ADMISSION_MAX_TRACKED_CLIENTS, ADMISSION_CONCURRENCY,
+)
+from metrics import registry, Counter
+
+EXEMPT_ENDPOINTS = {'metrics'}
+
+shed_requests = registry.register(Counter(
+    'admission_shed_total', 'Requests refused by admission control.', ('route_class', 'reason')))
+
+
+class TokenBucket:
+    """Classic token bucket refilled lazily on each take()."""
+
+    def __init__(self, rate, burst, now=None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic() if now is None else now
+
+    def take(self, now):
+        """Takes one token; returns 0 if allowed, else the seconds until one is available."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class ClientBuckets:
+    """Per-client token buckets; the least recently seen clients are forgotten past `max_clients`."""
+
+    def __init__(self, rate, burst, max_clients):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+
+    def take(self, client, now):
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = TokenBucket(self.rate, self.burst, now)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+        return bucket.take(now)
+
+
+class AdmissionController:
+    def __init__(self, concurrency, global_rate, global_burst, client_rate, client_burst, max_clients):
+        self.concurrency = dict(concurrency)
+        self.in_flight = {route_class: 0 for route_class in concurrency}
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.clients = ClientBuckets(client_rate, client_burst, max_clients)
+        self._lock = threading.Lock()
+
+    def admit(self, route_class, client, now=None):
+        """
+        Reserves a concurrency slot for a request. Returns None when admitted
+        (release() must follow), else (status, reason, retry_after_seconds).
+        `now` is a time.monotonic() reading (defaults to the current one).
+        """
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            if self.in_flight[route_class] >= self.concurrency[route_class]:
+                return 503, 'concurrency', 1
+            if route_class == 'public':
+                wait = self.clients.take(client, now)
+                if wait:
+                    return 429, 'client_rate', wait
+                wait = self.global_bucket.take(now)
+                if wait:
+                    return 503, 'global_rate', wait
+            self.in_flight[route_class] += 1
+        return None
+
+    def release(self, route_class):
+        with self._lock:
+            self.in_flight[route_class] -= 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self.in_flight)
+
+
+def route_class_for(path, admin_session=False):
+    if path.startswith('/admin') and admin_session:
+        return 'admin'
+    if path.startswith('/payments/notify'):
+        return 'gateway'
+    if path.startswith('/static/'):
+        return 'static'
+    return 'public'
+
+
+def client_key():
+    """
+    Logged-in riders (by session, or by verified API bearer token, see
+    api._authenticate) are limited per account, everyone else per address.
+    """
+    user_id = g.get('api_user_id')
+    if user_id is None:
+        user_id = session.get('user_id')
+    return f"user:{user_id}" if user_id is not None else f"ip:{request.remote_addr}"
+
+
+controller = AdmissionController(
+    ADMISSION_CONCURRENCY, ADMISSION_GLOBAL_RATE, ADMISSION_GLOBAL_BURST,
+    ADMISSION_CLIENT_RATE, ADMISSION_CLIENT_BURST, ADMISSION_MAX_TRACKED_CLIENTS,
+)
+
+
+def _shed_response(status, retry_after):
+    retry_after = str(max(1, math.ceil(retry_after)))
+    message = ('Too many requests, please slow down.' if status == 429
+               else 'The service is busy, please try again shortly.')
+    if request.accept_mimetypes.best == 'application/json' or request.is_json:
+        response = jsonify({'error': message})
+        response.status_code = status
+    else:
+        response = Response(message, status=status, mimetype='text/plain')
+    response.headers['Retry-After'] = retry_after
+    return response
+
+
+def _before_request():
+    if request.endpoint in EXEMPT_ENDPOINTS:
+        return None
+    route_class = route_class_for(request.path, 'admin_id' in session)
+    refused = controller.admit(route_class, client_key())
+    if refused:
+        status, reason, retry_after = refused
+        shed_requests.inc(route_class=route_class, reason=reason)
+        return _shed_response(status, retry_after)
+    g.admission_class = route_class
+    return None
+
+
+def _teardown_request(exc=None):
+    route_class = g.pop('admission_class', None)
+    if route_class is not None:
+        controller.release(route_class)
+
+
+def init_app(app):
+    if not ADMISSION_ENABLED:
+        return
+    app.before_request(_before_request)
+    app.teardown_request(_teardown_request)
+    registry.add_collector(
+        'admission_in_flight', 'Requests currently admitted, by route class.',
+        lambda: {(route_class,): count for route_class, count in controller.stats().items()},
+        labels=('route_class',))
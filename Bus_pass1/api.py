@@ -0,0 +1,292 @@
+# api.py
+#
+# Versioned JSON API for the rider mobile app, mounted at /api/v1.
+#
+#   POST /auth/token                 email + password -> bearer token
+#   GET  /pass                       current pass (or latest status) and its QR token
+#   GET  /applications/latest        most recent application
+#   POST /applications               apply for a pass {start_point, end_point}
+#   POST /applications/<id>/pay      pay for an application (idempotent)
+#   GET  /stops                      stops on sale, their zones and routes, and zone fares
+#
+# Requests authenticate with "Authorization: Bearer <token>", a signed, expiring
+# token carrying the rider id, so no cookie session is kept. Responses are
+# compact JSON of narrow projections. GETs carry a weak ETag of their body and a
+# matching If-None-Match gets an empty 304; /pass is served from the pass cache,
+# so a polling app costs no database work between changes. Bodies of at least
+# API_COMPRESS_MIN_BYTES are brotli (when the package is installed) or gzip
+# compressed for clients that accept it.
+
+import gzip
+import json
+import hashlib
+import datetime
+import functools
+from decimal import Decimal
+
+import mysql.connector
+from flask import Blueprint, Response, request, g, current_app
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+import fares
+from applications import (
+    APPLICATION_COLUMNS, DatabaseUnavailable, cached_pass_row, latest_application, awaiting_payment,
+    create_application, pay_application,
+)
+from config import SECRET_KEY, API_TOKEN_MAX_AGE, API_COMPRESS_MIN_BYTES, API_GZIP_LEVEL, API_BROTLI_QUALITY
+from db import get_db_connection
+from pass_tokens import sign_pass_token
+from passwords import hasher as password_hasher, HasherBusy
+
+api_v1 = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+tokens = URLSafeTimedSerializer(SECRET_KEY, salt='rider-api-token')
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def api_response(data, status=200, headers=None):
+    """Compact JSON response; 200s get a weak ETag and become 304s when the client has it."""
+    body = json.dumps(data, separators=(',', ':'), default=_json_default).encode()
+    response = Response(body, status=status, mimetype='application/json', headers=headers)
+    if status == 200 and request.method == 'GET':
+        etag = hashlib.blake2b(body, digest_size=12).hexdigest()
+        response.set_etag(etag, weak=True)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        if request.if_none_match.contains_weak(etag):
+            response.set_data(b'')
+            response.status_code = 304
+    return response
+
+
+def api_error(message, status, headers=None, **extra):
+    return api_response({'error': message, **extra}, status, headers)
+
+
+def _authenticate():
+    """
+    Verifies the bearer token of an API request, setting g.api_user_id (or
+    g.api_auth_error). Runs before every other hook, so admission control can
+    limit API calls per rider rather than per address.
+    """
+    if request.blueprint != api_v1.name:
+        return
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        g.api_auth_error = ('Missing bearer token.', 'Bearer')
+        return
+    try:
+        g.api_user_id = tokens.loads(token.strip(), max_age=API_TOKEN_MAX_AGE)['uid']
+    except SignatureExpired:
+        g.api_auth_error = ('Token expired.', 'Bearer error="invalid_token"')
+    except (BadSignature, KeyError, TypeError):
+        g.api_auth_error = ('Invalid token.', 'Bearer error="invalid_token"')
+
+
+def rider_required(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if g.get('api_user_id') is None:
+            message, challenge = g.get('api_auth_error', ('Missing bearer token.', 'Bearer'))
+            return api_error(message, 401, {'WWW-Authenticate': challenge})
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def application_json(row):
+    return {key: row[key] for key in (
+        'id', 'status', 'payment_status', 'start_point', 'end_point', 'amount',
+        'application_date', 'valid_from', 'valid_until',
+    )} if row else None
+
+
+@api_v1.before_request
+def _stateless():
+    # Writes must not set a read-your-writes session cookie (see db.mark_session_wrote)
+    g.stateless_client = True
+
+
+@api_v1.after_request
+def _compress(response):
+    if (response.status_code != 200 or response.direct_passthrough or 'Content-Encoding' in response.headers
+            or (response.content_length or 0) < API_COMPRESS_MIN_BYTES):
+        return response
+    response.vary.add('Accept-Encoding')
+    if brotli is not None and request.accept_encodings['br']:
+        response.set_data(brotli.compress(response.get_data(), quality=API_BROTLI_QUALITY))
+        response.headers['Content-Encoding'] = 'br'
+    elif request.accept_encodings['gzip']:
+        response.set_data(gzip.compress(response.get_data(), compresslevel=API_GZIP_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+@api_v1.route('/auth/token', methods=['POST'])
+def issue_token():
+    payload = request.get_json(silent=True) or {}
+    email, password = payload.get('email'), payload.get('password')
+    if not isinstance(email, str) or not isinstance(password, str):
+        return api_error('"email" and "password" are required.', 400)
+
+    conn = get_db_connection()
+    if not conn:
+        return api_error('Database connection failed. Please try later.', 503)
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT id, name, password_hash FROM users WHERE email = %s", (email,))
+        user = cursor.fetchone()
+    finally:
+        cursor.close()
+
+    try:
+        password_ok, new_hash = password_hasher.verify(user['password_hash'], password) if user else (False, None)
+    except HasherBusy:
+        return api_error('The server is busy, please try again in a moment.', 503, {'Retry-After': '2'})
+    if not password_ok:
+        return api_error('Invalid email or password.', 401)
+
+    if new_hash:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("UPDATE users SET password_hash = %s WHERE id = %s", (new_hash, user['id']))
+            conn.commit()
+        except mysql.connector.Error as err:
+            conn.rollback()
+            current_app.logger.error(f"DB Error upgrading password hash for users {user['id']}: {err}")
+        finally:
+            cursor.close()
+
+    return api_response({
+        'token': tokens.dumps({'uid': user['id']}),
+        'token_type': 'Bearer',
+        'expires_in': API_TOKEN_MAX_AGE,
+        'rider': {'id': user['id'], 'name': user['name']},
+    })
+
+
+@api_v1.route('/pass')
+@rider_required
+def current_pass():
+    try:
+        row = cached_pass_row(g.api_user_id)
+    except DatabaseUnavailable:
+        return api_error('Database connection failed. Please try later.', 503)
+
+    data = {
+        'status': row.get('status'),
+        'payment_status': row.get('payment_status'),
+        'auto_renew': bool(row.get('auto_renew')),
+        'pass': None,
+    }
+    if row.get('status') == 'APPROVED':
+        data['pass'] = {
+            'pass_number': row['pass_number'],
+            'start_point': row['start_point'],
+            'end_point': row['end_point'],
+            'valid_from': row['valid_from'],
+            'valid_until': row['valid_until'],
+            # What the pass QR code encodes; the app renders it locally
+            'qr_token': sign_pass_token(row['pass_number'], row['start_point'], row['end_point'],
+                                        row['valid_from'], row['valid_until']),
+        }
+    return api_response(data)
+
+
+@api_v1.route('/applications/latest')
+@rider_required
+def latest():
+    # Primary, not a replica: API clients have no session to pin their reads after a write
+    conn = get_db_connection()
+    if not conn:
+        return api_error('Database connection failed. Please try later.', 503)
+    cursor = conn.cursor(dictionary=True)
+    try:
+        row = latest_application(cursor, g.api_user_id)
+    finally:
+        cursor.close()
+    return api_response({'application': application_json(row)})
+
+
+@api_v1.route('/applications', methods=['POST'])
+@rider_required
+def apply():
+    payload = request.get_json(silent=True) or {}
+    start_point, end_point = payload.get('start_point'), payload.get('end_point')
+    amount = None
+    if isinstance(start_point, str) and isinstance(end_point, str):
+        amount = fares.current().fare(start_point, end_point)
+    if amount is None:
+        return api_error('No pass is sold between these stops.', 422)
+
+    conn = get_db_connection()
+    if not conn:
+        return api_error('Database connection failed. Please try later.', 503)
+    cursor = conn.cursor(dictionary=True)
+    try:
+        previous = latest_application(cursor, g.api_user_id)
+        if awaiting_payment(previous):
+            return api_error('An earlier application is awaiting payment.', 409,
+                             application=application_json(previous))
+        create_application(conn, cursor, g.api_user_id, start_point, end_point, amount)
+        row = latest_application(cursor, g.api_user_id)
+    except mysql.connector.Error as err:
+        conn.rollback()
+        current_app.logger.error(f"API Error submitting application: {err}")
+        return api_error('Could not submit the application. Please try later.', 503)
+    finally:
+        cursor.close()
+    return api_response({'application': application_json(row)}, 201)
+
+
+@api_v1.route('/applications/<int:app_id>/pay', methods=['POST'])
+@rider_required
+def pay(app_id):
+    conn = get_db_connection()
+    if not conn:
+        return api_error('Database connection failed. Please try later.', 503)
+    cursor = conn.cursor(dictionary=True)
+    try:
+        query = f"SELECT {APPLICATION_COLUMNS} FROM applications WHERE id = %s AND user_id = %s"
+        cursor.execute(query, (app_id, g.api_user_id))
+        application = cursor.fetchone()
+        if not application:
+            return api_error('Application not found.', 404)
+        result = pay_application(conn, application)
+        cursor.execute(query, (app_id, g.api_user_id))
+        application = cursor.fetchone()
+    except mysql.connector.Error as err:
+        current_app.logger.error(f"API Error paying application {app_id}: {err}")
+        return api_error('Payment could not be applied; retry the request.', 503)
+    finally:
+        cursor.close()
+
+    data = {'outcome': result['outcome'], 'detail': result['detail'], 'duplicate': result['duplicate'],
+            'application': application_json(application)}
+    return api_response(data, 422 if result['outcome'] == 'rejected' else 200)
+
+
+@api_v1.route('/stops')
+def stops():
+    fare_table = fares.current()
+    return api_response({
+        'version': fare_table.version,
+        'stops': fare_table.active_stop_names,
+        'fares': fare_table.form_data(),
+    })
+
+
+def init_app(app):
+    app.register_blueprint(api_v1)
+    # Ahead of admission.py's hook, which keys API calls on the verified rider id
+    app.before_request_funcs.setdefault(None, []).insert(0, _authenticate)
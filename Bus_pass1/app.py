@@ -2,49 +2,117 @@
 
 import os
 import uuid
-import qrcode
+import time
+import base64
 import datetime
+import io
+import mimetypes
+from decimal import Decimal, InvalidOperation
 from PIL import Image
 import mysql.connector  # Using the standard MySQL connector
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_from_directory
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, Request, render_template, request, redirect, url_for, session, flash, send_from_directory, jsonify, abort, Response, stream_with_context
+from itsdangerous import BadSignature
+from werkzeug.security import safe_join
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 # --- CONFIGURATION ---
 # Note: config.py must exist in the same directory and contain DB and SECRET_KEY variables
-from config import DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, SECRET_KEY
+from config import (
+    SECRET_KEY, ADMIN_PAGE_SIZE, BULK_ACTION_MAX, QR_IMAGE_MAX_AGE, QR_STORE_FILES, VERIFY_MAX_BATCH,
+    PHOTO_MAX_UPLOAD_BYTES, UPLOADS_MAX_AGE, UPLOADS_SENDFILE_MODE, UPLOADS_ACCEL_PREFIX,
+    PAYMENT_NOTIFY_MAX_BATCH, AUDIT_QUERY_MAX_LIMIT, PROXY_TRUSTED_HOPS, CSV_IMPORT_MAX_UPLOAD_BYTES,
+)
+from db import get_db_connection, init_app as init_db, pool as db_pool, all_pools as all_db_pools
+import migrate
+from qr_codes import QR_CODE_FOLDER, QR_MIMETYPES, image_cache as qr_image_cache, qr_etag
+import qr_jobs
+from pass_tokens import sign_pass_token, pass_validity_window, verifier as pass_verifier
+import validation_snapshot
+import photos
+import counters
+from pass_cache import pass_cache
+import metrics
+import admission
+import csv_io
+import payments
+import fares
+import pass_schedule
+import api
+import audit
+from audit import audit_log
+from applications import (
+    DatabaseUnavailable, cached_pass_row, latest_application, awaiting_payment, create_application, pay_application,
+)
+from passwords import hasher as password_hasher, HasherBusy, password_fingerprint, UNUSABLE_PREFIX
+
+
+class BusPassRequest(Request):
+    @property
+    def max_content_length(self):
+        # Rider CSV uploads get their own limit; everything else the photo limit below
+        if self.endpoint == 'admin_import_users':
+            return CSV_IMPORT_MAX_UPLOAD_BYTES
+        return super().max_content_length
+
 
 app = Flask(__name__)
+app.request_class = BusPassRequest
 app.secret_key = SECRET_KEY
+# Behind nginx, take the client address and scheme from the trusted proxies' headers
+if PROXY_TRUSTED_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_TRUSTED_HOPS, x_proto=PROXY_TRUSTED_HOPS)
 
 # File Upload Settings
 UPLOAD_FOLDER = 'static/uploads'
-PHOTO_FOLDER = os.path.join(UPLOAD_FOLDER, 'photos')
-QR_CODE_FOLDER = os.path.join(UPLOAD_FOLDER, 'qrcodes')
+PHOTO_FOLDER = photos.PHOTO_FOLDER
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Refuse oversized uploads before they are read (413); see BusPassRequest for CSV imports
+app.config['MAX_CONTENT_LENGTH'] = PHOTO_MAX_UPLOAD_BYTES
+# Let a front server stream uploaded files (see serve_uploaded_files)
+app.config['USE_X_SENDFILE'] = UPLOADS_SENDFILE_MODE == 'x-sendfile'
 
 # Ensure upload directories exist
 os.makedirs(PHOTO_FOLDER, exist_ok=True)
 os.makedirs(QR_CODE_FOLDER, exist_ok=True)
 
 
-# --- DATABASE CONNECTION HELPER FUNCTION (FIXED) ---
-def get_db_connection():
-    """
-    Establishes a connection to the MySQL database using mysql.connector.
-    This replaces the outdated flaskext.mysql functionality.
-    """
-    try:
-        conn = mysql.connector.connect(
-            host=DB_HOST,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            database=DB_NAME
-        )
-        return conn
-    except mysql.connector.Error as err:
-        print(f"Database Connection Error: {err}")
-        # Cannot call flash here reliably if not in request context in other situations, but leaving an informative print
-        return None
+# --- DATABASE CONNECTION ---
+# get_db_connection() hands out one pooled connection per request (see db.py);
+# the connection is returned to the pool automatically when the request ends.
+init_db(app)
+
+# `flask db upgrade` applies the numbered scripts in migrations/ (see migrate.py)
+migrate.init_app(app)
+
+# QR images are rendered off the request path by `flask qr worker` (see qr_jobs.py)
+qr_jobs.init_app(app)
+
+# `flask snapshot prune` trims the validator change log (see validation_snapshot.py)
+validation_snapshot.init_app(app)
+
+# Dashboard counts are maintained per transition; `flask counters reconcile` rebuilds them
+counters.init_app(app)
+
+# Request/query/render timings in Prometheus format at /metrics
+metrics.init_app(app, all_db_pools())
+
+# Token-bucket limits and per-route-class concurrency caps (see admission.py)
+admission.init_app(app)
+
+# `flask csv import-users FILE` for rider lists too large to upload (see csv_io.py)
+csv_io.init_app(app)
+
+# Stops and fares are edited at /admin/fares and served from memory (see fares.py)
+fares.init_app(app)
+
+# `flask passes run` expires ended passes and creates opted-in renewals (see pass_schedule.py)
+pass_schedule.init_app(app)
+
+# JSON API for the rider mobile app at /api/v1, bearer-token authenticated (see api.py)
+api.init_app(app)
+
+# Transitions are logged to audit_events by a background writer; `flask audit show` reads them (see audit.py)
+audit.init_app(app)
 
 
 # --- HELPER FUNCTIONS ---
@@ -58,24 +126,54 @@ def is_admin_logged_in():
     return 'admin_id' in session
 
 
-def generate_qr_code(data: str, filename: str) -> str:
+def admin_actor() -> str:
+    """Audit log actor for the logged-in admin."""
+    return f"admin:{session['admin_id']}"
+
+
+@app.template_filter('photo_thumb')
+def photo_thumb_filter(photo_path: str) -> str:
+    """Thumbnail of a stored photo_path, relative to UPLOAD_FOLDER for serve_uploaded_files."""
+    return photos.thumbnail_path(photo_path).split('/', 1)[-1]
+
+
+def make_pass_number(app_id: int) -> str:
+    return f"BP-{app_id}-{datetime.datetime.now().strftime('%Y%m%d')}"
+
+
+def validity_window(app_data: dict):
     """
-    Generates a QR code image file in QR_CODE_FOLDER and returns the DB-relative path
-    (eg. 'uploads/qrcodes/<filename>.png') for storing in the database.
+    (valid_from, valid_until) of a pass: the stored window once approved (or
+    preset on a renewal), else the window a pass approved for this application
+    gets. `app_data` needs valid_from, valid_until and application_date.
     """
-    full_path = os.path.join(QR_CODE_FOLDER, filename)
-    # Using qrcode make and save
-    img = qrcode.make(data)
-    img.save(full_path)
-    # Return path relative to 'static' for use in templates: 'uploads/qrcodes/filename'
-    return os.path.join('uploads', 'qrcodes', filename).replace('\\', '/')
+    if app_data.get('valid_from') and app_data.get('valid_until'):
+        return app_data['valid_from'], app_data['valid_until']
+    return pass_validity_window(app_data['application_date'].date())
 
 
-# Random Bangalore Points for Pass Application (Simulated data)
-BANGALORE_POINTS = [
-    "Majestic", "Jayanagar", "Whitefield", "Koramangala",
-    "Electronic City", "Indiranagar", "Marathahalli", "Yeshwanthpur"
-]
+def make_qr_data(pass_number: str, app_data: dict) -> str:
+    """
+    Signed pass token encoded in a pass's QR code (see pass_tokens.py); conductors
+    check it with /verify without a database lookup. `app_data` needs start_point,
+    end_point and the fields validity_window() reads.
+    """
+    # Fallback if start/end not present
+    start_point = app_data.get('start_point', 'NA')
+    end_point = app_data.get('end_point', 'NA')
+    valid_from, valid_until = validity_window(app_data)
+    return sign_pass_token(pass_number, start_point, end_point, valid_from, valid_until)
+
+
+def pass_change_added(pass_number: str, app_data: dict):
+    """pass_changes row publishing a newly approved pass to offline validators."""
+    valid_until = validity_window(app_data)[1]
+    return (pass_number, 'ADD', app_data['start_point'], app_data['end_point'], valid_until)
+
+
+def wants_json() -> bool:
+    """True for API-style callers (JSON body or Accept header) rather than browser forms."""
+    return request.is_json or request.accept_mimetypes.best == 'application/json'
 
 
 # --- USER ROUTES ---
@@ -101,39 +199,52 @@ def register():
             flash('Please fill in all required fields.', 'danger')
             return render_template('public/register.html')
 
-        # Hash password using Werkzeug security
-        password_hash = generate_password_hash(password)
-        photo_path = None
+        # Hash password on the bounded hasher pool (see passwords.py)
+        try:
+            password_hash = password_hasher.hash(password)
+        except HasherBusy:
+            flash('The server is busy, please try again in a moment.', 'warning')
+            return render_template('public/register.html'), 503, {'Retry-After': '2'}
         conn = get_db_connection()
 
         if not conn:
             flash("Database connection failed. Please try later.", "danger")
             return render_template('public/register.html')
 
+        photo_temp = None
         try:
             cursor = conn.cursor()
 
             # 1. Handle photo upload (optional)
             if photo and photo.filename != '':
-                # Create a unique filename
-                photo_filename = str(uuid.uuid4()) + os.path.splitext(photo.filename)[-1]
-
                 # Check extension (basic security)
-                if photo_filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-                    photo_file_path = os.path.join(PHOTO_FOLDER, photo_filename)
-                    photo.save(photo_file_path)
-                    # Store relative path for serving via static route
-                    photo_path = os.path.join('uploads', 'photos', photo_filename).replace('\\', '/')
-                else:
+                if not photo.filename.lower().endswith(('.png', '.jpg', '.jpeg', '.webp')):
                     flash('Invalid file type for photo.', 'danger')
                     return render_template('public/register.html')
 
-            # 2. Insert user data
+                # Stream to a temp file and make sure it actually parses as an image
+                photo_temp = photos.spool_upload(photo)
+                try:
+                    photos.validate_photo(photo_temp)
+                except photos.InvalidPhoto:
+                    flash('The uploaded photo could not be read as an image.', 'danger')
+                    return render_template('public/register.html')
+
+                # Resized copies are written under a fresh unique name by the photo workers
+                photo_stem = str(uuid.uuid4())
+
+            # 2. Insert user data; photo_path is set once the photo has been processed
             cursor.execute(
-                "INSERT INTO users (name, email, password_hash, address, phone_number, photo_path) VALUES (%s, %s, %s, %s, %s, %s)",
-                (name, email, password_hash, address, phone_number, photo_path)
+                "INSERT INTO users (name, email, password_hash, address, phone_number, photo_path) VALUES (%s, %s, %s, %s, %s, NULL)",
+                (name, email, password_hash, address, phone_number)
             )
             conn.commit()
+
+            # 3. Resize, re-encode and attach the photo off the request path
+            if photo_temp:
+                photos.submit(photo_temp, photo_stem, cursor.lastrowid)
+                photo_temp = None
+
             flash('Registration successful! Please log in.', 'success')
             return redirect(url_for('login'))
 
@@ -145,6 +256,8 @@ def register():
                 flash(f'An unexpected database error occurred: {err}', 'danger')
             return render_template('public/register.html')
         finally:
+            if photo_temp:
+                photos.discard(photo_temp)
             try:
                 cursor.close()
             except Exception:
@@ -154,6 +267,23 @@ def register():
     return render_template('public/register.html')
 
 
+def save_rehashed_password(table: str, row_id: int, new_hash: str):
+    """Stores a password re-hashed with the current method; failures only delay the upgrade."""
+    conn = get_db_connection()
+    if not conn:
+        return
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"UPDATE {table} SET password_hash = %s WHERE id = %s", (new_hash, row_id))
+        conn.commit()
+    except mysql.connector.Error as err:
+        conn.rollback()
+        app.logger.error(f"DB Error upgrading password hash for {table} {row_id}: {err}")
+    finally:
+        cursor.close()
+        conn.close()
+
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
@@ -175,7 +305,15 @@ def login():
             cursor.close()
             conn.close()
 
-        if user and check_password_hash(user['password_hash'], password):
+        try:
+            password_ok, new_hash = (password_hasher.verify(user['password_hash'], password or '')
+                                     if user else (False, None))
+        except HasherBusy:
+            flash('The server is busy, please try again in a moment.', 'warning')
+            return render_template('public/login.html'), 503, {'Retry-After': '2'}
+        if password_ok:
+            if new_hash:
+                save_rehashed_password('users', user['id'], new_hash)
             # Set session variables
             session['user_id'] = user['id']
             session['email'] = email
@@ -187,32 +325,81 @@ def login():
     return render_template('public/login.html')
 
 
+@app.route('/set_password/<token>', methods=['GET', 'POST'])
+def set_password(token):
+    """
+    Lets a rider imported without a password choose one, from the link in the
+    admin's invite export. The link expires after PASSWORD_INVITE_MAX_AGE and
+    stops working once a password has been set.
+    """
+    try:
+        user_id, fingerprint = csv_io.read_invite_token(token)
+    except BadSignature:
+        flash('This link is invalid or has expired. Please ask for a new one.', 'danger')
+        return redirect(url_for('login'))
+    if request.method == 'GET':
+        return render_template('public/set_password.html', token=token)
+
+    password = request.form.get('password')
+    if not password:
+        flash('Please choose a password.', 'danger')
+        return render_template('public/set_password.html', token=token)
+    try:
+        password_hash = password_hasher.hash(password)
+    except HasherBusy:
+        flash('The server is busy, please try again in a moment.', 'warning')
+        return render_template('public/set_password.html', token=token), 503, {'Retry-After': '2'}
+
+    conn = get_db_connection()
+    if not conn:
+        flash("Database connection failed. Please try later.", "danger")
+        return render_template('public/set_password.html', token=token)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT password_hash FROM users WHERE id = %s FOR UPDATE", (user_id,))
+        row = cursor.fetchone()
+        if row is None or not row[0].startswith(UNUSABLE_PREFIX) or password_fingerprint(row[0]) != fingerprint:
+            conn.rollback()
+            flash('This link has already been used. Please log in.', 'warning')
+            return redirect(url_for('login'))
+        cursor.execute("UPDATE users SET password_hash = %s WHERE id = %s", (password_hash, user_id))
+        conn.commit()
+    except mysql.connector.Error as err:
+        conn.rollback()
+        app.logger.error(f"DB Error setting password for user {user_id}: {err}")
+        flash('Could not set your password, please try again.', 'danger')
+        return render_template('public/set_password.html', token=token)
+    finally:
+        cursor.close()
+        conn.close()
+    flash('Password set. You can now log in.', 'success')
+    return redirect(url_for('login'))
+
+
 @app.route('/apply_pass', methods=['GET', 'POST'])
 def apply_pass():
     if not is_logged_in():
         flash('Please log in to apply for a pass.', 'warning')
         return redirect(url_for('login'))
 
-    # Hardcoded/Simulated Pass Amount
-    PASS_AMOUNT = 500.00
+    # Stops and fares come from the in-memory fare table, not the database
+    fare_table = fares.current()
+    form = dict(points=fare_table.active_stop_names, amount=fare_table.min_fare(), fares=fare_table.form_data())
 
-    conn = get_db_connection()
+    # Viewing the form only reads; submitting re-checks and inserts on the primary
+    conn = get_db_connection(readonly=request.method == 'GET')
     if not conn:
         flash("Database connection failed. Please try later.", "danger")
-        return render_template('public/apply_pass.html', points=BANGALORE_POINTS, amount=PASS_AMOUNT, latest_app=None)
+        return render_template('public/apply_pass.html', latest_app=None, **form)
 
     cursor = conn.cursor(dictionary=True)
 
     # Fetch latest application status
     try:
-        cursor.execute(
-            "SELECT id, status, payment_status, start_point, end_point FROM applications WHERE user_id = %s ORDER BY application_date DESC LIMIT 1",
-            (session['user_id'],)
-        )
-        latest_application = cursor.fetchone()
+        latest_app = latest_application(cursor, session['user_id'])
     except Exception as e:
         app.logger.error(f"Error fetching latest application: {e}")
-        latest_application = None
+        latest_app = None
 
     if request.method == 'POST':
         start_point = request.form.get('start_point')
@@ -220,19 +407,21 @@ def apply_pass():
 
         # Save application and redirect to payment
         try:
-            # Re-check pending payment using latest_application
-            if latest_application and latest_application.get('payment_status') == 'PENDING' and latest_application.get('status') != 'REJECTED':
+            # Re-check pending payment using latest_app
+            if awaiting_payment(latest_app):
                 flash('You have a pending application awaiting payment. Please complete the previous payment.', 'warning')
                 cursor.close()
                 conn.close()
-                return redirect(url_for('payment', app_id=latest_application['id']))
+                return redirect(url_for('payment', app_id=latest_app['id']))
 
-            cursor.execute(
-                "INSERT INTO applications (user_id, start_point, end_point, amount, status, payment_status, application_date) VALUES (%s, %s, %s, %s, %s, %s, NOW())",
-                (session['user_id'], start_point, end_point, PASS_AMOUNT, 'PENDING', 'PENDING')
-            )
-            conn.commit()
-            application_id = cursor.lastrowid
+            amount = fare_table.fare(start_point, end_point)
+            if amount is None:
+                flash('No pass is sold between the selected stops. Please choose another route.', 'warning')
+                cursor.close()
+                conn.close()
+                return render_template('public/apply_pass.html', latest_app=latest_app, **form)
+
+            application_id = create_application(conn, cursor, session['user_id'], start_point, end_point, amount)
 
             flash('Application submitted! Proceed to payment.', 'info')
             return redirect(url_for('payment', app_id=application_id))
@@ -247,9 +436,8 @@ def apply_pass():
     conn.close()
     return render_template(
         'public/apply_pass.html',
-        points=BANGALORE_POINTS,
-        amount=PASS_AMOUNT,
-        latest_app=latest_application
+        latest_app=latest_app,
+        **form
     )
 
 
@@ -258,7 +446,7 @@ def payment(app_id):
     if not is_logged_in():
         return redirect(url_for('login'))
 
-    conn = get_db_connection()
+    conn = get_db_connection(readonly=request.method == 'GET')
     if not conn:
         flash("Database connection failed. Please try later.", "danger")
         return redirect(url_for('apply_pass'))
@@ -284,29 +472,24 @@ def payment(app_id):
 
     if request.method == 'POST':
         # --- PAYMENT GATEWAY SIMULATION ---
+        # Goes through the same idempotent path as gateway notifications (see
+        # applications.pay_application), so a double submit is answered as a duplicate
         conn2 = get_db_connection()
         if not conn2:
             flash("Database connection failed. Please try later.", "danger")
             return redirect(url_for('apply_pass'))
 
         try:
-            cursor_update = conn2.cursor()
-            cursor_update.execute(
-                "UPDATE applications SET payment_status = 'COMPLETED', status = 'PENDING' WHERE id = %s",
-                (app_id,)
-            )
-            conn2.commit()
+            result = pay_application(conn2, application)
+            if result['outcome'] == 'rejected':
+                flash(f"Payment could not be applied: {result['detail']}.", 'danger')
+                return redirect(url_for('apply_pass'))
             flash('Payment successful! Your application is now pending admin review.', 'success')
-            cursor_update.close()
             return redirect(url_for('digital_pass'))  # Redirect to check status
         except Exception as e:
             flash(f"Payment update error: {e}", 'danger')
             app.logger.error(f"Payment Update Error: {e}")
         finally:
-            try:
-                cursor_update.close()
-            except Exception:
-                pass
             conn2.close()
 
     return render_template('public/payment.html', application=application)
@@ -317,39 +500,14 @@ def digital_pass():
     if not is_logged_in():
         return redirect(url_for('login'))
 
-    conn = get_db_connection()
-    if not conn:
+    try:
+        pass_row = cached_pass_row(session['user_id'])
+    except DatabaseUnavailable:
         flash("Database connection failed. Please try later.", "danger")
         return render_template('public/digital_pass.html', pass_data=None)
 
-    cursor = conn.cursor(dictionary=True)
-
-    try:
-        # Fetch approved pass details (most recent approved pass)
-        cursor.execute("""
-                       SELECT a.*,
-                              u.name,
-                              u.phone_number,
-                              u.photo_path
-                       FROM applications a
-                                JOIN users u ON a.user_id = u.id
-                       WHERE a.user_id = %s
-                         AND a.status = 'APPROVED'
-                       ORDER BY a.application_date DESC LIMIT 1
-                       """, (session['user_id'],))
-
-        approved_pass = cursor.fetchone()
-
-        # Fetch latest overall application status for context
-        cursor.execute(
-            "SELECT status, payment_status FROM applications WHERE user_id = %s ORDER BY application_date DESC LIMIT 1",
-            (session['user_id'],)
-        )
-        latest_status = cursor.fetchone()
-    finally:
-        cursor.close()
-        conn.close()
-
+    approved_pass = pass_row if pass_row.get('status') == 'APPROVED' else None
+    latest_status = pass_row or None
     if not approved_pass:
         if latest_status:
             flash(
@@ -362,6 +520,188 @@ def digital_pass():
     return render_template('public/digital_pass.html', pass_data=approved_pass)
 
 
+@app.route('/auto_renew', methods=['POST'])
+def set_auto_renew():
+    """Opts the rider in or out of renewal applications created before their pass ends."""
+    if not is_logged_in():
+        return redirect(url_for('login'))
+
+    enabled = request.form.get('enabled') == '1'
+    db = get_db_connection()
+    if not db:
+        flash("Database connection failed. Please try later.", "danger")
+        return redirect(url_for('digital_pass'))
+    cursor = db.cursor()
+    try:
+        cursor.execute("UPDATE users SET auto_renew = %s WHERE id = %s", (enabled, session['user_id']))
+        db.commit()
+        pass_cache.invalidate(session['user_id'])
+        audit_log.record('auto_renew_changed', None, session['user_id'], 'rider', {'enabled': enabled})
+        flash('Automatic renewal turned on. We will create your renewal application a few days before '
+              'your pass ends.' if enabled else 'Automatic renewal turned off.', 'success')
+    except mysql.connector.Error as err:
+        db.rollback()
+        app.logger.error(f"DB Error updating auto-renew: {err}")
+        flash('Could not update automatic renewal. Please try later.', 'danger')
+    finally:
+        cursor.close()
+        db.close()
+    return redirect(url_for('digital_pass'))
+
+
+@app.route('/pass/<string:pass_number>/qr.<any(png, svg):fmt>')
+def pass_qr(pass_number, fmt):
+    """
+    Renders an approved pass's QR code on request, as PNG or SVG. Encoded images
+    are kept in a bounded in-memory LRU cache and carry a strong ETag, so a phone
+    re-opening its pass gets a 304 without any rendering.
+    """
+    if not (is_logged_in() or is_admin_logged_in()):
+        abort(404)
+
+    db = get_db_connection()
+    if not db:
+        abort(503)
+    cursor = db.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            """
+            SELECT user_id, pass_number, start_point, end_point, application_date, valid_from, valid_until
+            FROM applications
+            WHERE pass_number = %s AND status = 'APPROVED'
+            """,
+            (pass_number,)
+        )
+        pass_row = cursor.fetchone()
+    finally:
+        cursor.close()
+        db.close()
+
+    # Riders may only fetch their own pass; admins may fetch any
+    if not pass_row or (not is_admin_logged_in() and pass_row['user_id'] != session.get('user_id')):
+        abort(404)
+
+    qr_data = make_qr_data(pass_number, pass_row)
+    etag = qr_etag(qr_data, fmt)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(qr_image_cache.get_or_render(qr_data, fmt), mimetype=QR_MIMETYPES[fmt])
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = QR_IMAGE_MAX_AGE
+    return response
+
+
+@app.route('/verify', methods=['POST'])
+def verify_passes():
+    """
+    Conductor validation API. Accepts {"token": "..."} for a single scan or
+    {"scans": [...]} with up to VERIFY_MAX_BATCH scans, each a token string or
+    {"token": ..., "scanned_at": <unix seconds>}. Tokens are checked purely by
+    signature and validity window, with no database round-trip.
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'Expected a JSON object.'}), 400
+
+    if 'scans' in payload:
+        scans = payload['scans']
+        if not isinstance(scans, list):
+            return jsonify({'error': '"scans" must be a list.'}), 400
+        if len(scans) > VERIFY_MAX_BATCH:
+            return jsonify({'error': f'At most {VERIFY_MAX_BATCH} scans per request.'}), 413
+        results = pass_verifier.verify_many(scans)
+        valid = sum(1 for result in results if result['valid'])
+        return jsonify({'results': results, 'valid': valid, 'invalid': len(results) - valid})
+
+    return jsonify(pass_verifier.verify(payload.get('token')))
+
+
+@app.route('/payments/notify', methods=['POST'])
+def payments_notify():
+    """
+    Payment gateway callback taking a batch of events:
+    {"events": [{"idempotency_key", "application_id", "status": "succeeded"|"failed",
+    "amount", "gateway_ref"}, ...]}, signed with an HMAC-SHA256 of the raw body in
+    the X-Payment-Signature header. Returns one result per event; replays are
+    reported as duplicates with their original outcome.
+    """
+    body = request.get_data(cache=True)
+    if not payments.signature_valid(body, request.headers.get(payments.SIGNATURE_HEADER, '')):
+        return jsonify({'error': 'Invalid signature.'}), 401
+
+    payload = request.get_json(silent=True)
+    raw_events = payload.get('events') if isinstance(payload, dict) else None
+    if not isinstance(raw_events, list) or not raw_events:
+        return jsonify({'error': '"events" must be a non-empty list.'}), 400
+    if len(raw_events) > PAYMENT_NOTIFY_MAX_BATCH:
+        return jsonify({'error': f'At most {PAYMENT_NOTIFY_MAX_BATCH} events per request.'}), 413
+
+    events, errors = [], []
+    for index, raw in enumerate(raw_events):
+        try:
+            events.append(payments.parse_event(raw))
+        except payments.InvalidEvent as err:
+            errors.append({'index': index, 'error': str(err)})
+    if errors:
+        # Nothing is applied, so the gateway can fix and resend the whole batch
+        return jsonify({'error': 'Invalid events.', 'events': errors}), 400
+
+    db = get_db_connection()
+    if not db:
+        return jsonify({'error': 'Database connection failed. Please try later.'}), 503
+    try:
+        results = payments.apply_events(db, events)
+    except mysql.connector.Error as err:
+        app.logger.error(f"DB Error applying payment notifications: {err}")
+        return jsonify({'error': 'Could not apply events; retry the batch.'}), 503
+    finally:
+        db.close()
+
+    summary = {'results': results}
+    for outcome in ('applied', 'ignored', 'rejected'):
+        summary[outcome] = sum(1 for r in results if r['outcome'] == outcome and not r['duplicate'])
+    summary['duplicates'] = sum(1 for r in results if r['duplicate'])
+    return jsonify(summary)
+
+
+@app.route('/validation/snapshot')
+def validation_snapshot_export():
+    """
+    Active-pass snapshot for offline validators (format in validation_snapshot.py).
+    With ?since=<version> only the changes after that version are sent, unless the
+    device is too far behind, in which case it gets a full snapshot; the blob's
+    kind byte and the X-Snapshot-Kind header say which. Only served to validator
+    devices (see validation_snapshot.client_allowed).
+    """
+    if not validation_snapshot.client_allowed(request.remote_addr, request.headers.get('Authorization')):
+        return Response('Validator device key required.', 401, {'WWW-Authenticate': 'Bearer'})
+    since = request.args.get('since', type=int)
+
+    db = get_db_connection()
+    if not db:
+        abort(503)
+    try:
+        result = validation_snapshot.delta_since(db, since) if since is not None else None
+        kind = 'delta'
+        if result is None:
+            kind = 'full'
+            result = validation_snapshot.full_snapshot(db)
+    except mysql.connector.Error as err:
+        app.logger.error(f"DB Error building validation snapshot: {err}")
+        abort(500)
+    finally:
+        db.close()
+
+    version, blob = result
+    response = Response(blob, mimetype='application/octet-stream')
+    response.headers['X-Snapshot-Version'] = str(version)
+    response.headers['X-Snapshot-Kind'] = kind
+    response.set_etag(f"{kind}-{since}-{version}" if kind == 'delta' else f"full-{version}")
+    return response.make_conditional(request)
+
+
 @app.route('/logout')
 def logout():
     session.clear()
@@ -389,10 +729,17 @@ def admin_login():
             cursor.close()
             conn.close()
 
-        # Security Note: In a real system, use check_password_hash here.
-        # Since the SQL blueprint didn't use hashing for the default admin,
-        # we check the plain password stored in the database for simplicity of setup.
-        if admin and admin.get('password_hash') == password:
+        # The default admin from bus_pass_db.sql is stored in plain text; it is
+        # replaced with a proper hash on the first successful login
+        try:
+            password_ok, new_hash = (password_hasher.verify(admin['password_hash'], password or '')
+                                     if admin else (False, None))
+        except HasherBusy:
+            flash('The server is busy, please try again in a moment.', 'warning')
+            return render_template('admin/admin_login.html'), 503, {'Retry-After': '2'}
+        if password_ok:
+            if new_hash:
+                save_rehashed_password('admin_users', admin['id'], new_hash)
             session['admin_id'] = admin['id']
             session['admin_username'] = username
             flash('Admin login successful!', 'success')
@@ -408,20 +755,19 @@ def admin_dashboard():
     if not is_admin_logged_in():
         return redirect(url_for('admin_login'))
 
-    db = get_db_connection()
+    db = get_db_connection(readonly=True)
     if not db:
         flash("Database connection failed. Please try later.", "danger")
-        return render_template('admin/dashboard.html', pending_count=0)
+        return render_template('admin/dashboard.html', pending_count=0, counts={}, top_routes=[], daily=[])
 
     cursor = db.cursor()
-    pending_count = 0
+    counts, daily = {}, []
     try:
-        # Count applications that have paid but are awaiting review
-        cursor.execute("SELECT COUNT(id) FROM applications WHERE payment_status = 'COMPLETED' AND status = 'PENDING'")
-        row = cursor.fetchone()
-        pending_count = row[0] if row else 0
+        # Materialized counters (see counters.py) instead of scanning applications
+        counts = counters.read_counters(cursor)
+        daily = counters.read_daily(cursor)
     except mysql.connector.Error as err:
-        app.logger.error(f"DB Error fetching pending count: {err}")
+        app.logger.error(f"DB Error fetching dashboard counters: {err}")
     finally:
         try:
             cursor.close()
@@ -429,7 +775,80 @@ def admin_dashboard():
             pass
         db.close()
 
-    return render_template('admin/dashboard.html', pending_count=pending_count)
+    top_routes = sorted(
+        ((name[len('route:'):].replace('>', ' → '), value)
+         for name, value in counts.items() if name.startswith('route:') and value),
+        key=lambda item: item[1], reverse=True
+    )[:10]
+    return render_template(
+        'admin/dashboard.html',
+        pending_count=counts.get('review:PENDING', 0),
+        counts=counts,
+        top_routes=top_routes,
+        daily=daily,
+    )
+
+
+def encode_page_cursor(row) -> str:
+    """Opaque keyset cursor pointing just past `row` in (application_date, id) order."""
+    raw = f"{row['application_date'].isoformat()}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_page_cursor(cursor: str):
+    """Inverse of encode_page_cursor(); returns (application_date, id) or None if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        date_part, id_part = raw.split('|', 1)
+        return datetime.datetime.fromisoformat(date_part), int(id_part)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def parse_date_filter(value):
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d') if value else None
+    except ValueError:
+        return None
+
+
+def read_application_filters(args) -> dict:
+    """Admin list/bulk filters from a request's args or form; empty values mean "any"."""
+    return {key: args.get(key, '')
+            for key in ('status', 'payment_status', 'start_point', 'end_point', 'date_from', 'date_to')}
+
+
+def application_filter_clauses(filters: dict, paid_only=True):
+    """
+    Builds WHERE clauses and parameters for the admin filters. Only paid
+    applications are ever listed or bulk-processed; exports (`paid_only=False`)
+    honour the payment_status filter instead.
+    """
+    where = []
+    params = []
+    if paid_only:
+        where.append("a.payment_status = 'COMPLETED'")
+    elif filters.get('payment_status') in ('PENDING', 'COMPLETED', 'FAILED'):
+        where.append("a.payment_status = %s")
+        params.append(filters['payment_status'])
+    if filters['status'] in ('PENDING', 'APPROVED', 'REJECTED', 'EXPIRED'):
+        where.append("a.status = %s")
+        params.append(filters['status'])
+    if filters['start_point']:
+        where.append("a.start_point = %s")
+        params.append(filters['start_point'])
+    if filters['end_point']:
+        where.append("a.end_point = %s")
+        params.append(filters['end_point'])
+    date_from = parse_date_filter(filters['date_from'])
+    if date_from:
+        where.append("a.application_date >= %s")
+        params.append(date_from)
+    date_to = parse_date_filter(filters['date_to'])
+    if date_to:
+        where.append("a.application_date < %s")
+        params.append(date_to + datetime.timedelta(days=1))
+    return where, params
 
 
 @app.route('/admin/applications')
@@ -437,26 +856,45 @@ def admin_applications():
     if not is_admin_logged_in():
         return redirect(url_for('admin_login'))
 
-    db = get_db_connection()
+    filters = read_application_filters(request.args)
+    after = decode_page_cursor(request.args['after']) if request.args.get('after') else None
+
+    page = dict(applications=[], filters=filters, points=fares.current().stop_names, next_cursor=None,
+                is_first_page=after is None, query={k: v for k, v in filters.items() if v})
+
+    db = get_db_connection(readonly=True)
     if not db:
         flash("Database connection failed. Please try later.", "danger")
-        return render_template('admin/applications.html', applications=[])
+        return render_template('admin/applications.html', **page)
 
-    cursor = db.cursor(dictionary=True)
-    applications = []
+    # Keyset pagination on (application_date, id) keeps every page an index range
+    # scan regardless of how deep the admin pages.
+    where, params = application_filter_clauses(filters)
+    if after:
+        where.append("(a.application_date > %s OR (a.application_date = %s AND a.id > %s))")
+        params.extend([after[0], after[0], after[1]])
 
+    cursor = db.cursor(dictionary=True)
     try:
-        # Fetch all applications that have been paid (COMPLETED)
+        # Fetch one extra row to know whether a next page exists
         cursor.execute(
-            """
-            SELECT a.*, u.name, u.email, u.phone_number
+            f"""
+            SELECT a.id, a.start_point, a.end_point, a.amount, a.application_date,
+                   a.status, a.payment_status, a.pass_number,
+                   u.name, u.email, u.phone_number, u.photo_path
             FROM applications a
             JOIN users u ON a.user_id = u.id
-            WHERE a.payment_status = 'COMPLETED'
-            ORDER BY a.application_date ASC
-            """
+            WHERE {' AND '.join(where)}
+            ORDER BY a.application_date ASC, a.id ASC
+            LIMIT %s
+            """,
+            (*params, ADMIN_PAGE_SIZE + 1)
         )
-        applications = cursor.fetchall()
+        rows = cursor.fetchall()
+        if len(rows) > ADMIN_PAGE_SIZE:
+            rows = rows[:ADMIN_PAGE_SIZE]
+            page['next_cursor'] = encode_page_cursor(rows[-1])
+        page['applications'] = rows
     except mysql.connector.Error as err:
         flash(f'Database Error fetching applications: {getattr(err, "msg", err)}', 'danger')
         app.logger.error(f"DB Error fetching applications: {err}")
@@ -467,7 +905,224 @@ def admin_applications():
             pass
         db.close()
 
-    return render_template('admin/applications.html', applications=applications)
+    return render_template('admin/applications.html', **page)
+
+
+@app.route('/admin/applications/export.csv')
+def admin_export_applications():
+    """
+    Streams every application matching the list filters (any payment status
+    unless `payment_status` is given) as CSV, in constant memory.
+    """
+    if not is_admin_logged_in():
+        return redirect(url_for('admin_login'))
+
+    filters = read_application_filters(request.args)
+    db = get_db_connection(readonly=True)
+    if not db:
+        flash("Database connection failed. Please try later.", "danger")
+        return redirect(url_for('admin_applications'))
+
+    where, params = application_filter_clauses(filters, paid_only=False)
+    chunks = csv_io.stream_applications_csv(db, where, params)
+    try:
+        # Run the query now, so a failure is reported instead of truncating the download
+        first = next(chunks)
+    except mysql.connector.Error as err:
+        app.logger.error(f"DB Error exporting applications: {err}")
+        flash(f'Export failed: {getattr(err, "msg", err)}', 'danger')
+        return redirect(url_for('admin_applications'))
+
+    def generate():
+        yield first
+        yield from chunks
+
+    filename = f"applications-{datetime.date.today():%Y%m%d}.csv"
+    return Response(stream_with_context(generate()), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
+@app.route('/admin/users/import', methods=['GET', 'POST'])
+def admin_import_users():
+    """
+    Bulk-registers riders from an uploaded CSV (name, email, phone_number,
+    optional address). Files with passwords, or larger than
+    CSV_IMPORT_MAX_UPLOAD_BYTES, go through `flask csv import-users` instead, as
+    hashing is too slow to run in a request. Imported riders set their password
+    from the links in admin_export_invites.
+    """
+    if not is_admin_logged_in():
+        return redirect(url_for('admin_login'))
+    if request.method == 'GET':
+        return render_template('admin/import_users.html', report=None)
+
+    upload = request.files.get('file')
+    if not upload or upload.filename == '':
+        if wants_json():
+            return jsonify({'error': 'No CSV file uploaded.'}), 400
+        flash('Please choose a CSV file.', 'danger')
+        return render_template('admin/import_users.html', report=None), 400
+
+    db = get_db_connection()
+    if not db:
+        if wants_json():
+            return jsonify({'error': 'Database connection failed. Please try later.'}), 503
+        flash("Database connection failed. Please try later.", "danger")
+        return render_template('admin/import_users.html', report=None), 503
+
+    try:
+        text = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        report = csv_io.import_users(db, text).as_dict()
+    except UnicodeDecodeError:
+        report = None
+        flash('The file is not UTF-8 encoded CSV.', 'danger')
+    except mysql.connector.Error as err:
+        db.rollback()
+        report = None
+        app.logger.error(f"DB Error importing users: {err}")
+        flash(f'Import stopped by a database error: {getattr(err, "msg", err)}', 'danger')
+    finally:
+        db.close()
+
+    if wants_json():
+        return (jsonify(report), 200) if report else (jsonify({'error': 'Import failed.'}), 500)
+    if report:
+        flash(f"Imported {report['inserted']} of {report['rows']} rows ({report['failed']} rejected).",
+              'success' if not report['failed'] else 'warning')
+    return render_template('admin/import_users.html', report=report)
+
+
+@app.route('/admin/users/invites.csv')
+def admin_export_invites():
+    """
+    Streams the email, name and set-password link of every rider who has no
+    password yet (imported without one), for the admin to send out.
+    """
+    if not is_admin_logged_in():
+        return redirect(url_for('admin_login'))
+
+    db = get_db_connection()
+    if not db:
+        flash("Database connection failed. Please try later.", "danger")
+        return redirect(url_for('admin_import_users'))
+
+    chunks = csv_io.stream_invites_csv(db, lambda token: url_for('set_password', token=token, _external=True))
+    try:
+        # Run the query now, so a failure is reported instead of truncating the download
+        first = next(chunks)
+    except mysql.connector.Error as err:
+        app.logger.error(f"DB Error exporting invites: {err}")
+        flash(f'Export failed: {getattr(err, "msg", err)}', 'danger')
+        return redirect(url_for('admin_import_users'))
+
+    def generate():
+        yield first
+        yield from chunks
+
+    filename = f"rider-invites-{datetime.date.today():%Y%m%d}.csv"
+    return Response(stream_with_context(generate()), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
+def parse_fare_amount(raw: str, label: str):
+    try:
+        amount = Decimal(raw)
+    except InvalidOperation:
+        raise ValueError(f"Fare for {label} is not a number.")
+    if not amount.is_finite() or amount <= 0 or amount >= Decimal('100000000'):
+        raise ValueError(f"Fare for {label} must be between 0 and 99999999.99.")
+    return amount.quantize(Decimal('0.01'))
+
+
+def parse_fare_edit(form, fare_table):
+    """
+    Validates one /admin/fares form ('fares', 'stop' or 'route'). Returns a
+    function applying the edit to a cursor; raises ValueError with a message for
+    the admin.
+    """
+    action = form.get('action')
+    active = form.get('active') == 'on'
+    if action == 'fares':
+        changes = {}
+        for a in fare_table.zones:
+            for b in fare_table.zones:
+                if a <= b:
+                    raw = form.get(f'fare-{a}-{b}', '').strip()
+                    changes[(a, b)] = parse_fare_amount(raw, f"zones {a}-{b}") if raw else None
+        return lambda cursor: fares.save_zone_fares(cursor, changes)
+
+    if action == 'stop':
+        name = form.get('name', '').strip()
+        # Commas separate a route's stops in the form; '|' separates fields in pass tokens
+        if not name or len(name) > 100 or ',' in name or '|' in name:
+            raise ValueError("Stop name must be 1-100 characters, without commas or '|'.")
+        try:
+            zone = int(form.get('zone', ''))
+        except ValueError:
+            zone = 0
+        if not 1 <= zone <= 255:
+            raise ValueError("Zone must be a number from 1 to 255.")
+        return lambda cursor: fares.save_stop(cursor, name, zone, active)
+
+    if action == 'route':
+        code = form.get('code', '').strip()
+        name = form.get('name', '').strip()
+        if not code or len(code) > 20 or not name or len(name) > 100:
+            raise ValueError("Route code (1-20 characters) and name (1-100 characters) are required.")
+        stop_names = [stop.strip() for stop in form.get('stops', '').split(',') if stop.strip()]
+        unknown = [stop for stop in stop_names if stop not in fare_table.index]
+        if unknown:
+            raise ValueError(f"Unknown stop(s): {', '.join(unknown)}.")
+        if len(set(stop_names)) != len(stop_names):
+            raise ValueError("A route cannot list the same stop twice.")
+        stop_ids = [fare_table.stops[fare_table.index[stop]].id for stop in stop_names]
+        return lambda cursor: fares.save_route(cursor, code, name, active, stop_ids)
+
+    raise ValueError("Unknown action.")
+
+
+@app.route('/admin/fares', methods=['GET', 'POST'])
+def admin_fares():
+    """
+    Stops, routes and the zone fare matrix. Each save bumps fare_config.version:
+    this process reloads its fare table at once, other processes within
+    FARES_REFRESH_SECONDS. Passes already applied for keep their amount.
+    """
+    if not is_admin_logged_in():
+        return redirect(url_for('admin_login'))
+
+    fare_table = fares.current()
+    if request.method == 'GET':
+        return render_template('admin/fares.html', table=fare_table)
+
+    if fare_table.version is None:
+        flash("Fare tables are not set up yet; run `flask db upgrade` first.", "danger")
+        return redirect(url_for('admin_fares'))
+    try:
+        apply_edit = parse_fare_edit(request.form, fare_table)
+    except ValueError as err:
+        flash(str(err), 'danger')
+        return redirect(url_for('admin_fares'))
+
+    db = get_db_connection()
+    if not db:
+        flash("Database connection failed. Please try later.", "danger")
+        return redirect(url_for('admin_fares'))
+
+    cursor = db.cursor()
+    try:
+        apply_edit(cursor)
+        db.commit()
+        fares.store.reload()
+        flash("Saved. New applications use the updated fares.", "success")
+    except mysql.connector.Error as err:
+        db.rollback()
+        app.logger.error(f"DB Error saving fares: {err}")
+        flash(f"Could not save: {getattr(err, 'msg', err)}", "danger")
+    finally:
+        cursor.close()
+        db.close()
+    return redirect(url_for('admin_fares'))
 
 
 @app.route('/admin/process_pass/<int:app_id>/<string:action>')
@@ -501,10 +1156,26 @@ def process_pass(app_id, action):
         if action == 'reject':
             try:
                 cursor.execute(
-                    "UPDATE applications SET status = %s, pass_number = NULL, qr_code_path = NULL WHERE id = %s",
+                    "UPDATE applications SET status = %s, pass_number = NULL, qr_code_path = NULL "
+                    "WHERE id = %s AND status <> 'REJECTED'",
                     ('REJECTED', app_id)
                 )
+                rejected = cursor.rowcount == 1
+                if rejected:
+                    counters.on_review(cursor, [app_data], 'REJECTED')
+                    if app_data.get('status') == 'APPROVED' and app_data.get('pass_number'):
+                        # Revoking an issued pass: offline validators must drop it
+                        validation_snapshot.record_pass_changes(cursor, [
+                            (app_data['pass_number'], 'REMOVE', None, None, None)
+                        ])
                 db.commit()
+                pass_cache.invalidate(app_data['user_id'])
+                if rejected:
+                    # The row loses its pass number and QR path; the log keeps them
+                    audit_log.record('rejected', app_id, app_data['user_id'], admin_actor(), {
+                        'from_status': app_data['status'], 'pass_number': app_data.get('pass_number'),
+                        'qr_code_path': app_data.get('qr_code_path'),
+                    })
                 flash(f'Application {app_id} has been REJECTED.', 'warning')
             except mysql.connector.Error as err:
                 db.rollback()
@@ -514,24 +1185,39 @@ def process_pass(app_id, action):
 
         if action == 'approve':
             try:
-                # 1. Generate Pass Number
-                pass_number = f"BP-{app_id}-{datetime.datetime.now().strftime('%Y%m%d')}"
-
-                # Fallback if start/end not present
-                start_point = app_data.get('start_point', 'NA')
-                end_point = app_data.get('end_point', 'NA')
+                # 1. Generate Pass Number and fix its validity window
+                pass_number = make_pass_number(app_id)
+                app_data['valid_from'], app_data['valid_until'] = validity_window(app_data)
 
-                # 2. Data for QR Code
-                qr_data = f"PASS_NO:{pass_number}|USER:{app_data.get('user_name')}|ROUTE:{start_point}-{end_point}|STATUS:APPROVED"
-                qr_filename = f"{pass_number}.png"
-                qr_code_db_path = generate_qr_code(qr_data, qr_filename).replace('\\', '/')
-
-                # 3. Update Application in DB to APPROVED
+                # 2. Update Application in DB to APPROVED; the QR image itself is
+                #    rendered on demand by pass_qr()
                 cursor.execute(
-                    "UPDATE applications SET status = %s, pass_number = %s, qr_code_path = %s WHERE id = %s",
-                    ('APPROVED', pass_number, qr_code_db_path, app_id)
+                    "UPDATE applications SET status = %s, pass_number = %s, qr_code_path = NULL, "
+                    "valid_from = %s, valid_until = %s "
+                    "WHERE id = %s AND status NOT IN ('APPROVED', 'EXPIRED')",
+                    ('APPROVED', pass_number, app_data['valid_from'], app_data['valid_until'], app_id)
                 )
+                if cursor.rowcount != 1:
+                    db.rollback()
+                    flash(f'Application ID {app_id} is already approved (or its pass has expired).', 'info')
+                    return redirect(url_for('admin_applications'))
+                counters.on_review(cursor, [app_data], 'APPROVED')
+
+                # 3. Optionally queue a PNG file render in the same transaction
+                if QR_STORE_FILES:
+                    qr_jobs.enqueue(cursor, [(pass_number, app_id, make_qr_data(pass_number, app_data))])
+
+                # 4. Publish the pass to offline validators; last, as it holds the
+                #    change log sequence lock until commit
+                validation_snapshot.record_pass_changes(cursor, [
+                    pass_change_added(pass_number, app_data)
+                ])
                 db.commit()
+                pass_cache.invalidate(app_data['user_id'])
+                audit_log.record('approved', app_id, app_data['user_id'], admin_actor(), {
+                    'from_status': app_data['status'], 'pass_number': pass_number,
+                    'valid_from': app_data['valid_from'], 'valid_until': app_data['valid_until'],
+                })
                 flash(f'Pass for Application ID {app_id} approved, pass number {pass_number} generated.', 'success')
             except mysql.connector.Error as err:
                 db.rollback()
@@ -541,8 +1227,7 @@ def process_pass(app_id, action):
                 db.rollback()
                 flash(f'Unexpected error during approval: {e}', 'danger')
                 app.logger.error(f"Unexpected error during pass approval: {e}")
-            finally:
-                return redirect(url_for('admin_applications'))
+            return redirect(url_for('admin_applications'))
 
         flash('Invalid action.', 'danger')
         return redirect(url_for('admin_applications'))
@@ -555,13 +1240,275 @@ def process_pass(app_id, action):
         db.close()
 
 
+@app.route('/admin/process_pass/bulk', methods=['POST'])
+def process_pass_bulk():
+    """
+    Approves or rejects many paid, pending applications in one transaction.
+
+    Targets either explicit `app_ids` or every application matching the admin
+    list filters (`use_filter=1`, or a JSON `filter` object), capped at
+    BULK_ACTION_MAX. Returns a per-application result summary (JSON for API
+    callers, flashed otherwise). The batch commits or rolls back as a whole, so
+    each application is either done, skipped or not found.
+    """
+    if not is_admin_logged_in():
+        return redirect(url_for('admin_login'))
+
+    payload = request.get_json(silent=True) or {}
+    invalid = None
+    if not request.is_json:
+        action = request.form.get('action')
+        app_ids = request.form.getlist('app_ids')
+        filters = read_application_filters(request.form) if request.form.get('use_filter') else None
+    elif not isinstance(payload, dict):
+        action, app_ids, filters = None, [], None
+        invalid = 'Request body must be a JSON object.'
+    else:
+        action = payload.get('action')
+        app_ids = payload.get('app_ids') or []
+        filters = payload.get('filter')
+        if filters is not None:
+            if isinstance(filters, dict) and all(isinstance(value, str) for value in filters.values()):
+                filters = read_application_filters(filters)
+            else:
+                filters = None
+                invalid = 'filter must be an object of string values.'
+
+    def respond(summary, status=200):
+        if wants_json():
+            return jsonify(summary), status
+        if 'error' in summary:
+            flash(summary['error'], 'danger')
+        else:
+            flash(
+                f"Bulk {action}: {summary['succeeded']} done, {summary['skipped']} skipped "
+                f"({summary['approvals_per_second']:.1f} approvals/s).",
+                'success' if not summary['skipped'] else 'warning'
+            )
+        return redirect(url_for('admin_applications'))
+
+    if invalid:
+        return respond({'error': invalid}, 400)
+    if action not in ('approve', 'reject'):
+        return respond({'error': 'Invalid action.'}, 400)
+    if filters is not None:
+        # A filter selects the targets itself; explicit IDs are ignored
+        app_ids = []
+    try:
+        app_ids = list(dict.fromkeys(int(i) for i in app_ids))
+    except (TypeError, ValueError):
+        return respond({'error': 'Application IDs must be integers.'}, 400)
+    if not app_ids and filters is None:
+        return respond({'error': 'No applications selected.'}, 400)
+    if len(app_ids) > BULK_ACTION_MAX:
+        return respond({'error': f'At most {BULK_ACTION_MAX} applications per bulk action.'}, 400)
+
+    db = get_db_connection()
+    if not db:
+        return respond({'error': 'Database connection failed. Please try later.'}, 503)
+
+    started = time.perf_counter()
+    results = {}
+    cursor = db.cursor(dictionary=True)
+    try:
+        if not app_ids:
+            # Resolve the filter to the paid applications still awaiting review
+            where, params = application_filter_clauses(dict(filters, status='PENDING'))
+            cursor.execute(
+                f"SELECT a.id FROM applications a WHERE {' AND '.join(where)} "
+                f"ORDER BY a.application_date ASC, a.id ASC LIMIT %s",
+                (*params, BULK_ACTION_MAX)
+            )
+            app_ids = [row['id'] for row in cursor.fetchall()]
+
+        if app_ids:
+            # autocommit is off, so the row locks below are held until commit()
+            placeholders = ', '.join(['%s'] * len(app_ids))
+            cursor.execute(
+                f"""
+                SELECT id, user_id, status, payment_status, start_point, end_point, application_date,
+                       valid_from, valid_until
+                FROM applications
+                WHERE id IN ({placeholders})
+                FOR UPDATE
+                """,
+                app_ids
+            )
+            rows = {row['id']: row for row in cursor.fetchall()}
+
+            eligible = []
+            for app_id in app_ids:
+                row = rows.get(app_id)
+                if row is None:
+                    results[app_id] = {'id': app_id, 'result': 'not_found'}
+                elif row['payment_status'] != 'COMPLETED' or row['status'] != 'PENDING':
+                    results[app_id] = {'id': app_id, 'result': 'skipped',
+                                       'reason': f"status {row['status']}, payment {row['payment_status']}"}
+                else:
+                    eligible.append(row)
+
+            if action == 'reject':
+                updates = [('REJECTED', row['id']) for row in eligible]
+                cursor.executemany(
+                    "UPDATE applications SET status = %s, pass_number = NULL, qr_code_path = NULL "
+                    "WHERE id = %s AND status = 'PENDING'",
+                    updates
+                )
+                for row in eligible:
+                    results[row['id']] = {'id': row['id'], 'result': 'rejected'}
+                if eligible:
+                    counters.on_review(cursor, eligible, 'REJECTED')
+            else:
+                updates, jobs = [], []
+                for row in eligible:
+                    pass_number = make_pass_number(row['id'])
+                    row['valid_from'], row['valid_until'] = validity_window(row)
+                    updates.append(('APPROVED', pass_number, row['valid_from'], row['valid_until'], row['id']))
+                    jobs.append((pass_number, row['id'], make_qr_data(pass_number, row)))
+                    results[row['id']] = {'id': row['id'], 'result': 'approved', 'pass_number': pass_number}
+                cursor.executemany(
+                    "UPDATE applications SET status = %s, pass_number = %s, qr_code_path = NULL, "
+                    "valid_from = %s, valid_until = %s "
+                    "WHERE id = %s AND status = 'PENDING'",
+                    updates
+                )
+                if eligible:
+                    counters.on_review(cursor, eligible, 'APPROVED')
+                # PNG files (if still wanted) are rendered in parallel by the background worker
+                if QR_STORE_FILES:
+                    qr_jobs.enqueue(cursor, jobs)
+                # Last before commit: holds the change log sequence lock
+                validation_snapshot.record_pass_changes(
+                    cursor, [pass_change_added(job[0], row) for job, row in zip(jobs, eligible)]
+                )
+            db.commit()
+            pass_cache.invalidate(*{row['user_id'] for row in eligible})
+            actor = admin_actor()
+            for row in eligible:
+                detail = {'from_status': row['status']}
+                if action == 'approve':
+                    detail.update(pass_number=results[row['id']]['pass_number'],
+                                  valid_from=row['valid_from'], valid_until=row['valid_until'])
+                audit_log.record(results[row['id']]['result'], row['id'], row['user_id'], actor, detail)
+    except mysql.connector.Error as err:
+        db.rollback()
+        app.logger.error(f"DB Error during bulk {action}: {err}")
+        return respond({'error': f"Bulk {action} failed, no changes were saved: {getattr(err, 'msg', err)}"}, 500)
+    finally:
+        try:
+            cursor.close()
+        except Exception:
+            pass
+        db.close()
+
+    elapsed = time.perf_counter() - started
+    items = [results[app_id] for app_id in app_ids]
+    done = sum(1 for item in items if item['result'] in ('approved', 'rejected'))
+    approved = sum(1 for item in items if item['result'] == 'approved')
+    return respond({
+        'action': action,
+        'requested': len(items),
+        'succeeded': done,
+        'skipped': sum(1 for item in items if item['result'] in ('skipped', 'not_found')),
+        'elapsed_seconds': round(elapsed, 4),
+        'approvals_per_second': round(approved / elapsed, 2) if elapsed > 0 else 0.0,
+        'results': items,
+    })
+
+
+@app.route('/admin/qr_queue_stats')
+def admin_qr_queue_stats():
+    """QR render queue depth and job latency, plus the on-demand image cache."""
+    if not is_admin_logged_in():
+        return redirect(url_for('admin_login'))
+    db = get_db_connection()
+    if not db:
+        return jsonify({'error': 'Database connection failed.'}), 503
+    try:
+        return jsonify(dict(qr_jobs.queue_stats(db), image_cache=qr_image_cache.stats()))
+    except mysql.connector.Error as err:
+        app.logger.error(f"DB Error fetching QR queue stats: {err}")
+        return jsonify({'error': 'Could not read queue stats.'}), 500
+
+
+@app.route('/admin/pool_stats')
+def admin_pool_stats():
+    """Connection pool usage (in-use, waits, wait time) for sizing DB_POOL_*, per replica, plus pass cache hit rates."""
+    if not is_admin_logged_in():
+        return redirect(url_for('admin_login'))
+    return jsonify(dict(
+        db_pool.stats(),
+        replicas={replica.name: replica.stats() for replica in all_db_pools()[1:]},
+        pass_cache=pass_cache.stats(),
+    ))
+
+
+@app.route('/admin/audit')
+def admin_audit():
+    """
+    Audit log query API: newest-first events filtered by `application_id`,
+    `user_id` and/or `event`, `limit` per page; follow `next_before` for older
+    events. Events reach the table up to AUDIT_FLUSH_INTERVAL after they happen.
+    """
+    if not is_admin_logged_in():
+        return redirect(url_for('admin_login'))
+    filters = {}
+    for name in ('application_id', 'user_id', 'before', 'limit'):
+        try:
+            filters[name] = int(request.args[name]) if request.args.get(name) else None
+        except ValueError:
+            return jsonify({'error': f'{name} must be an integer.'}), 400
+    limit = max(1, min(filters['limit'] or 50, AUDIT_QUERY_MAX_LIMIT))
+
+    db = get_db_connection(readonly=True)
+    if not db:
+        return jsonify({'error': 'Database connection failed.'}), 503
+    cursor = db.cursor(dictionary=True)
+    try:
+        events = audit.query_events(
+            cursor, application_id=filters['application_id'], user_id=filters['user_id'],
+            event=request.args.get('event') or None, before_id=filters['before'], limit=limit
+        )
+    except mysql.connector.Error as err:
+        app.logger.error(f"DB Error reading audit events: {err}")
+        return jsonify({'error': 'Could not read audit events.'}), 500
+    finally:
+        cursor.close()
+        db.close()
+    for event in events:
+        event['created_at'] = event['created_at'].isoformat()
+    return jsonify({
+        'events': events,
+        'next_before': events[-1]['id'] if len(events) == limit else None,
+    })
+
+
 @app.route('/static/uploads/<path:filename>')
 def serve_uploaded_files(filename):
     """
     Serves files from the UPLOAD_FOLDER (photos, qrcodes).
+
+    Uploaded files never change once written (their names are UUIDs or pass
+    numbers), so they are marked immutable and cacheable for UPLOADS_MAX_AGE.
+    send_from_directory answers If-None-Match / If-Modified-Since with 304 and
+    honours Range requests. With UPLOADS_SENDFILE_MODE set, the bytes are pushed
+    by nginx (X-Accel-Redirect) or Apache/lighttpd (X-Sendfile) instead.
     """
     # This route helps access the files saved in static/uploads/
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    if UPLOADS_SENDFILE_MODE == 'x-accel-redirect':
+        upload_root = os.path.join(app.root_path, app.config['UPLOAD_FOLDER'])
+        full_path = safe_join(upload_root, filename)
+        if full_path is None or not os.path.isfile(full_path):
+            abort(404)
+        # nginx serves the internal location itself, including ETag, Last-Modified and Range
+        response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = UPLOADS_ACCEL_PREFIX + filename
+    else:
+        response = send_from_directory(app.config['UPLOAD_FOLDER'], filename, max_age=UPLOADS_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.max_age = UPLOADS_MAX_AGE
+    response.cache_control.immutable = True
+    return response
 
 
 if __name__ == '__main__':
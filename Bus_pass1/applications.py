@@ -0,0 +1,106 @@
+# applications.py
+#
+# Rider-side pass application steps shared by the web pages (app.py) and the
+# JSON API (api.py): looking up the rider's pass and latest application,
+# submitting an application and paying for it.
+
+import counters
+import payments
+from audit import audit_log
+from db import get_db_connection
+from pass_cache import pass_cache
+
+# Narrow projection of an application for the apply page and the API
+APPLICATION_COLUMNS = (
+    "id, status, payment_status, start_point, end_point, amount, application_date, valid_from, valid_until"
+)
+
+# Hot-path queries, also EXPLAINed by `flask db check-plans` (see migrate.py)
+PASS_ROW_QUERY = """
+    SELECT a.*,
+           u.name,
+           u.phone_number,
+           u.photo_path,
+           u.auto_renew
+    FROM applications a
+             JOIN users u ON a.user_id = u.id
+    WHERE a.user_id = %s
+    ORDER BY a.status = 'APPROVED' DESC,
+             a.status = 'APPROVED' AND a.valid_from > CURDATE() ASC,
+             a.application_date DESC LIMIT 1
+"""
+LATEST_APPLICATION_QUERY = (
+    f"SELECT {APPLICATION_COLUMNS} FROM applications WHERE user_id = %s ORDER BY application_date DESC LIMIT 1"
+)
+
+
+class DatabaseUnavailable(Exception):
+    pass
+
+
+def load_pass_row(user_id, recently_changed=False):
+    """
+    Returns the row digital_pass() shows: the user's most recent approved
+    application if there is one (preferring one already in force over an
+    approved renewal that starts later), otherwise their most recent
+    application (for its status), otherwise {}. One query covers both cases.
+    Served by a read replica unless the pass was just changed (eg. approved by
+    an admin).
+    """
+    conn = get_db_connection(readonly=not recently_changed)
+    if not conn:
+        raise DatabaseUnavailable()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(PASS_ROW_QUERY, (user_id,))
+        return cursor.fetchone() or {}
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def cached_pass_row(user_id):
+    """load_pass_row() through the per-user pass cache; raises DatabaseUnavailable."""
+    return pass_cache.get_or_load(user_id, lambda recently_changed: load_pass_row(user_id, recently_changed))
+
+
+def latest_application(cursor, user_id):
+    """The rider's most recent application (APPLICATION_COLUMNS), or None."""
+    cursor.execute(LATEST_APPLICATION_QUERY, (user_id,))
+    return cursor.fetchone()
+
+
+def awaiting_payment(application) -> bool:
+    """True if the rider must pay for `application` before applying again."""
+    return bool(application) and application['payment_status'] == 'PENDING' and application['status'] != 'REJECTED'
+
+
+def create_application(conn, cursor, user_id, start_point, end_point, amount):
+    """Inserts an unpaid application and commits; returns its id."""
+    cursor.execute(
+        "INSERT INTO applications (user_id, start_point, end_point, amount, status, payment_status, application_date) VALUES (%s, %s, %s, %s, %s, %s, NOW())",
+        (user_id, start_point, end_point, amount, 'PENDING', 'PENDING')
+    )
+    application_id = cursor.lastrowid
+    counters.on_application(cursor, start_point, end_point)
+    conn.commit()
+    pass_cache.invalidate(user_id)
+    audit_log.record('applied', application_id, user_id, 'rider',
+                     {'start_point': start_point, 'end_point': end_point, 'amount': amount})
+    return application_id
+
+
+def pay_application(conn, application):
+    """
+    Simulated rider payment, applied through the same idempotent path as
+    gateway notifications. The key is per application, so double submits (from
+    either the web page or the API) are answered as duplicates. Returns the
+    payments.apply_events() result.
+    """
+    return payments.apply_events(conn, [{
+        'idempotency_key': f"web:{application['id']}",
+        'application_id': application['id'],
+        'status': 'succeeded',
+        'amount': application['amount'],
+        'gateway_ref': None,
+    }], actor='rider')[0]
@@ -0,0 +1,252 @@
+# audit.py
+#
+# Append-only log of application and pass transitions (applied, paid, approved,
+# rejected, expired, renewal created...) kept in audit_events (migration 0008) for
+# disputes. Handlers call audit_log.record() once their transaction has committed;
+# the event waits in a bounded in-memory buffer and a background thread writes
+# buffered events in multi-row INSERTs, as soon as AUDIT_BATCH_SIZE are waiting
+# or at most AUDIT_FLUSH_INTERVAL seconds after they were recorded, so requests
+# never wait on the log. Whatever is still buffered is written at shutdown.
+#
+# If the buffer is full (the database is down or slow), record() waits up to
+# AUDIT_ENQUEUE_TIMEOUT for room and then drops the event, counted in the
+# audit_events_dropped_total metric. Events buffered in a process that is killed
+# are lost too: the log is a trail beside the authoritative tables, not part of
+# their transactions.
+#
+# Actors: 'rider', 'admin:<admin id>', 'gateway' or 'system' (scheduled jobs).
+# Admins read the log per application or rider at /admin/audit (JSON) or with
+# `flask audit show`.
+
+import os
+import json
+import time
+import atexit
+import logging
+import datetime
+import threading
+from collections import deque
+
+import click
+from flask.cli import AppGroup
+
+from config import (
+    AUDIT_BUFFER_MAX, AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL, AUDIT_ENQUEUE_TIMEOUT, AUDIT_RETRY_DELAY,
+)
+from db import pool as db_pool
+from metrics import registry
+
+logger = logging.getLogger('bus_pass.audit')
+
+COLUMNS = "id, created_at, event, application_id, user_id, actor, detail"
+
+
+class AuditLog:
+    """Bounded buffer of audit events drained by one background writer thread per process."""
+
+    def __init__(self, max_buffered, batch_size, flush_interval, enqueue_timeout, retry_delay,
+                 connect=db_pool.connection):
+        self.max_buffered = max_buffered
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.retry_delay = retry_delay
+        self.connect = connect
+        self._lock = threading.Condition(threading.Lock())
+        # Held while writing, so batches reach the table in the order they were recorded
+        self._flush_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._buffer = deque()
+        self._writer = None
+        self._closed = False
+        self._stats = {'recorded': 0, 'written': 0, 'dropped': 0, 'write_errors': 0}
+
+    def record(self, event, application_id=None, user_id=None, actor='system', detail=None) -> bool:
+        """
+        Buffers one event, timestamped now. `detail` is a dict of JSON-able values
+        (dates and Decimals are stored as strings). Returns False if it was dropped.
+        """
+        row = (
+            datetime.datetime.now(), event, application_id, user_id, actor,
+            json.dumps(detail, default=str, separators=(',', ':')) if detail else None,
+        )
+        if self._pid != os.getpid():
+            # The parent's writer thread does not survive fork(); its buffer is the parent's to write
+            with self._lock:
+                self._reset()
+
+        with self._lock:
+            deadline = None
+            while len(self._buffer) >= self.max_buffered:
+                if deadline is None:
+                    deadline = time.monotonic() + self.enqueue_timeout
+                    self._lock.notify_all()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['dropped'] += 1
+                    logger.warning(f"Audit buffer full, dropped {event} event for application {application_id}")
+                    return False
+                self._lock.wait(remaining)
+            self._buffer.append(row)
+            self._stats['recorded'] += 1
+            closed = self._closed
+            if not closed:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                    self._writer.start()
+                elif len(self._buffer) >= self.batch_size:
+                    self._lock.notify_all()
+
+        if closed:
+            # Recorded during shutdown, after the final flush
+            self._flush_quietly()
+        return True
+
+    def _run(self):
+        while True:
+            with self._lock:
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._buffer) < self.batch_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._lock.wait(remaining)
+                if self._closed:
+                    return  # close() writes the rest
+            if not self._flush_quietly():
+                with self._lock:
+                    if not self._closed:
+                        self._lock.wait(self.retry_delay)
+
+    def flush(self) -> int:
+        """
+        Writes every buffered event now and returns how many were written. On a
+        database error the unwritten events go back to the front of the buffer
+        and the error is raised.
+        """
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+                    # Wake any record() waiting for room
+                    self._lock.notify_all()
+                if not batch:
+                    return written
+                try:
+                    self._write(batch)
+                except Exception:
+                    with self._lock:
+                        self._buffer.extendleft(reversed(batch))
+                        self._stats['write_errors'] += 1
+                    raise
+                written += len(batch)
+                with self._lock:
+                    self._stats['written'] += len(batch)
+
+    def _flush_quietly(self) -> bool:
+        try:
+            self.flush()
+            return True
+        except Exception as err:
+            logger.error(f"Writing audit events failed ({len(self._buffer)} buffered): {err}")
+            return False
+
+    def _write(self, batch):
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(
+                    "INSERT INTO audit_events (created_at, event, application_id, user_id, actor, detail) VALUES "
+                    + ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(batch)),
+                    [value for row in batch for value in row]
+                )
+                conn.commit()
+            finally:
+                cursor.close()
+
+    def close(self, timeout=5.0):
+        """Stops the writer and writes whatever is still buffered (run at interpreter exit)."""
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            self._closed = True
+            self._lock.notify_all()
+            writer = self._writer
+        if writer is not None:
+            writer.join(timeout)
+        if not self._flush_quietly():
+            logger.error(f"{len(self._buffer)} audit event(s) were not written before exit")
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, buffered=len(self._buffer))
+
+
+audit_log = AuditLog(AUDIT_BUFFER_MAX, AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL, AUDIT_ENQUEUE_TIMEOUT,
+                     AUDIT_RETRY_DELAY)
+
+
+def query_events(cursor, application_id=None, user_id=None, event=None, before_id=None, limit=50):
+    """
+    Newest-first page of events (dicts, `detail` decoded) for an application
+    and/or a rider, through the (application_id, id) and (user_id, id) indexes.
+    Pass the last returned id as `before_id` for the next page.
+    """
+    where, params = [], []
+    if application_id is not None:
+        where.append("application_id = %s")
+        params.append(application_id)
+    if user_id is not None:
+        where.append("user_id = %s")
+        params.append(user_id)
+    if event:
+        where.append("event = %s")
+        params.append(event)
+    if before_id is not None:
+        where.append("id < %s")
+        params.append(before_id)
+    cursor.execute(
+        f"SELECT {COLUMNS} FROM audit_events {'WHERE ' + ' AND '.join(where) if where else ''} "
+        f"ORDER BY id DESC LIMIT %s",
+        (*params, limit)
+    )
+    rows = cursor.fetchall()
+    for row in rows:
+        if isinstance(row['detail'], (str, bytes)):
+            row['detail'] = json.loads(row['detail'])
+    return rows
+
+
+audit_cli = AppGroup('audit', help='Application and pass audit log.')
+
+
+@audit_cli.command('show')
+@click.option('--application', 'application_id', type=int, default=None)
+@click.option('--user', 'user_id', type=int, default=None)
+@click.option('--limit', type=int, default=50, show_default=True)
+def show_command(application_id, user_id, limit):
+    """Print the newest audit events, optionally for one application or rider."""
+    with db_pool.connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            rows = query_events(cursor, application_id=application_id, user_id=user_id, limit=limit)
+        finally:
+            cursor.close()
+    for row in reversed(rows):
+        click.echo(f"{row['created_at']:%Y-%m-%d %H:%M:%S} {row['event']:<18} application={row['application_id']} "
+                   f"user={row['user_id']} by {row['actor']} {json.dumps(row['detail']) if row['detail'] else ''}")
+
+
+def init_app(app):
+    app.cli.add_command(audit_cli)
+    atexit.register(audit_log.close)
+    registry.add_collector('audit_events_buffered', 'Audit events waiting to be written by this process.',
+                           lambda: audit_log.stats()['buffered'])
+    registry.add_collector('audit_events_written_total', 'Audit events written by this process.',
+                           lambda: audit_log.stats()['written'], type='counter')
+    registry.add_collector('audit_events_dropped_total', 'Audit events dropped because the buffer was full.',
+                           lambda: audit_log.stats()['dropped'], type='counter')
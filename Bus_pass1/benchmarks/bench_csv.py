@@ -0,0 +1,145 @@
+# benchmarks/bench_csv.py
+#
+# Streams a CSV export of N applications and imports M riders, reporting rows/s
+# and peak memory. Imported rows carry passwords, as in a real `flask csv
+# import-users` run, so the import figure includes hashing (its main cost);
+# --without-passwords measures the CSV validate/batch cost alone. By default the
+# database side is replaced by synthetic rows; --live runs against the configured
+# MySQL, which should be seeded first (benchmarks/seed_data.py --size 1m).
+# Run from the Bus_pass1 directory:  python benchmarks/bench_csv.py --rows 1000000 --import-rows 2000
+
+import io
+import os
+import sys
+import time
+import random
+import argparse
+import datetime
+import resource
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import csv_io  # noqa: E402
+
+STOPS = ["Majestic", "Jayanagar", "Whitefield", "Koramangala",
+         "Electronic City", "Indiranagar", "Marathahalli", "Yeshwanthpur"]
+
+
+class SyntheticCursor:
+    """Unbuffered-cursor lookalike producing export rows lazily, or swallowing inserts."""
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._results = iter(())
+
+    def execute(self, sql, params=()):
+        self._results = iter(()) if sql.lstrip().startswith('SELECT email') else self._generate()
+
+    def executemany(self, sql, seq):
+        for _ in seq:
+            pass
+
+    def _generate(self):
+        now = datetime.datetime.now()
+        for i in range(self._rows):
+            start, end = random.sample(STOPS, 2)
+            yield (i, now, 'APPROVED', 'COMPLETED', 500.00, start, end, f"BP-{i}-{now:%Y%m%d}",
+                   i // 2, f"Rider {i}", f"rider{i}@example.com", f"9{i:09d}")
+
+    def fetchmany(self, size):
+        return [row for _, row in zip(range(size), self._results)]
+
+    def fetchall(self):
+        return list(self._results)
+
+    def close(self):
+        pass
+
+
+class SyntheticConnection:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self, **kwargs):
+        return SyntheticCursor(self.rows)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+def rider_csv_lines(count, run_id, passwords=True):
+    yield "name,email,phone_number,address" + (",password\n" if passwords else "\n")
+    for i in range(count):
+        yield (f"Rider {i},bench-{run_id}-{i}@loadtest.invalid,9{i:09d},Bengaluru"
+               + (f",bench-password-{i}\n" if passwords else "\n"))
+
+
+class LineStream(io.TextIOBase):
+    """Feeds generated CSV lines to csv.DictReader without building the whole file in memory."""
+
+    def __init__(self, lines):
+        self._lines = lines
+
+    def readable(self):
+        return True
+
+    def __iter__(self):
+        return self._lines
+
+    def __next__(self):
+        return next(self._lines)
+
+
+def peak_rss_mib():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Streaming CSV export and bulk import throughput.')
+    parser.add_argument('--rows', type=int, default=1000000, help='applications exported')
+    parser.add_argument('--import-rows', type=int, default=2000, help='riders imported')
+    parser.add_argument('--without-passwords', action='store_true', help='import riders without a password column')
+    parser.add_argument('--live', action='store_true', help='use the configured MySQL instead of synthetic rows')
+    args = parser.parse_args()
+
+    if args.live:
+        from db import pool
+        connection = pool.connection
+    else:
+        def connection():
+            return SyntheticConnection(args.rows)
+
+    print(f"baseline peak RSS {peak_rss_mib():.0f} MiB")
+
+    conn = connection()
+    started = time.perf_counter()
+    exported_bytes = exported_rows = 0
+    for chunk in csv_io.stream_applications_csv(conn, [], []):
+        exported_bytes += len(chunk)
+        exported_rows += chunk.count('\n')
+        if args.live and exported_rows > args.rows:
+            break
+    elapsed = time.perf_counter() - started
+    print(f"export: {exported_rows - 1:,} rows, {exported_bytes / 2**20:.1f} MiB in {elapsed:.2f}s "
+          f"-> {(exported_rows - 1) / elapsed:,.0f} rows/s, peak RSS {peak_rss_mib():.0f} MiB")
+    if args.live:
+        conn.release()
+
+    conn = connection()
+    run_id = int(time.time())
+    started = time.perf_counter()
+    lines = rider_csv_lines(args.import_rows, run_id, passwords=not args.without_passwords)
+    report = csv_io.import_users(conn, LineStream(lines), with_passwords=True).as_dict()
+    elapsed = time.perf_counter() - started
+    print(f"import ({'without' if args.without_passwords else 'with'} passwords): {report['rows']:,} rows, {report['inserted']:,} inserted, {report['failed']:,} rejected "
+          f"in {elapsed:.2f}s -> {report['rows'] / elapsed:,.0f} rows/s, peak RSS {peak_rss_mib():.0f} MiB")
+    if args.live:
+        conn.release()
+        print("imported riders use @loadtest.invalid emails; remove them with benchmarks/seed_data.py --clear")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+# benchmarks/bench_login_flood.py
+#
+# Models one app worker (a fixed pool of request threads) under a login flood and
+# measures the latency of a cheap route (GET /) served alongside it, with password
+# checks done inline on the request thread versus on the bounded hasher pool.
+# Run from the Bus_pass1 directory:  python benchmarks/bench_login_flood.py --flood 32
+
+import os
+import sys
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import check_password_hash  # noqa: E402
+
+from app import app  # noqa: E402
+from passwords import hasher, HasherBusy  # noqa: E402
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+def run(mode, server_threads, flood, seconds, stored, password):
+    server = ThreadPoolExecutor(max_workers=server_threads)
+    client = app.test_client()
+    stop = threading.Event()
+    counts = {'ok': 0, 'rejected': 0}
+    lock = threading.Lock()
+
+    def login():
+        if mode == 'inline':
+            check_password_hash(stored, password)
+            result = 'ok'
+        else:
+            try:
+                hasher.verify(stored, password)
+                result = 'ok'
+            except HasherBusy:
+                result = 'rejected'
+        with lock:
+            counts[result] += 1
+        return result
+
+    def flooder():
+        while not stop.is_set():
+            if server.submit(login).result() == 'rejected':
+                time.sleep(0.05)  # a client honouring Retry-After would wait far longer
+
+    flooders = [threading.Thread(target=flooder) for _ in range(flood)]
+    for thread in flooders:
+        thread.start()
+    time.sleep(0.5)  # let the flood saturate the request threads
+
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        server.submit(client.get, '/').result()
+        latencies.append(time.perf_counter() - started)
+        time.sleep(0.01)
+
+    stop.set()
+    for thread in flooders:
+        thread.join()
+    server.shutdown()
+    latencies.sort()
+    return {
+        'probe_requests': len(latencies),
+        'p50_ms': 1000 * percentile(latencies, 50),
+        'p95_ms': 1000 * percentile(latencies, 95),
+        'p99_ms': 1000 * percentile(latencies, 99),
+        'logins_per_s': counts['ok'] / seconds,
+        'rejected_per_s': counts['rejected'] / seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Route latency under a concurrent login flood, inline vs pooled hashing.')
+    parser.add_argument('--server-threads', type=int, default=8, help='request threads in the modelled worker')
+    parser.add_argument('--flood', type=int, default=32, help='concurrent clients hammering login')
+    parser.add_argument('--seconds', type=float, default=5.0, help='measurement time per mode')
+    args = parser.parse_args()
+
+    password = 'flood-password'
+    stored = hasher.hash(password)
+    print(f"hash method {hasher.current_prefix}, {args.server_threads} request threads, {args.flood} flooding clients\n")
+    print(f"{'mode':<8}{'GET / p50':>12}{'p95':>10}{'p99':>10}{'logins/s':>10}{'503s/s':>10}")
+    for mode in ('inline', 'pool'):
+        r = run(mode, args.server_threads, args.flood, args.seconds, stored, password)
+        print(f"{mode:<8}{r['p50_ms']:>10.1f}ms{r['p95_ms']:>8.1f}ms{r['p99_ms']:>8.1f}ms"
+              f"{r['logins_per_s']:>10.1f}{r['rejected_per_s']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# benchmarks/bench_payment_notify.py
+#
+# Posts signed batches of payment events to a running app's /payments/notify and
+# reports events/s. Every key is sent twice (the second pass is all duplicates), so
+# the output shows the cost of fresh events and of replays separately. The
+# application ids should exist, eg. after benchmarks/seed_data.py --size 100k.
+# Run from the Bus_pass1 directory:
+#   python benchmarks/bench_payment_notify.py --url http://127.0.0.1:5000 --events 20000
+
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from payments import sign_body, SIGNATURE_HEADER  # noqa: E402
+
+
+def post_batch(url, events):
+    body = json.dumps({'events': events}).encode()
+    req = urllib.request.Request(url + '/payments/notify', data=body, method='POST', headers={
+        'Content-Type': 'application/json',
+        SIGNATURE_HEADER: sign_body(body),
+    })
+    with urllib.request.urlopen(req, timeout=60) as resp:
+        return json.loads(resp.read())
+
+
+def run(url, batches, concurrency):
+    totals = {'applied': 0, 'ignored': 0, 'rejected': 0, 'duplicates': 0}
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for summary in pool.map(lambda batch: post_batch(url, batch), batches):
+            for name in totals:
+                totals[name] += summary[name]
+    return time.perf_counter() - started, totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput of the batched payment notification endpoint.')
+    parser.add_argument('--url', required=True, help='base URL of a running app')
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--batch', type=int, default=500, help='events per request')
+    parser.add_argument('--concurrency', type=int, default=4, help='requests in flight')
+    parser.add_argument('--first-id', type=int, default=1, help='lowest application id to pay')
+    parser.add_argument('--ids', type=int, default=10000, help='number of application ids to spread events over')
+    args = parser.parse_args()
+
+    run_id = uuid.uuid4().hex[:8]
+    events = [{
+        'idempotency_key': f'bench-{run_id}-{i}',
+        'application_id': args.first_id + i % args.ids,
+        'status': 'succeeded',
+    } for i in range(args.events)]
+    batches = [events[i:i + args.batch] for i in range(0, len(events), args.batch)]
+
+    for label in ('fresh', 'replay'):
+        seconds, totals = run(args.url.rstrip('/'), batches, args.concurrency)
+        print(f"{label:<7}{args.events / seconds:>10.0f} events/s  ({seconds:.2f}s)  "
+              + '  '.join(f"{name}={count}" for name, count in totals.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# benchmarks/bench_snapshot.py
+#
+# Builds an offline validation snapshot for synthetic passes and reports build
+# time, blob size, delta size and device-side lookup speed.
+# Run from the Bus_pass1 directory:  python benchmarks/bench_snapshot.py --passes 1000000
+
+import os
+import sys
+import time
+import random
+import argparse
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from validation_snapshot import build_snapshot, build_delta, SnapshotReader  # noqa: E402
+
+STOPS = ["Majestic", "Jayanagar", "Whitefield", "Koramangala",
+         "Electronic City", "Indiranagar", "Marathahalli", "Yeshwanthpur"]
+
+
+def synthetic_rows(count):
+    today = datetime.date.today()
+    for i in range(count):
+        start, end = random.sample(STOPS, 2)
+        yield f"BP-{i}-{today:%Y%m%d}", start, end, today + datetime.timedelta(days=random.randint(0, 60))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline validation snapshot build time and size.')
+    parser.add_argument('--passes', type=int, default=1000000)
+    parser.add_argument('--changes', type=int, default=10000, help='changes in the delta')
+    parser.add_argument('--lookups', type=int, default=200000)
+    args = parser.parse_args()
+
+    rows = list(synthetic_rows(args.passes))
+
+    started = time.perf_counter()
+    blob = build_snapshot(rows, version=args.passes)
+    build_seconds = time.perf_counter() - started
+    print(f"full snapshot: {args.passes:,} passes built in {build_seconds:.2f}s, "
+          f"{len(blob) / 1024 / 1024:.2f} MiB ({len(blob) / args.passes:.1f} bytes/pass)")
+
+    changes = [('REMOVE', row[0], None, None, None) if i % 2 else ('ADD',) + row
+               for i, row in enumerate(random.sample(rows, min(args.changes, len(rows))))]
+    started = time.perf_counter()
+    delta = build_delta(changes, base_version=args.passes, version=args.passes + len(changes))
+    print(f"delta: {len(changes):,} changes built in {time.perf_counter() - started:.3f}s, "
+          f"{len(delta) / 1024:.1f} KiB")
+
+    started = time.perf_counter()
+    reader = SnapshotReader(blob)
+    print(f"device decode: {time.perf_counter() - started:.2f}s for {len(reader):,} records")
+
+    probes = [random.choice(rows)[0] for _ in range(args.lookups)]
+    started = time.perf_counter()
+    found = sum(1 for number in probes if reader.lookup(number))
+    elapsed = time.perf_counter() - started
+    print(f"lookups: {args.lookups / elapsed:,.0f}/s ({found:,} of {args.lookups:,} found)")
+
+
+if __name__ == '__main__':
+    main()
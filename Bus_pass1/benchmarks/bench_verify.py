@@ -0,0 +1,51 @@
+# benchmarks/bench_verify.py
+#
+# Measures pass token verification throughput on a single core.
+# Run from the Bus_pass1 directory:  python benchmarks/bench_verify.py --tokens 100000
+
+import os
+import sys
+import time
+import random
+import argparse
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pass_tokens import sign_pass_token, pass_validity_window, verifier  # noqa: E402
+
+STOPS = ["Majestic", "Jayanagar", "Whitefield", "Koramangala",
+         "Electronic City", "Indiranagar", "Marathahalli", "Yeshwanthpur"]
+
+
+def make_tokens(count):
+    today = datetime.date.today()
+    tokens = []
+    for i in range(count):
+        issued = today - datetime.timedelta(days=random.randint(0, 40))
+        start, end = random.sample(STOPS, 2)
+        tokens.append(sign_pass_token(f"BP-{i}-{issued:%Y%m%d}", start, end, *pass_validity_window(issued)))
+    return tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pass token verification throughput.')
+    parser.add_argument('--tokens', type=int, default=100000, help='distinct tokens to verify')
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    tokens = make_tokens(args.tokens)
+    best = 0.0
+    for round_no in range(1, args.rounds + 1):
+        started = time.perf_counter()
+        results = verifier.verify_many(tokens)
+        elapsed = time.perf_counter() - started
+        rate = len(tokens) / elapsed
+        best = max(best, rate)
+        print(f"round {round_no}: {len(tokens)} tokens in {elapsed:.3f}s -> {rate:,.0f} verifications/s "
+              f"({sum(r['valid'] for r in results)} valid)")
+    print(f"best: {best:,.0f} verifications/s per core")
+
+
+if __name__ == '__main__':
+    main()
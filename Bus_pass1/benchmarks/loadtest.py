@@ -0,0 +1,322 @@
+# benchmarks/loadtest.py
+#
+# Drives the rider journey (register -> login -> apply_pass -> payment ->
+# digital_pass) and the admin review flow (admin_applications -> process_pass)
+# at a given concurrency, and reports throughput and latency percentiles per step.
+#
+# Against a running server:   python benchmarks/loadtest.py --url http://127.0.0.1:5000 --riders 50
+# In-process (Flask test client, no HTTP server, same database):
+#                             python benchmarks/loadtest.py --inprocess --riders 20
+# Save and compare runs:      python benchmarks/loadtest.py ... --output new.json --compare baseline.json
+#
+# Seed the database first with benchmarks/seed_data.py so list and lookup
+# queries run against a realistic table size.
+#
+# Admission control (admission.py) limits logged-out requests per client address
+# to ADMISSION_CLIENT_RATE/s with a burst of ADMISSION_CLIENT_BURST (5/s and 20
+# by default), and every virtual user here registers and logs in from the same
+# address. In-process runs therefore lift the admission limits unless given
+# `--admission on`. Against a remote server, raise ADMISSION_CLIENT_RATE,
+# ADMISSION_CLIENT_BURST and ADMISSION_GLOBAL_RATE in its config.py (or set
+# ADMISSION_ENABLED = False) for a throughput run. Requests refused with 429 or
+# 503 are counted in the `shed` column, apart from errors and latencies.
+
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import random
+import argparse
+import datetime
+import threading
+import subprocess
+import urllib.error
+import urllib.parse
+import urllib.request
+import http.cookiejar
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+STOPS = ["Majestic", "Jayanagar", "Whitefield", "Koramangala",
+         "Electronic City", "Indiranagar", "Marathahalli", "Yeshwanthpur"]
+LOADTEST_EMAIL_DOMAIN = 'loadtest.invalid'  # removed again by `seed_data.py --clear`
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpClient:
+    """One virtual user talking HTTP to a running server, with its own cookie jar."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect)
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(req, timeout=30) as response:
+                response.read()
+                return response.status, response.headers.get('Location')
+        except urllib.error.HTTPError as err:
+            err.read()
+            return err.code, err.headers.get('Location')
+
+
+class InProcessClient:
+    """One virtual user calling the app through Flask's test client."""
+
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        return response.status_code, response.headers.get('Location')
+
+
+# Statuses admission control answers with when it refuses a request
+SHED_STATUSES = (429, 503)
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.shed = {}
+        self._lock = threading.Lock()
+
+    def step(self, name, client, method, path, data=None, expect=(200, 302)):
+        """Times one request; returns (status, Location) or None on failure."""
+        started = time.perf_counter()
+        try:
+            status, location = client.request(method, path, data)
+        except Exception:
+            status, location = None, None
+        elapsed = time.perf_counter() - started
+        ok = status in expect
+        with self._lock:
+            if status in SHED_STATUSES:
+                # Refused before any work was done: not a latency sample
+                self.shed[name] = self.shed.get(name, 0) + 1
+                self.samples.setdefault(name, [])
+                return None
+            self.samples.setdefault(name, []).append(elapsed)
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+        return (status, location) if ok else None
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def rider_journey(recorder, make_client, run_id, rider_no, iterations, pass_views, paid, rng):
+    for iteration in range(iterations):
+        client = make_client()
+        email = f"lt-{run_id}-{rider_no}-{iteration}@{LOADTEST_EMAIL_DOMAIN}"
+        password = 'loadtest-password'
+        if not recorder.step('register', client, 'POST', '/register', {
+                'name': f'Load Rider {rider_no}', 'email': email, 'password': password,
+                'address': 'Bengaluru', 'phone_number': f'8{rng.randrange(10**9):09d}'}, expect=(302,)):
+            continue
+        if not recorder.step('login', client, 'POST', '/login',
+                             {'email': email, 'password': password}, expect=(302,)):
+            continue
+        start_point, end_point = rng.sample(STOPS, 2)
+        applied = recorder.step('apply_pass', client, 'POST', '/apply_pass',
+                                {'start_point': start_point, 'end_point': end_point}, expect=(302,))
+        if not applied or '/payment/' not in (applied[1] or ''):
+            continue
+        app_id = int(applied[1].rstrip('/').rsplit('/', 1)[-1])
+        if not recorder.step('payment', client, 'POST', f'/payment/{app_id}', {}, expect=(302,)):
+            continue
+        paid.put(app_id)
+        for _ in range(pass_views):
+            # 302 back to apply_pass until an admin approves the application
+            recorder.step('digital_pass', client, 'GET', '/digital_pass')
+
+
+def admin_flow(recorder, client, username, password, paid, riders_done, batch, rng):
+    if not recorder.step('admin_login', client, 'POST', '/admin/login',
+                         {'username': username, 'password': password}, expect=(302,)):
+        return
+    while True:
+        recorder.step('admin_applications', client, 'GET', '/admin/applications')
+        taken = []
+        try:
+            while len(taken) < batch:
+                taken.append(paid.get(timeout=0.2))
+        except queue.Empty:
+            pass
+        for app_id in taken:
+            action = 'approve' if rng.random() < 0.9 else 'reject'
+            recorder.step('process_pass', client, 'GET', f'/admin/process_pass/{app_id}/{action}', expect=(302,))
+        if not taken and riders_done.is_set():
+            return
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def summarize(recorder, wall_seconds):
+    steps = {}
+    for name, samples in recorder.samples.items():
+        ordered = sorted(samples)
+        steps[name] = {
+            'requests': len(ordered),
+            'errors': recorder.errors.get(name, 0),
+            'shed': recorder.shed.get(name, 0),
+            'throughput_rps': len(ordered) / wall_seconds if wall_seconds else 0.0,
+            'mean_ms': 1000 * sum(ordered) / len(ordered) if ordered else 0.0,
+            'p50_ms': 1000 * (percentile(ordered, 50) or 0.0),
+            'p95_ms': 1000 * (percentile(ordered, 95) or 0.0),
+            'p99_ms': 1000 * (percentile(ordered, 99) or 0.0),
+            'max_ms': 1000 * ordered[-1] if ordered else 0.0,
+        }
+    return steps
+
+
+def print_report(steps):
+    print(f"{'step':<20}{'requests':>10}{'errors':>8}{'shed':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, s in steps.items():
+        print(f"{name:<20}{s['requests']:>10}{s['errors']:>8}{s['shed']:>8}{s['throughput_rps']:>10.1f}"
+              f"{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}")
+    if any(s['shed'] for s in steps.values()):
+        print("\nsome requests were shed by admission control (429/503); see the notes at the top of this file")
+
+
+def lift_admission_limits():
+    """Keeps admission control's bookkeeping in the measured path but makes its limits unreachable."""
+    import admission
+
+    unlimited = 10 ** 9
+    admission.controller = admission.AdmissionController(
+        {route_class: unlimited for route_class in admission.controller.concurrency},
+        unlimited, unlimited, unlimited, unlimited, max_clients=admission.controller.clients.max_clients,
+    )
+
+
+def compare(steps, baseline, max_regression):
+    """Prints p95/throughput changes against a saved run; returns the regressed steps."""
+    regressed = []
+    print(f"\ncompared with {baseline.get('label') or baseline.get('revision') or 'baseline'}:")
+    for name, s in steps.items():
+        base = baseline['steps'].get(name)
+        if not base:
+            continue
+        p95_change = 100 * (s['p95_ms'] - base['p95_ms']) / base['p95_ms'] if base['p95_ms'] else 0.0
+        rps_change = (100 * (s['throughput_rps'] - base['throughput_rps']) / base['throughput_rps']
+                      if base['throughput_rps'] else 0.0)
+        flag = ''
+        if max_regression is not None and p95_change > max_regression:
+            regressed.append(name)
+            flag = '  REGRESSION'
+        print(f"  {name:<20} p95 {base['p95_ms']:.1f} -> {s['p95_ms']:.1f} ms ({p95_change:+.1f}%), "
+              f"throughput {rps_change:+.1f}%{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rider and admin flow load test.')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help='base URL of a running server')
+    target.add_argument('--inprocess', action='store_true', help='call the app in-process via the Flask test client')
+    parser.add_argument('--riders', type=int, default=10, help='concurrent rider threads')
+    parser.add_argument('--iterations', type=int, default=5, help='journeys per rider thread')
+    parser.add_argument('--pass-views', type=int, default=3, help='digital_pass views per journey')
+    parser.add_argument('--admins', type=int, default=1, help='concurrent admin threads')
+    parser.add_argument('--admin-batch', type=int, default=20, help='applications processed per list view')
+    parser.add_argument('--admin-user', default='admin')
+    parser.add_argument('--admin-password', default='adminpass')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for routes and actions')
+    parser.add_argument('--label', help='free-form run label saved with the results, eg. the data set size')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--max-regression', type=float, default=None,
+                        help='exit non-zero if any step p95 is more than this many percent slower than --compare')
+    parser.add_argument('--admission', choices=('off', 'on'), default='off',
+                        help="in-process only: 'on' keeps the configured admission limits (all virtual users "
+                             "share one client address)")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    if args.inprocess:
+        from app import app as flask_app
+        if args.admission == 'off':
+            lift_admission_limits()
+
+        def make_client():
+            return InProcessClient(flask_app)
+    else:
+        def make_client():
+            return HttpClient(args.url)
+
+    recorder = Recorder()
+    paid = queue.Queue()
+    riders_done = threading.Event()
+    run_id = uuid.uuid4().hex[:8]
+
+    riders = [threading.Thread(target=rider_journey, args=(
+        recorder, make_client, run_id, n, args.iterations, args.pass_views, paid, random.Random(args.seed + n)))
+        for n in range(args.riders)]
+    admins = [threading.Thread(target=admin_flow, args=(
+        recorder, make_client(), args.admin_user, args.admin_password, paid, riders_done, args.admin_batch,
+        random.Random(args.seed - n - 1)))
+        for n in range(args.admins)]
+
+    started = time.perf_counter()
+    for thread in riders + admins:
+        thread.start()
+    for thread in riders:
+        thread.join()
+    riders_done.set()
+    for thread in admins:
+        thread.join()
+    wall_seconds = time.perf_counter() - started
+
+    steps = summarize(recorder, wall_seconds)
+    print(f"{args.riders} riders x {args.iterations} journeys, {args.admins} admin(s), {wall_seconds:.1f}s\n")
+    print_report(steps)
+
+    results = {
+        'label': args.label,
+        'revision': git_revision(),
+        'started_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'target': 'inprocess' if args.inprocess else args.url,
+        'options': {key: value for key, value in vars(args).items()
+                    if key not in ('output', 'compare', 'admin_password')},
+        'wall_seconds': wall_seconds,
+        'steps': steps,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nresults written to {args.output}")
+
+    if baseline is not None:
+        regressed = compare(steps, baseline, args.max_regression)
+        if regressed:
+            sys.exit(f"p95 regressed by more than {args.max_regression}% in: {', '.join(regressed)}")
+
+
+if __name__ == '__main__':
+    main()
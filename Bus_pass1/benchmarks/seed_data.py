@@ -0,0 +1,133 @@
+# benchmarks/seed_data.py
+#
+# Fills the configured MySQL database (config.py) with synthetic riders and
+# applications for load tests, then rebuilds the dashboard counters.
+# Run from the Bus_pass1 directory, after `flask --app app db upgrade`:
+#   python benchmarks/seed_data.py --size 100k
+#
+# Seeded riders are seed-<n>@loadtest.invalid with password SEED_PASSWORD;
+# `--clear` removes everything a previous run inserted.
+
+import os
+import sys
+import time
+import random
+import argparse
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+import counters  # noqa: E402
+from db import pool  # noqa: E402
+from pass_tokens import pass_validity_window  # noqa: E402
+
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+SEED_EMAIL_DOMAIN = 'loadtest.invalid'
+SEED_PASSWORD = 'loadtest-password'
+APPLICATIONS_PER_RIDER = 2
+CHUNK = 5000
+
+STOPS = ["Majestic", "Jayanagar", "Whitefield", "Koramangala",
+         "Electronic City", "Indiranagar", "Marathahalli", "Yeshwanthpur"]
+
+# (status, payment_status, weight): roughly what a few months of traffic looks like
+STATUS_MIX = [
+    ('APPROVED', 'COMPLETED', 60),
+    ('REJECTED', 'COMPLETED', 5),
+    ('PENDING', 'COMPLETED', 10),
+    ('PENDING', 'PENDING', 20),
+    ('PENDING', 'FAILED', 5),
+]
+
+
+def parse_size(value):
+    value = value.lower()
+    return SIZES[value] if value in SIZES else int(value)
+
+
+def next_id(cursor, table):
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}")
+    return cursor.fetchone()[0]
+
+
+def seed(conn, applications, rng):
+    """Inserts `applications` applications for applications / APPLICATIONS_PER_RIDER riders."""
+    cursor = conn.cursor()
+    riders = max(1, applications // APPLICATIONS_PER_RIDER)
+    password_hash = generate_password_hash(SEED_PASSWORD)  # shared, hashing 500k times is the slow part otherwise
+    first_user = next_id(cursor, 'users')
+    first_app = next_id(cursor, 'applications')
+    statuses = [(status, payment) for status, payment, _ in STATUS_MIX]
+    weights = [weight for _, _, weight in STATUS_MIX]
+    now = datetime.datetime.now()
+
+    for start in range(0, riders, CHUNK):
+        cursor.executemany(
+            "INSERT INTO users (id, name, email, password_hash, address, phone_number, photo_path) "
+            "VALUES (%s, %s, %s, %s, %s, %s, NULL)",
+            [(first_user + n, f"Seed Rider {n}", f"seed-{first_user + n}@{SEED_EMAIL_DOMAIN}",
+              password_hash, 'Bengaluru', f"9{n:09d}")
+             for n in range(start, min(start + CHUNK, riders))]
+        )
+        conn.commit()
+
+    for start in range(0, applications, CHUNK):
+        rows = []
+        for n in range(start, min(start + CHUNK, applications)):
+            app_id = first_app + n
+            status, payment = rng.choices(statuses, weights)[0]
+            applied = now - datetime.timedelta(seconds=rng.randint(0, 120 * 24 * 3600))
+            pass_number = f"BP-{app_id}-{applied:%Y%m%d}" if status == 'APPROVED' else None
+            valid_from, valid_until = pass_validity_window(applied.date()) if pass_number else (None, None)
+            start_point, end_point = rng.sample(STOPS, 2)
+            rows.append((app_id, first_user + n % riders, start_point, end_point, 500.00,
+                         applied, status, payment, pass_number, valid_from, valid_until))
+        cursor.executemany(
+            "INSERT INTO applications (id, user_id, start_point, end_point, amount, application_date, "
+            "status, payment_status, pass_number, valid_from, valid_until) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+            rows
+        )
+        conn.commit()
+        print(f"  {min(start + CHUNK, applications):,}/{applications:,} applications", end='\r', flush=True)
+    print()
+    cursor.close()
+    return riders
+
+
+def clear(conn):
+    cursor = conn.cursor()
+    cursor.execute(
+        "DELETE a FROM applications a JOIN users u ON a.user_id = u.id WHERE u.email LIKE %s",
+        (f"%@{SEED_EMAIL_DOMAIN}",)
+    )
+    apps = cursor.rowcount
+    cursor.execute("DELETE FROM users WHERE email LIKE %s", (f"%@{SEED_EMAIL_DOMAIN}",))
+    conn.commit()
+    cursor.close()
+    return apps
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed synthetic riders and applications for load tests.')
+    parser.add_argument('--size', default='10k', help='applications to insert: 10k, 100k, 1m or a number')
+    parser.add_argument('--seed', type=int, default=42, help='random seed, for reproducible data sets')
+    parser.add_argument('--clear', action='store_true', help='delete previously seeded (and load-test) data first')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with pool.connection() as conn:
+        if args.clear:
+            print(f"cleared {clear(conn):,} applications")
+        started = time.perf_counter()
+        applications = parse_size(args.size)
+        riders = seed(conn, applications, rng)
+        print(f"seeded {riders:,} riders and {applications:,} applications in {time.perf_counter() - started:.1f}s")
+        drifted = counters.reconcile(conn)
+        print(f"dashboard counters rebuilt ({drifted} changed)")
+
+
+if __name__ == '__main__':
+    main()
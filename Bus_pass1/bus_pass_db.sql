@@ -36,5 +36,9 @@ CREATE TABLE admin_users (
 );
 
 -- Step 5: Insert test admin (password: adminpass)
+-- Stored in plain text for setup; the app replaces it with a hash on the first admin login
 INSERT INTO admin_users (username, password_hash)
-VALUES ('admin', 'adminpass');
\ No newline at end of file
+VALUES ('admin', 'adminpass');
+
+-- Step 6: Apply schema migrations (indexes etc.) from the Bus_pass1 directory:
+--   flask --app app db upgrade
\ No newline at end of file
@@ -7,5 +7,146 @@ DB_USER = 'root'
 # FIX APPLIED: Setting the password to an empty string '' as no password was created.
 DB_PASSWORD = ''
 DB_NAME = 'bus_pass_db'
+DB_PORT = 3306
+
+# Read replicas (see db.py). Each entry overrides the primary's connection
+# settings, eg. [{'host': '127.0.0.1', 'port': 3307}] for a second local instance.
+DB_REPLICAS = []
+DB_REPLICA_SELECTION = 'round_robin'  # or 'least_loaded' (fewest connections in use)
+DB_READ_AFTER_WRITE_SECONDS = 5       # a session reads from the primary this long after its last commit
 
 SECRET_KEY = 'a_very_secret_and_long_key_for_flask_sessions'
+
+# Connection pool (see db.py). Each request borrows at most one connection.
+DB_POOL_SIZE = 10           # idle connections kept open
+DB_POOL_MAX_OVERFLOW = 10   # extra connections allowed under load, closed when returned
+DB_POOL_TIMEOUT = 5.0       # seconds to wait for a free connection before failing
+DB_POOL_PRE_PING = True     # validate connections on checkout
+
+# Rows per page on the admin applications list
+ADMIN_PAGE_SIZE = 50
+
+# Processes used to render QR codes for bulk approvals
+QR_RENDER_WORKERS = 4
+
+# Maximum number of applications a single bulk approve/reject may touch
+BULK_ACTION_MAX = 5000
+
+# Background QR rendering queue (see qr_jobs.py, run with `flask qr worker`)
+QR_JOB_BATCH_SIZE = 50       # jobs claimed per worker round
+QR_JOB_MAX_ATTEMPTS = 5      # renders tried before a job is marked FAILED
+QR_JOB_POLL_SECONDS = 1.0    # idle sleep between polls
+QR_JOB_STALE_SECONDS = 300   # RUNNING jobs older than this are requeued
+
+# On-demand QR images (/pass/<pass_number>/qr.png|svg)
+QR_IMAGE_CACHE_MAX_ITEMS = 10000           # encoded images kept in memory per process
+QR_IMAGE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+QR_IMAGE_MAX_AGE = 300                     # seconds browsers may reuse an image before revalidating
+QR_STORE_FILES = False                     # also write PNG files via the `flask qr worker` queue
+
+# Signing keys for QR pass tokens (see pass_tokens.py). To rotate: add a new key,
+# point PASS_SIGNING_KEY_ID at it, and drop the old key once its passes expire.
+PASS_SIGNING_KEYS = {
+    'k1': 'replace_with_a_long_random_pass_signing_secret',
+}
+PASS_SIGNING_KEY_ID = 'k1'
+
+# Maximum scans accepted by one /verify request
+VERIFY_MAX_BATCH = 10000
+
+# Offline validation snapshots (see validation_snapshot.py)
+SNAPSHOT_DELTA_MAX_CHANGES = 50000   # beyond this a device is sent a full snapshot instead
+SNAPSHOT_DEVICE_KEYS = []            # secrets validator devices send as "Authorization: Bearer <key>"
+SNAPSHOT_ALLOWED_IPS = ['127.0.0.1', '::1']  # clients served without a device key; None allows anyone
+PASS_CHANGES_RETENTION_DAYS = 30     # `flask snapshot prune` keeps this much change history
+
+# Rider photo processing (see photos.py)
+PHOTO_MAX_UPLOAD_BYTES = 10 * 1024 * 1024  # larger registration requests are refused
+PHOTO_MAX_PIXELS = 40_000_000              # reject decompression bombs before decoding
+PHOTO_MAX_SIZE = 400                       # pass photo bounding box, in pixels
+PHOTO_THUMB_SIZE = 64                      # admin list thumbnail bounding box
+PHOTO_QUALITY = 80
+PHOTO_WORKERS = 2
+
+# Uploaded photo/QR files (see serve_uploaded_files in app.py)
+UPLOADS_MAX_AGE = 365 * 24 * 3600          # files are immutable once written
+UPLOADS_SENDFILE_MODE = None               # None, 'x-accel-redirect' (nginx) or 'x-sendfile'
+UPLOADS_ACCEL_PREFIX = '/protected-uploads/'  # nginx `internal` location aliased to static/uploads/
+
+# Reverse proxies in front of the app (eg. 1 for nginx). Their X-Forwarded-For/-Proto headers
+# give the client address used by rate limits and IP allowlists; keep 0 when clients connect
+# directly, or they could forge their address.
+PROXY_TRUSTED_HOPS = 0
+
+# Dashboard counters (see counters.py)
+COUNTER_SHARDS = 8                   # rows per counter; more shards = less lock contention
+COUNTER_RECONCILE_INTERVAL = 3600    # suggested `flask counters reconcile --interval`
+
+# Digital pass lookups (see pass_cache.py)
+PASS_CACHE_TTL = 60             # seconds a cached pass may be served
+PASS_CACHE_MAX_ITEMS = 50000    # per-process LRU bound
+# Shared cache for multi-process deployments: None (per-process LRU only),
+# 'redis://host:6379/0' (needs the redis package) or 'local://' (in-memory stand-in)
+PASS_CACHE_URL = None
+
+# Instrumentation (see metrics.py)
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']  # clients allowed to scrape /metrics; None allows anyone
+SLOW_QUERY_THRESHOLD = 0.25                 # seconds; slower statements go to the bus_pass.slow_query log
+
+# Password hashing (see passwords.py)
+PASSWORD_HASH_METHOD = 'scrypt'   # Werkzeug method string, eg. 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'
+PASSWORD_HASH_WORKERS = 2         # hashes computed in parallel per process
+PASSWORD_HASH_QUEUE = 4           # further requests allowed to wait (keep workers + queue below the
+                                  # server's request threads); beyond that login/register get a 503
+PASSWORD_HASH_TIMEOUT = 5.0       # seconds a request waits for its hash before giving up
+
+# Admission control (see admission.py); limits apply per worker process
+ADMISSION_ENABLED = True
+ADMISSION_GLOBAL_RATE = 200           # public requests/s admitted in total
+ADMISSION_GLOBAL_BURST = 400
+ADMISSION_CLIENT_RATE = 5             # public requests/s per rider (or per address when logged out)
+ADMISSION_CLIENT_BURST = 20
+ADMISSION_MAX_TRACKED_CLIENTS = 100000
+ADMISSION_CONCURRENCY = {             # requests in progress per route class; admin slots are reserved
+    'public': 32,
+    'admin': 8,
+    'static': 64,
+    'gateway': 16,                    # payment notifications; not rate limited per client
+}
+
+# CSV export/import (see csv_io.py)
+CSV_EXPORT_CHUNK_ROWS = 2000            # rows fetched and encoded per streamed chunk
+CSV_IMPORT_BATCH_SIZE = 1000            # rows per executemany INSERT / commit
+CSV_IMPORT_MAX_REPORTED_ERRORS = 1000   # rejected rows listed individually in the report
+CSV_IMPORT_HASH_WORKERS = 4             # password hashes computed in parallel by `flask csv import-users`
+CSV_IMPORT_MAX_UPLOAD_BYTES = 50 * 1024 * 1024  # larger /admin/users/import uploads are refused; use the CLI
+PASSWORD_INVITE_MAX_AGE = 14 * 24 * 3600  # seconds a set-password link from the invite export stays valid
+
+# Payment gateway notifications (see payments.py)
+PAYMENT_WEBHOOK_SECRET = 'change-me-payment-webhook-secret'  # HMAC-SHA256 key shared with the gateway
+PAYMENT_NOTIFY_MAX_BATCH = 1000       # events per /payments/notify request
+PAYMENT_RECENT_KEYS = 200000          # idempotency keys remembered in memory to answer replays without the DB
+
+# Stops, routes and fares (see fares.py)
+FARES_REFRESH_SECONDS = 30    # how often each process checks fare_config.version for admin edits
+
+# Pass expiry and renewals (see pass_schedule.py, run with `flask passes run`)
+PASS_EXPIRY_BATCH_SIZE = 500       # passes expired per transaction
+PASS_EXPIRY_BATCH_PAUSE = 0.05     # seconds between batches, so the sweep never hogs row locks
+PASS_RENEWAL_BATCH_SIZE = 500      # renewal applications created per transaction
+PASS_RENEWAL_LEAD_DAYS = 7         # opted-in riders get their renewal this many days before expiry
+PASS_SCHEDULER_INTERVAL = 3600     # seconds between runs of `flask passes run`
+
+# Rider JSON API under /api/v1 (see api.py)
+API_TOKEN_MAX_AGE = 30 * 24 * 3600   # seconds a bearer token stays valid
+API_COMPRESS_MIN_BYTES = 512         # smaller responses are sent uncompressed
+API_GZIP_LEVEL = 6
+API_BROTLI_QUALITY = 5              # used when the brotli package is installed
+
+# Audit log of application and pass transitions (see audit.py)
+AUDIT_BUFFER_MAX = 10000        # events buffered per process; beyond this record() waits, then drops
+AUDIT_BATCH_SIZE = 500          # events per multi-row INSERT; a full batch is written straight away
+AUDIT_FLUSH_INTERVAL = 1.0      # seconds an event may wait in the buffer before it is written
+AUDIT_ENQUEUE_TIMEOUT = 0.05    # seconds a request waits for room in a full buffer
+AUDIT_RETRY_DELAY = 5.0         # seconds between write attempts while the database is failing
+AUDIT_QUERY_MAX_LIMIT = 500     # events per page of /admin/audit
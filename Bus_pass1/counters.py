@@ -0,0 +1,206 @@
+# counters.py
+#
+# Materialized counts of applications, kept in app_counters / app_daily_stats and
+# updated in the same transaction as every status transition, so the admin
+# dashboard never has to scan `applications`.
+#
+# Counter names:
+#   status:<status>          applications per status
+#   payment:<payment_status> applications per payment status
+#   review:PENDING           paid applications awaiting admin review
+#   route:<start>><end>      applications per route
+# Daily metrics: applications, payments, revenue, approvals, rejections, expiries.
+
+import time
+import random
+import datetime
+
+import click
+from flask.cli import AppGroup
+
+from config import COUNTER_SHARDS, COUNTER_RECONCILE_INTERVAL
+from db import pool as db_pool
+
+
+def bump(cursor, counts=None, daily=None, day=None):
+    """
+    Adds the given deltas inside the caller's transaction. `counts` maps counter
+    name -> delta and `daily` maps metric -> delta for `day` (default today).
+    """
+    shard = random.randrange(COUNTER_SHARDS)
+    # Rows are touched in a fixed (sorted) order so concurrent bumps cannot deadlock
+    counts = sorted((name, delta) for name, delta in (counts or {}).items() if delta)
+    if counts:
+        cursor.executemany(
+            "INSERT INTO app_counters (name, shard, value) VALUES (%s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE value = value + VALUES(value)",
+            [(name, shard, delta) for name, delta in counts]
+        )
+    daily = sorted((metric, delta) for metric, delta in (daily or {}).items() if delta)
+    if daily:
+        day = day or datetime.date.today()
+        cursor.executemany(
+            "INSERT INTO app_daily_stats (day, metric, shard, value) VALUES (%s, %s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE value = value + VALUES(value)",
+            [(day, metric, shard, delta) for metric, delta in daily]
+        )
+
+
+def route_counter(start_point, end_point):
+    return f"route:{start_point}>{end_point}"
+
+
+def on_application(cursor, start_point, end_point):
+    """A rider submitted a new (unpaid) application."""
+    on_applications(cursor, [(start_point, end_point)])
+
+
+def on_applications(cursor, routes):
+    """New (unpaid) applications, eg. bulk renewals; `routes` is [(start_point, end_point)]."""
+    counts = {'status:PENDING': len(routes), 'payment:PENDING': len(routes)}
+    for start_point, end_point in routes:
+        name = route_counter(start_point, end_point)
+        counts[name] = counts.get(name, 0) + 1
+    bump(cursor, counts, {'applications': len(routes)})
+
+
+def on_payments(cursor, rows):
+    """
+    Applications whose payment completed and which now wait for admin review.
+    `rows` are the pre-transition rows (status, payment_status, amount).
+    """
+    counts, revenue = {}, 0
+    for row in rows:
+        for name, delta in ((f"payment:{row['payment_status']}", -1), ('payment:COMPLETED', 1),
+                            ('review:PENDING', 1)):
+            counts[name] = counts.get(name, 0) + delta
+        if row['status'] != 'PENDING':
+            counts[f"status:{row['status']}"] = counts.get(f"status:{row['status']}", 0) - 1
+            counts['status:PENDING'] = counts.get('status:PENDING', 0) + 1
+        revenue += row['amount']
+    bump(cursor, counts, {'payments': len(rows), 'revenue': revenue})
+
+
+def on_payment_failures(cursor, rows):
+    """Pending payments the gateway reported as failed."""
+    counts = {}
+    for row in rows:
+        counts[f"payment:{row['payment_status']}"] = counts.get(f"payment:{row['payment_status']}", 0) - 1
+        counts['payment:FAILED'] = counts.get('payment:FAILED', 0) + 1
+    bump(cursor, counts)
+
+
+def on_review(cursor, rows, new_status):
+    """
+    Applications moved to APPROVED or REJECTED. `rows` are the pre-transition
+    rows (needing `status` and `payment_status`).
+    """
+    counts = {f'status:{new_status}': 0}
+    for row in rows:
+        counts[f"status:{row['status']}"] = counts.get(f"status:{row['status']}", 0) - 1
+        counts[f'status:{new_status}'] += 1
+        if row['status'] == 'PENDING' and row['payment_status'] == 'COMPLETED':
+            counts['review:PENDING'] = counts.get('review:PENDING', 0) - 1
+    metric = 'approvals' if new_status == 'APPROVED' else 'rejections'
+    bump(cursor, counts, {metric: len(rows)})
+
+
+def on_expiry(cursor, count):
+    """`count` APPROVED passes moved to EXPIRED."""
+    bump(cursor, {'status:APPROVED': -count, 'status:EXPIRED': count}, {'expiries': count})
+
+
+def read_counters(cursor):
+    cursor.execute("SELECT name, SUM(value) FROM app_counters GROUP BY name")
+    return {name: int(value) for name, value in cursor.fetchall()}
+
+
+def read_daily(cursor, days=14):
+    """Returns [(day, {metric: value})] for the last `days` days, newest first."""
+    cursor.execute(
+        "SELECT day, metric, SUM(value) FROM app_daily_stats "
+        "WHERE day > CURDATE() - INTERVAL %s DAY GROUP BY day, metric",
+        (days,)
+    )
+    by_day = {}
+    for day, metric, value in cursor.fetchall():
+        by_day.setdefault(day, {})[metric] = value
+    return sorted(by_day.items(), reverse=True)
+
+
+def reconcile(conn):
+    """
+    Recomputes every app_counters value from `applications` and rewrites the
+    table, returning the number of counters whose value had drifted.
+
+    The counter rows are locked first, so transitions committing meanwhile wait
+    for the rewrite instead of being lost. Daily approvals, payments and revenue
+    cannot be rebuilt (no per-transition timestamps are stored), so only the
+    daily application counts are reconciled.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT name, shard FROM app_counters FOR UPDATE")
+        cursor.fetchall()
+        current = read_counters(cursor)
+
+        expected = {}
+        cursor.execute("SELECT status, COUNT(*) FROM applications GROUP BY status")
+        expected.update({f'status:{status}': count for status, count in cursor.fetchall()})
+        cursor.execute("SELECT payment_status, COUNT(*) FROM applications GROUP BY payment_status")
+        expected.update({f'payment:{status}': count for status, count in cursor.fetchall()})
+        cursor.execute(
+            "SELECT COUNT(*) FROM applications WHERE payment_status = 'COMPLETED' AND status = 'PENDING'"
+        )
+        expected['review:PENDING'] = cursor.fetchone()[0]
+        cursor.execute("SELECT start_point, end_point, COUNT(*) FROM applications GROUP BY start_point, end_point")
+        expected.update({route_counter(start, end): count for start, end, count in cursor.fetchall()})
+
+        drifted = sum(1 for name in set(current) | set(expected)
+                      if current.get(name, 0) != expected.get(name, 0))
+        cursor.execute("DELETE FROM app_counters")
+        cursor.executemany(
+            "INSERT INTO app_counters (name, shard, value) VALUES (%s, 0, %s)",
+            sorted(expected.items())
+        )
+
+        cursor.execute(
+            "SELECT DATE(application_date), COUNT(*) FROM applications "
+            "WHERE application_date >= CURDATE() - INTERVAL 30 DAY GROUP BY DATE(application_date)"
+        )
+        daily = cursor.fetchall()
+        cursor.execute(
+            "DELETE FROM app_daily_stats WHERE metric = 'applications' AND day >= CURDATE() - INTERVAL 30 DAY"
+        )
+        cursor.executemany(
+            "INSERT INTO app_daily_stats (day, metric, shard, value) VALUES (%s, 'applications', 0, %s)",
+            daily
+        )
+        conn.commit()
+        return drifted
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+counters_cli = AppGroup('counters', help='Materialized dashboard counters.')
+
+
+@counters_cli.command('reconcile')
+@click.option('--interval', type=int, default=None,
+              help=f'Repeat every N seconds (e.g. {COUNTER_RECONCILE_INTERVAL}) instead of running once.')
+def reconcile_command(interval):
+    """Rebuild counters from the applications table."""
+    while True:
+        with db_pool.connection() as conn:
+            drifted = reconcile(conn)
+        click.echo(f"Counters reconciled ({drifted} corrected).")
+        if not interval:
+            return
+        time.sleep(interval)
+
+
+def init_app(app):
+    app.cli.add_command(counters_cli)
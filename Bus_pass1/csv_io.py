@@ -0,0 +1,316 @@
+# csv_io.py
+#
+# Streaming CSV export of applications and bulk CSV import of riders.
+# The export reads through an unbuffered cursor in fixed-size chunks and yields
+# encoded CSV text as it goes, so memory stays flat however many rows match.
+# The import validates each row and inserts valid ones in executemany batches,
+# reporting every rejected row with its line number. Password columns are only
+# accepted by the `flask csv import-users` command: hashing costs tens of
+# milliseconds per row, far too long to run inside a web request. Riders imported
+# without a password choose one from a signed set-password link; admins download
+# the links of every such rider as CSV (stream_invites_csv) to send out.
+
+import io
+import re
+import csv
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+import mysql.connector
+from flask.cli import AppGroup
+from itsdangerous import URLSafeTimedSerializer
+
+from config import (
+    SECRET_KEY, CSV_EXPORT_CHUNK_ROWS, CSV_IMPORT_BATCH_SIZE, CSV_IMPORT_MAX_REPORTED_ERRORS,
+    CSV_IMPORT_HASH_WORKERS, PASSWORD_INVITE_MAX_AGE,
+)
+from db import pool as db_pool
+from passwords import hash_password_now, make_unusable_password, password_fingerprint, UNUSABLE_PREFIX
+
+EXPORT_COLUMNS = [
+    ('application_id', 'a.id'),
+    ('application_date', 'a.application_date'),
+    ('status', 'a.status'),
+    ('payment_status', 'a.payment_status'),
+    ('amount', 'a.amount'),
+    ('start_point', 'a.start_point'),
+    ('end_point', 'a.end_point'),
+    ('pass_number', 'a.pass_number'),
+    ('user_id', 'u.id'),
+    ('name', 'u.name'),
+    ('email', 'u.email'),
+    ('phone_number', 'u.phone_number'),
+]
+
+IMPORT_REQUIRED = ('name', 'email', 'phone_number')
+IMPORT_OPTIONAL = ('address', 'password')
+PASSWORDS_CLI_ONLY = 'password column is only accepted by `flask csv import-users`'
+# Column sizes from the users table in bus_pass_db.sql
+IMPORT_MAX_LENGTHS = {'name': 100, 'email': 100, 'phone_number': 20, 'address': 65535}
+EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+PHONE_RE = re.compile(r'^\+?[0-9][0-9 -]{5,18}$')
+INVITE_COLUMNS = ['email', 'name', 'set_password_url']
+
+invite_tokens = URLSafeTimedSerializer(SECRET_KEY, salt='rider-invite')
+
+
+def _csv_safe(value):
+    """Neutralises cells a spreadsheet would run as a formula."""
+    if isinstance(value, str) and value[:1] in ('=', '+', '-', '@', '\t', '\r'):
+        return "'" + value
+    return value
+
+
+def stream_applications_csv(conn, where, params, chunk_rows=CSV_EXPORT_CHUNK_ROWS):
+    """
+    Yields CSV text for `applications JOIN users` rows matching `where`,
+    `chunk_rows` rows at a time, in (application_date, id) order.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([header for header, _ in EXPORT_COLUMNS])
+
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute(
+            f"""
+            SELECT {', '.join(expr for _, expr in EXPORT_COLUMNS)}
+            FROM applications a
+            JOIN users u ON a.user_id = u.id
+            WHERE {' AND '.join(where) or '1'}
+            ORDER BY a.application_date ASC, a.id ASC
+            """,
+            params
+        )
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            writer.writerows([_csv_safe(value) for value in row] for row in rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+    finally:
+        cursor.close()
+
+
+def make_invite_token(user_id, stored_hash):
+    return invite_tokens.dumps([user_id, password_fingerprint(stored_hash)])
+
+
+def read_invite_token(token):
+    """
+    Returns (user id, password fingerprint) from a set-password link token.
+    Raises itsdangerous.BadSignature if it was tampered with, or its subclass
+    SignatureExpired once it is older than PASSWORD_INVITE_MAX_AGE.
+    """
+    user_id, fingerprint = invite_tokens.loads(token, max_age=PASSWORD_INVITE_MAX_AGE)
+    return user_id, fingerprint
+
+
+def stream_invites_csv(conn, link_for, chunk_rows=CSV_EXPORT_CHUNK_ROWS):
+    """
+    Yields CSV of every rider who has no password yet (imported without one),
+    with the set-password link `link_for(token)` of each, in id order.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(INVITE_COLUMNS)
+
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute(
+            "SELECT id, email, name, password_hash FROM users WHERE password_hash LIKE %s ORDER BY id",
+            (UNUSABLE_PREFIX + '%',)
+        )
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            writer.writerows(
+                (_csv_safe(email), _csv_safe(name), link_for(make_invite_token(user_id, stored)))
+                for user_id, email, name, stored in rows
+            )
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+    finally:
+        cursor.close()
+
+
+class ImportReport:
+    def __init__(self, max_reported_errors=CSV_IMPORT_MAX_REPORTED_ERRORS):
+        self.rows = 0
+        self.inserted = 0
+        self.error_count = 0
+        self.errors = []
+        self.max_reported_errors = max_reported_errors
+        self.started = time.perf_counter()
+
+    def reject(self, line, email, error):
+        self.error_count += 1
+        if len(self.errors) < self.max_reported_errors:
+            self.errors.append({'line': line, 'email': email, 'error': error})
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'failed': self.error_count,
+            'errors': sorted(self.errors, key=lambda error: error['line']),
+            'errors_truncated': self.error_count > len(self.errors),
+            'seconds': round(time.perf_counter() - self.started, 3),
+        }
+
+
+def validate_user_row(row):
+    """Returns (cleaned row, None) or (None, error message)."""
+    if None in row:
+        return None, 'too many columns'
+    cleaned = {key: (row.get(key) or '').strip() for key in IMPORT_REQUIRED + IMPORT_OPTIONAL}
+    missing = [key for key in IMPORT_REQUIRED if not cleaned[key]]
+    if missing:
+        return None, f"missing {', '.join(missing)}"
+    for key, limit in IMPORT_MAX_LENGTHS.items():
+        if len(cleaned[key]) > limit:
+            return None, f"{key} longer than {limit} characters"
+    if not EMAIL_RE.match(cleaned['email']):
+        return None, 'invalid email'
+    if not PHONE_RE.match(cleaned['phone_number']):
+        return None, 'invalid phone number'
+    cleaned['email'] = cleaned['email'].lower()
+    return cleaned, None
+
+
+def _insert_batch(conn, batch, report, hash_pool=None):
+    """
+    Inserts a batch of (line, row) pairs, skipping emails that are already
+    registered. Passwords are hashed on `hash_pool`; only the CLI import (an
+    offline job) gets rows with passwords.
+    """
+    cursor = conn.cursor()
+    try:
+        emails = [row['email'] for _, row in batch]
+        cursor.execute(
+            f"SELECT email FROM users WHERE email IN ({', '.join(['%s'] * len(emails))})",
+            emails
+        )
+        existing = {email.lower() for (email,) in cursor.fetchall()}
+        fresh = []
+        for line, row in batch:
+            if row['email'] in existing:
+                report.reject(line, row['email'], 'email already registered')
+            else:
+                fresh.append((line, row))
+        if not fresh:
+            return
+
+        passwords = [row['password'] for _, row in fresh]
+        if hash_pool is not None and any(passwords):
+            # The KDF releases the GIL, so the batch hashes on every worker at once
+            hashes = list(hash_pool.map(lambda password: hash_password_now(password) if password else None, passwords))
+        else:
+            hashes = [None] * len(fresh)
+        values = [
+            (row['name'], row['email'], password_hash or make_unusable_password(),
+             row['address'] or None, row['phone_number'])
+            for (_, row), password_hash in zip(fresh, hashes)
+        ]
+        insert = ("INSERT INTO users (name, email, password_hash, address, phone_number, photo_path) "
+                  "VALUES (%s, %s, %s, %s, %s, NULL)")
+        try:
+            cursor.executemany(insert, values)
+            conn.commit()
+            report.inserted += len(fresh)
+        except mysql.connector.IntegrityError:
+            # Someone registered one of these emails meanwhile; fall back to row by row
+            conn.rollback()
+            for (line, row), value in zip(fresh, values):
+                try:
+                    cursor.execute(insert, value)
+                    conn.commit()
+                    report.inserted += 1
+                except mysql.connector.IntegrityError:
+                    conn.rollback()
+                    report.reject(line, row['email'], 'email already registered')
+    finally:
+        cursor.close()
+
+
+def import_users(conn, text_stream, batch_size=CSV_IMPORT_BATCH_SIZE, with_passwords=False):
+    """
+    Imports riders from CSV text with a header row (name, email, phone_number,
+    optional address and, with `with_passwords`, password). Each batch is
+    committed on its own, so rows before a failure stay imported. Riders without
+    a password cannot log in until they set one from their invite link (see
+    stream_invites_csv). Returns an ImportReport.
+    """
+    report = ImportReport()
+    reader = csv.DictReader(text_stream)
+    headers = set(reader.fieldnames or [])
+    missing = [key for key in IMPORT_REQUIRED if key not in headers]
+    if missing:
+        report.reject(1, None, f"missing column(s): {', '.join(missing)}")
+        return report
+    if 'password' in headers and not with_passwords:
+        report.reject(1, None, PASSWORDS_CLI_ONLY)
+        return report
+
+    hash_pool = ThreadPoolExecutor(CSV_IMPORT_HASH_WORKERS, thread_name_prefix='import-hash') if with_passwords else None
+    try:
+        _import_rows(conn, reader, batch_size, report, hash_pool)
+    finally:
+        if hash_pool is not None:
+            hash_pool.shutdown()
+    return report
+
+
+def _import_rows(conn, reader, batch_size, report, hash_pool):
+    # Emails seen anywhere in the file, as 8-byte digests to keep a large import's memory small
+    batch, seen_emails = [], set()
+    for row in reader:
+        report.rows += 1
+        line = reader.line_num
+        cleaned, error = validate_user_row(row)
+        if error:
+            report.reject(line, (row.get('email') or '').strip() or None, error)
+            continue
+        email_digest = hashlib.blake2b(cleaned['email'].encode(), digest_size=8).digest()
+        if email_digest in seen_emails:
+            report.reject(line, cleaned['email'], 'duplicate email in file')
+            continue
+        batch.append((line, cleaned))
+        seen_emails.add(email_digest)
+        if len(batch) >= batch_size:
+            _insert_batch(conn, batch, report, hash_pool)
+            batch = []
+    if batch:
+        _insert_batch(conn, batch, report, hash_pool)
+
+
+csv_cli = AppGroup('csv', help='Bulk CSV import.')
+
+
+@csv_cli.command('import-users')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', type=int, default=CSV_IMPORT_BATCH_SIZE, show_default=True)
+def import_users_command(path, batch_size):
+    """Import riders from a CSV file (for files too large to upload)."""
+    with open(path, newline='', encoding='utf-8-sig') as f, db_pool.connection() as conn:
+        report = import_users(conn, f, batch_size, with_passwords=True).as_dict()
+    click.echo(f"{report['rows']} rows: {report['inserted']} imported, {report['failed']} rejected "
+               f"in {report['seconds']}s")
+    for error in report['errors']:
+        click.echo(f"  line {error['line']}: {error['email'] or '-'}: {error['error']}")
+    if report['errors_truncated']:
+        click.echo(f"  ... {report['failed'] - len(report['errors'])} more")
+
+
+def init_app(app):
+    app.cli.add_command(csv_cli)
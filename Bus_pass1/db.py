@@ -0,0 +1,345 @@
+# db.py
+
+import os
+import time
+import logging
+import itertools
+import threading
+from collections import deque
+
+import mysql.connector
+from flask import g, session, has_request_context
+
+import config
+
+logger = logging.getLogger('bus_pass.db')
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out within the pool timeout."""
+
+
+class PooledConnection:
+    """
+    Thin proxy around a mysql.connector connection borrowed from a ConnectionPool.
+
+    Routes keep calling conn.close() as before; for request-bound connections that is
+    a no-op and the connection goes back to the pool when the request ends.
+    """
+
+    def __init__(self, pool, raw, request_bound=False):
+        self._pool = pool
+        self._raw = raw
+        self._request_bound = request_bound
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def commit(self):
+        self._raw.commit()
+        if self._pool.on_commit:
+            self._pool.on_commit()
+
+    def cursor(self, *args, **kwargs):
+        cursor = self._raw.cursor(*args, **kwargs)
+        wrapper = self._pool.cursor_wrapper
+        return wrapper(cursor) if wrapper else cursor
+
+    def close(self):
+        if not self._request_bound:
+            self.release()
+
+    def release(self):
+        """Returns the underlying connection to the pool (safe to call twice)."""
+        if self._released:
+            return
+        self._released = True
+        self._pool._release(self._raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class ConnectionPool:
+    """
+    Bounded MySQL connection pool.
+
+    Keeps up to `size` idle connections, allows `max_overflow` extra connections
+    under load (closed again when returned), blocks at most `timeout` seconds for
+    a free slot and optionally pings each connection before handing it out.
+    """
+
+    def __init__(self, connect_args, size=5, max_overflow=5, timeout=5.0, pre_ping=True, name='primary'):
+        self.name = name
+        self.connect_args = dict(connect_args)
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.pre_ping = pre_ping
+        # Optional instrumentation hooks (see metrics.init_app)
+        self.cursor_wrapper = None
+        self.connect_observer = None
+        self.checkout_observer = None
+        self.on_commit = None
+        self._lock = threading.Condition(threading.Lock())
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = deque()
+        self._open = 0
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'timeouts': 0,
+            'connects': 0,
+            'invalidated': 0,
+        }
+
+    def _connect(self):
+        started = time.perf_counter()
+        raw = mysql.connector.connect(**self.connect_args)
+        if self.connect_observer:
+            self.connect_observer(time.perf_counter() - started)
+        with self._lock:
+            self._stats['connects'] += 1
+        return raw
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def acquire(self, request_bound=False):
+        """
+        Checks out a connection, opening a new one if the pool has free capacity.
+        Raises PoolTimeout if none becomes available within `timeout` seconds.
+        """
+        if self._pid != os.getpid():
+            # Connections must never be shared with a parent process after fork()
+            with self._lock:
+                self._reset()
+
+        checkout_started = time.perf_counter()
+        raw = None
+        waited = None
+        with self._lock:
+            deadline = None
+            while not self._idle and self._open >= self.size + self.max_overflow:
+                if deadline is None:
+                    waited = time.monotonic()
+                    deadline = waited + self.timeout
+                    self._stats['waits'] += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    self._record_wait(waited)
+                    raise PoolTimeout(f"no connection available within {self.timeout}s")
+                self._lock.wait(remaining)
+            if waited is not None:
+                self._record_wait(waited)
+            if self._idle:
+                raw = self._idle.pop()
+            else:
+                self._open += 1
+            self._stats['checkouts'] += 1
+
+        try:
+            if raw is None:
+                raw = self._connect()
+            elif self.pre_ping and not self._is_alive(raw):
+                with self._lock:
+                    self._stats['invalidated'] += 1
+                self._discard(raw)
+                raw = self._connect()
+        except Exception:
+            with self._lock:
+                self._open -= 1
+                self._lock.notify()
+            raise
+        if self.checkout_observer:
+            self.checkout_observer(time.perf_counter() - checkout_started)
+        return PooledConnection(self, raw, request_bound=request_bound)
+
+    def _record_wait(self, started):
+        elapsed = time.monotonic() - started
+        self._stats['wait_time_total'] += elapsed
+        self._stats['wait_time_max'] = max(self._stats['wait_time_max'], elapsed)
+
+    @staticmethod
+    def _is_alive(raw):
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _release(self, raw):
+        healthy = True
+        try:
+            # Never hand the next borrower half-read results or an open transaction
+            if raw.unread_result:
+                raw.consume_results()
+            if raw.in_transaction:
+                raw.rollback()
+        except Exception:
+            healthy = False
+
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            if healthy and len(self._idle) < self.size:
+                self._idle.append(raw)
+                raw = None
+            else:
+                self._open -= 1
+            self._lock.notify()
+        if raw is not None:
+            self._discard(raw)
+
+    def connection(self):
+        """Context-manager checkout for code running outside a Flask request."""
+        return self.acquire()
+
+    def stats(self):
+        with self._lock:
+            idle = len(self._idle)
+            return dict(
+                self._stats,
+                size=self.size,
+                max_overflow=self.max_overflow,
+                open=self._open,
+                idle=idle,
+                in_use=self._open - idle,
+            )
+
+
+def make_pool(name, **overrides):
+    connect_args = dict(
+        host=config.DB_HOST,
+        port=config.DB_PORT,
+        user=config.DB_USER,
+        password=config.DB_PASSWORD,
+        database=config.DB_NAME,
+    )
+    connect_args.update(overrides)
+    return ConnectionPool(
+        connect_args=connect_args,
+        size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_POOL_MAX_OVERFLOW,
+        timeout=config.DB_POOL_TIMEOUT,
+        pre_ping=config.DB_POOL_PRE_PING,
+        name=name,
+    )
+
+
+class ReplicaSet:
+    """
+    Picks a read replica pool, round-robin or by fewest connections in use.
+    Replicas that fail to hand out a connection are skipped for `cooldown` seconds.
+    """
+
+    def __init__(self, pools, selection='round_robin', cooldown=10.0):
+        if selection not in ('round_robin', 'least_loaded'):
+            raise ValueError(f"Unknown replica selection: {selection}")
+        self.pools = pools
+        self.selection = selection
+        self.cooldown = cooldown
+        self._next = itertools.count()
+        self._down_until = {}
+
+    def candidates(self):
+        now = time.monotonic()
+        healthy = [p for p in self.pools if self._down_until.get(p.name, 0) <= now]
+        if self.selection == 'least_loaded':
+            return sorted(healthy, key=lambda p: p.stats()['in_use'])
+        if not healthy:
+            return []
+        offset = next(self._next) % len(healthy)
+        return healthy[offset:] + healthy[:offset]
+
+    def acquire(self, request_bound=False):
+        """Checks out a replica connection, or returns None if no replica is usable."""
+        for replica in self.candidates():
+            try:
+                return replica.acquire(request_bound=request_bound)
+            except (mysql.connector.Error, PoolTimeout) as err:
+                logger.warning(f"Replica {replica.name} unavailable for {self.cooldown:g}s: {err}")
+                self._down_until[replica.name] = time.monotonic() + self.cooldown
+        return None
+
+
+pool = make_pool('primary')
+replicas = ReplicaSet(
+    [make_pool(f'replica-{n}', **settings) for n, settings in enumerate(config.DB_REPLICAS)],
+    selection=config.DB_REPLICA_SELECTION,
+)
+
+
+def all_pools():
+    return [pool] + replicas.pools
+
+
+def reads_pinned_to_primary():
+    """True while the current session is within DB_READ_AFTER_WRITE_SECONDS of its last commit."""
+    return session.get('db_primary_until', 0) > time.time()
+
+
+def mark_session_wrote():
+    # Token-authenticated API clients have no session; their reads after a write use the primary
+    if has_request_context() and not g.get('stateless_client'):
+        session['db_primary_until'] = time.time() + config.DB_READ_AFTER_WRITE_SECONDS
+
+
+def get_db_connection(readonly=False):
+    """
+    Returns the pooled connection bound to the current request, borrowing one on
+    first use. Every later call in the same request gets the same connection, and
+    it is returned to the pool in teardown. Returns None if the database is
+    unreachable or the pool is exhausted.
+
+    `readonly=True` callers may be served by a read replica instead, unless this
+    request already holds a primary connection or the session committed a write
+    in the last DB_READ_AFTER_WRITE_SECONDS (so riders see their own writes).
+    Read connections fall back to the primary when no replica is usable.
+    """
+    if 'db_conn' in g:
+        return g.db_conn
+    if readonly and replicas.pools and not reads_pinned_to_primary():
+        if 'db_read_conn' in g:
+            return g.db_read_conn
+        conn = replicas.acquire(request_bound=True)
+        if conn is not None:
+            g.db_read_conn = conn
+            return conn
+    try:
+        conn = pool.acquire(request_bound=True)
+    except (mysql.connector.Error, PoolTimeout) as err:
+        logger.error(f"Database Connection Error: {err}")
+        return None
+    g.db_conn = conn
+    return conn
+
+
+def release_db_connection(exc=None):
+    for key in ('db_conn', 'db_read_conn'):
+        conn = g.pop(key, None)
+        if conn is not None:
+            conn.release()
+
+
+def init_app(app):
+    """
+    Returns each request's borrowed connections to the pools when the request
+    ends, and pins a session's reads to the primary after it commits.
+    """
+    app.teardown_appcontext(release_db_connection)
+    if replicas.pools:
+        pool.on_commit = mark_session_wrote
@@ -0,0 +1,317 @@
+# fares.py
+#
+# Stops, routes and the zone fare matrix, held in memory as an immutable FareTable.
+# The table is built from the stops / zone_fares / routes tables (migration 0006)
+# when the process starts. It keeps each stop's zone, a bitmask of its routes and
+# the small zone x zone fare matrix, so its size grows with the number of stops
+# (not stop pairs) and a lookup is still O(1): two dict hits, a mask test and an
+# index. Admin edits bump fare_config.version; each process notices within
+# FARES_REFRESH_SECONDS, rebuilds the table on a background thread and swaps it
+# in with a single assignment, so requests never wait on a rebuild and readers
+# never see a half-loaded table.
+
+import os
+import time
+import threading
+from array import array
+from decimal import Decimal
+from collections import namedtuple
+
+import mysql.connector
+
+from config import FARES_REFRESH_SECONDS
+from db import pool as db_pool, PoolTimeout
+from metrics import registry
+
+Stop = namedtuple('Stop', 'id name zone active')
+Route = namedtuple('Route', 'id code name active stops')
+
+# Used until migration 0006 has been applied (the stops the app used to hardcode)
+DEFAULT_STOPS = [
+    "Majestic", "Jayanagar", "Whitefield", "Koramangala",
+    "Electronic City", "Indiranagar", "Marathahalli", "Yeshwanthpur"
+]
+DEFAULT_FARE = Decimal('500.00')
+NOT_SERVED = -1
+
+
+class FareTable:
+    """
+    Read-only fares for one configuration version. `zone_fares` maps
+    (low zone, high zone) -> Decimal; stops and routes are lists of Stop / Route.
+    """
+
+    def __init__(self, version, stops, zone_fares, routes):
+        self.version = version
+        self.stops = stops
+        self.zone_fares = zone_fares
+        self.routes = routes
+        self.index = {stop.name: i for i, stop in enumerate(stops)}
+        self.stop_names = [stop.name for stop in stops]
+        self.active_stop_names = [stop.name for stop in stops if stop.active]
+        self.zones = sorted({stop.zone for stop in stops} | {zone for pair in zone_fares for zone in pair})
+
+        # Fares in paise, row-major by (zone index, zone index), both orders filled
+        zone_index = {zone: k for k, zone in enumerate(self.zones)}
+        self._z = z = len(self.zones)
+        self._zone_fares = array('q', [NOT_SERVED]) * (z * z)
+        for (a, b), amount in zone_fares.items():
+            self._zone_fares[zone_index[a] * z + zone_index[b]] = int(amount * 100)
+            self._zone_fares[zone_index[b] * z + zone_index[a]] = int(amount * 100)
+        # Zone index of each stop, NOT_SERVED for inactive stops
+        self._stop_zone = array('i', (zone_index[stop.zone] if stop.active else NOT_SERVED for stop in stops))
+
+        # Bitmask of the active routes each stop is on; None when no route is
+        # active, in which case every pair of active stops is served
+        active_routes = [route for route in routes if route.active]
+        self._stop_routes = None
+        if active_routes:
+            self._stop_routes = [0] * len(stops)
+            for bit, route in enumerate(active_routes):
+                for name in route.stops:
+                    i = self.index.get(name)
+                    if i is not None:
+                        self._stop_routes[i] |= 1 << bit
+
+        self._min_fare = self._lowest_fare(active_routes)
+        self._form_data = self._client_data(active_routes)
+
+    def _lowest_fare(self, active_routes):
+        """Cheapest fare of any pair of stops actually sold."""
+        groups = [route.stops for route in active_routes] if active_routes else [self.stop_names]
+        lowest = None
+        for names in groups:
+            # Active stops per zone index on this route (or overall)
+            counts = {}
+            for name in set(names):
+                i = self.index.get(name)
+                if i is not None and self._stop_zone[i] != NOT_SERVED:
+                    counts[self._stop_zone[i]] = counts.get(self._stop_zone[i], 0) + 1
+            for a in counts:
+                for b in counts:
+                    if a > b or (a == b and counts[a] < 2):
+                        continue
+                    paise = self._zone_fares[a * self._z + b]
+                    if paise != NOT_SERVED and (lowest is None or paise < lowest):
+                        lowest = paise
+        return None if lowest is None else Decimal(lowest).scaleb(-2)
+
+    def _client_data(self, active_routes):
+        """Stop zones, route membership and zone fares: what a client needs to price any pair itself."""
+        zones = {stop.name: stop.zone for stop in self.stops if stop.active}
+        stop_routes = None
+        if active_routes:
+            stop_routes = {name: [] for name in zones}
+            for route in active_routes:
+                for name in dict.fromkeys(route.stops):
+                    if name in stop_routes:
+                        stop_routes[name].append(route.code)
+        return {
+            'zones': zones,
+            'routes': stop_routes,
+            'fares': {f"{a}|{b}": f"{amount:.2f}" for (a, b), amount in sorted(self.zone_fares.items())},
+        }
+
+    def fare(self, start, end):
+        """Fare for a pass between two stop names, or None if that pair is not sold."""
+        i = self.index.get(start)
+        j = self.index.get(end)
+        if i is None or j is None or i == j:
+            return None
+        zi, zj = self._stop_zone[i], self._stop_zone[j]
+        if zi == NOT_SERVED or zj == NOT_SERVED:
+            return None
+        if self._stop_routes is not None and not self._stop_routes[i] & self._stop_routes[j]:
+            return None
+        paise = self._zone_fares[zi * self._z + zj]
+        return None if paise == NOT_SERVED else Decimal(paise).scaleb(-2)
+
+    def min_fare(self):
+        return self._min_fare
+
+    def form_data(self):
+        """
+        Fare data for the apply form and /api/v1/stops (shared; do not modify):
+        'zones' maps each active stop to its zone, 'routes' each active stop to
+        the codes of its active routes (None when no route is active, so any two
+        stops are served), and 'fares' maps 'low zone|high zone' to the amount.
+        A pair is sold if its stops differ, share a route and their zones have a fare.
+        """
+        return self._form_data
+
+    @classmethod
+    def default(cls):
+        stops = [Stop(None, name, 1, True) for name in DEFAULT_STOPS]
+        return cls(None, stops, {(1, 1): DEFAULT_FARE}, [])
+
+
+def load_table(conn):
+    """Reads the current configuration into a new FareTable."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT version FROM fare_config WHERE id = 1")
+        row = cursor.fetchone()
+        version = row[0] if row else 0
+        cursor.execute("SELECT id, name, zone, active FROM stops ORDER BY name")
+        stops = [Stop(id, name, zone, bool(active)) for id, name, zone, active in cursor.fetchall()]
+        cursor.execute("SELECT from_zone, to_zone, amount FROM zone_fares")
+        zone_fares = {(min(a, b), max(a, b)): Decimal(amount) for a, b, amount in cursor.fetchall()}
+        cursor.execute(
+            "SELECT r.id, r.code, r.name, r.active, s.name FROM routes r "
+            "LEFT JOIN route_stops rs ON rs.route_id = r.id LEFT JOIN stops s ON s.id = rs.stop_id "
+            "ORDER BY r.code, rs.position"
+        )
+        routes = {}
+        for route_id, code, name, active, stop_name in cursor.fetchall():
+            route = routes.setdefault(route_id, Route(route_id, code, name, bool(active), []))
+            if stop_name is not None:
+                route.stops.append(stop_name)
+        return FareTable(version, stops, zone_fares, list(routes.values()))
+    finally:
+        cursor.close()
+
+
+def read_version(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT version FROM fare_config WHERE id = 1")
+        row = cursor.fetchone()
+        return row[0] if row else 0
+    finally:
+        cursor.close()
+
+
+def bump_version(cursor):
+    """Call inside the transaction of any edit to stops, routes or fares."""
+    cursor.execute("UPDATE fare_config SET version = version + 1 WHERE id = 1")
+
+
+def save_zone_fares(cursor, fares):
+    """`fares` maps (zone, zone) -> Decimal, or None to stop selling that zone pair."""
+    fares = {(min(a, b), max(a, b)): amount for (a, b), amount in fares.items()}
+    cleared = sorted(pair for pair, amount in fares.items() if amount is None)
+    priced = sorted((a, b, amount) for (a, b), amount in fares.items() if amount is not None)
+    if cleared:
+        cursor.executemany("DELETE FROM zone_fares WHERE from_zone = %s AND to_zone = %s", cleared)
+    if priced:
+        cursor.executemany(
+            "INSERT INTO zone_fares (from_zone, to_zone, amount) VALUES (%s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE amount = VALUES(amount)",
+            priced
+        )
+    bump_version(cursor)
+
+
+def save_stop(cursor, name, zone, active):
+    """Adds a stop, or updates the zone and active flag of an existing one."""
+    cursor.execute(
+        "INSERT INTO stops (name, zone, active) VALUES (%s, %s, %s) "
+        "ON DUPLICATE KEY UPDATE zone = VALUES(zone), active = VALUES(active)",
+        (name, zone, active)
+    )
+    bump_version(cursor)
+
+
+def save_route(cursor, code, name, active, stop_ids):
+    """Adds or replaces a route and its ordered stops."""
+    cursor.execute(
+        "INSERT INTO routes (code, name, active) VALUES (%s, %s, %s) "
+        "ON DUPLICATE KEY UPDATE name = VALUES(name), active = VALUES(active)",
+        (code, name, active)
+    )
+    cursor.execute("SELECT id FROM routes WHERE code = %s", (code,))
+    route_id = cursor.fetchone()[0]
+    cursor.execute("DELETE FROM route_stops WHERE route_id = %s", (route_id,))
+    if stop_ids:
+        cursor.executemany(
+            "INSERT INTO route_stops (route_id, position, stop_id) VALUES (%s, %s, %s)",
+            [(route_id, position, stop_id) for position, stop_id in enumerate(stop_ids, start=1)]
+        )
+    bump_version(cursor)
+
+
+class FareStore:
+    """
+    Holds the live FareTable. Tables are built by reload(): at startup, after an
+    admin edit, and on a background thread when a version check (at most every
+    refresh_seconds) finds fare_config.version has moved. Requests only read the
+    current reference.
+    """
+
+    def __init__(self, refresh_seconds, logger=None):
+        self.refresh_seconds = refresh_seconds
+        self.logger = logger
+        self._table = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        # Pid of the process whose refresh thread is running, if any; a forked
+        # child does not inherit the thread, so it may start its own
+        self._refreshing = None
+
+    def reload(self):
+        """Rebuilds the table from the database now; keeps the old one if that fails."""
+        with self._lock:
+            self._reload_locked()
+        return self._table
+
+    def _reload_locked(self):
+        try:
+            with db_pool.connection() as conn:
+                table = load_table(conn)
+        except (mysql.connector.Error, PoolTimeout) as err:
+            if self._table is None:
+                self._table = FareTable.default()
+            if self.logger:
+                self.logger.warning(f"Fare table not loaded, keeping version {self._table.version}: {err}")
+        else:
+            self._table = table
+        self._next_check = time.monotonic() + self.refresh_seconds
+
+    def current(self):
+        """The live FareTable; starts a background check for a newer version when one is due."""
+        table = self._table
+        if table is None:
+            # Not loaded at startup (init_app was not called): load once, inline
+            with self._lock:
+                if self._table is None:
+                    self._reload_locked()
+                return self._table
+        if time.monotonic() >= self._next_check:
+            self._start_refresh()
+        return table
+
+    def _start_refresh(self):
+        pid = os.getpid()
+        with self._lock:
+            if self._refreshing == pid or time.monotonic() < self._next_check:
+                return
+            self._refreshing = pid
+            self._next_check = time.monotonic() + self.refresh_seconds
+        threading.Thread(target=self._refresh, name='fare-refresh', daemon=True).start()
+
+    def _refresh(self):
+        try:
+            try:
+                with db_pool.connection() as conn:
+                    changed = read_version(conn) != self._table.version
+            except (mysql.connector.Error, PoolTimeout):
+                changed = self._table.version is None
+            if changed:
+                self.reload()
+        finally:
+            self._refreshing = None
+
+
+store = FareStore(FARES_REFRESH_SECONDS)
+
+
+def current():
+    return store.current()
+
+
+def init_app(app):
+    store.logger = app.logger
+    store.reload()
+    registry.add_collector(
+        'fare_table_version', 'fare_config version of the fare table this process serves.',
+        lambda: (store._table.version or 0) if store._table else 0)
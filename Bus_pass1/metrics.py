@@ -0,0 +1,312 @@
+# metrics.py
+#
+# In-process request, query and render timings exposed in the Prometheus text
+# format at /metrics. Values are per process: with several workers, scrape each
+# one (or put them behind a target per worker).
+
+import re
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+
+from flask import g, request, Response, abort
+
+from config import METRICS_ALLOWED_IPS, SLOW_QUERY_THRESHOLD
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000)
+
+slow_query_log = logging.getLogger('bus_pass.slow_query')
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f'{self.name}{_format_labels(self.labels, key)} {value}'
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        names = self.labels + ('le',)
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield f'{self.name}_bucket{_format_labels(names, key + (bound,))} {cumulative}'
+            yield f'{self.name}_bucket{_format_labels(names, key + ("+Inf",))} {series[-1]}'
+            yield f'{self.name}_sum{_format_labels(self.labels, key)} {series[-2]}'
+            yield f'{self.name}_count{_format_labels(self.labels, key)} {series[-1]}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, name, help, collect, type='gauge', labels=()):
+        """`collect()` returns {label values tuple (or value for no labels): number}, read at scrape time."""
+        self._collectors.append((name, help, collect, type, tuple(labels)))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, help, collect, type, labels in self._collectors:
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {type}')
+            try:
+                values = collect()
+            except Exception:
+                continue
+            if not isinstance(values, dict):
+                values = {(): values}
+            for key, value in sorted(values.items()):
+                key = key if isinstance(key, tuple) else (key,)
+                lines.append(f'{name}{_format_labels(labels, key)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    'http_request_duration_seconds', 'Request latency by endpoint.', ('endpoint', 'method', 'status')))
+db_query_duration = registry.register(Histogram(
+    'db_query_duration_seconds', 'SQL statement latency by statement kind and table.', ('statement',)))
+db_query_rows = registry.register(Histogram(
+    'db_query_rows', 'Rows affected (writes) or in the result (reads) per statement.', ('statement',),
+    buckets=ROW_BUCKETS))
+db_slow_queries = registry.register(Counter(
+    'db_slow_queries_total', f'Statements slower than {SLOW_QUERY_THRESHOLD}s.', ('statement',)))
+db_connect_duration = registry.register(Histogram(
+    'db_connect_duration_seconds', 'Time to open a new MySQL connection.'))
+db_checkout_duration = registry.register(Histogram(
+    'db_checkout_duration_seconds', 'Time to borrow a pooled connection, including pool waits and pings.'))
+password_hash_duration = registry.register(Histogram(
+    'password_hash_duration_seconds', 'Password hashing and verification time.', ('operation',)))
+qr_render_duration = registry.register(Histogram(
+    'qr_render_duration_seconds', 'QR code rendering time (in-process images and worker batches).', ('kind',)))
+
+
+_VERB_RE = re.compile(r'[\s(]*(\w+)')
+# Keyword preceding the main table name for each statement kind
+_TABLE_KEYWORDS = {
+    'SELECT': 'FROM', 'DELETE': 'FROM', 'INSERT': 'INTO', 'REPLACE': 'INTO',
+    'UPDATE': 'UPDATE', 'CREATE': 'TABLE', 'ALTER': 'TABLE', 'DROP': 'TABLE',
+}
+
+
+def statement_label(sql: str) -> str:
+    """Low-cardinality label for a statement, eg. 'SELECT applications'."""
+    match = _VERB_RE.match(sql)
+    if not match:
+        return 'OTHER'
+    verb = match.group(1).upper()
+    keyword = _TABLE_KEYWORDS.get(verb)
+    if keyword is None:
+        return verb
+    table = re.search(rf'\b{keyword}\s+`?(\w+)', sql, re.IGNORECASE)
+    return f'{verb} {table.group(1)}' if table else verb
+
+
+def _record_statement(sql, elapsed, rows):
+    label = statement_label(sql)
+    db_query_duration.observe(elapsed, statement=label)
+    if rows is not None and rows >= 0:
+        db_query_rows.observe(rows, statement=label)
+    if elapsed >= SLOW_QUERY_THRESHOLD:
+        db_slow_queries.inc(statement=label)
+        slow_query_log.warning("slow query (%.3fs, %s rows): %s", elapsed, rows, ' '.join(sql.split())[:2000])
+
+
+class InstrumentedCursor:
+    """
+    Proxy around a mysql.connector cursor timing each statement. A read's time
+    includes fetching its rows and is recorded once the result is consumed (or
+    the next statement runs); writes record `rowcount` immediately. Parameters
+    are never logged.
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._pending = None  # (sql, elapsed, rows fetched so far) for a read being consumed
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        # Streams from the wrapped cursor's own iterator, timing each row as it is read
+        rows = iter(self._cursor)
+        while True:
+            started = time.perf_counter()
+            row = next(rows, None)
+            self._fetched(row is not None, started, row is None)
+            if row is None:
+                return
+            yield row
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _flush(self):
+        if self._pending is not None:
+            _record_statement(*self._pending)
+            self._pending = None
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        self._flush()
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            if getattr(self._cursor, 'with_rows', False):
+                self._pending = [operation, elapsed, 0]
+            else:
+                _record_statement(operation, elapsed, self._cursor.rowcount)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        self._flush()
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            _record_statement(operation, time.perf_counter() - started, self._cursor.rowcount)
+
+    def _fetched(self, rows, started, done):
+        if self._pending is not None:
+            self._pending[1] += time.perf_counter() - started
+            self._pending[2] += rows
+            if done:
+                self._flush()
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._fetched(row is not None, started, row is None)
+        return row
+
+    def fetchmany(self, size=1):
+        started = time.perf_counter()
+        rows = self._cursor.fetchmany(size)
+        self._fetched(len(rows), started, len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._fetched(len(rows), started, True)
+        return rows
+
+    def close(self):
+        self._flush()
+        return self._cursor.close()
+
+
+def _before_request():
+    g.request_started = time.perf_counter()
+
+
+def _after_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        http_request_duration.observe(
+            time.perf_counter() - started,
+            endpoint=request.endpoint or 'unmatched',
+            method=request.method,
+            status=response.status_code,
+        )
+    return response
+
+
+def metrics_view():
+    if METRICS_ALLOWED_IPS is not None and request.remote_addr not in METRICS_ALLOWED_IPS:
+        abort(404)
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+def init_app(app, pools):
+    """Installs request timing, instruments the cursors of `pools` and adds /metrics."""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    for pool in pools:
+        pool.cursor_wrapper = InstrumentedCursor
+        pool.connect_observer = db_connect_duration.observe
+        pool.checkout_observer = db_checkout_duration.observe
+
+    def pool_stat(*keys):
+        return lambda: {(pool.name,) + ((key,) if len(keys) > 1 else ()): pool.stats()[key]
+                        for pool in pools for key in keys}
+
+    registry.add_collector(
+        'db_pool_connections', 'Pool connections by state.',
+        pool_stat('open', 'idle', 'in_use'), labels=('pool', 'state'))
+    registry.add_collector(
+        'db_pool_waits_total', 'Checkouts that had to wait for a free connection.',
+        pool_stat('waits'), type='counter', labels=('pool',))
+    registry.add_collector(
+        'db_pool_timeouts_total', 'Checkouts that gave up waiting.',
+        pool_stat('timeouts'), type='counter', labels=('pool',))
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
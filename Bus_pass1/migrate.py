@@ -0,0 +1,179 @@
+# migrate.py
+
+import os
+import re
+
+import click
+from flask.cli import AppGroup
+
+from db import pool as db_pool
+from applications import PASS_ROW_QUERY, LATEST_APPLICATION_QUERY
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+MIGRATION_FILE_RE = re.compile(r'^(\d{4})_([\w-]+)\.sql$')
+
+# Queries the app issues on hot paths, with representative parameters. The rider
+# queries are the app's own constants; keep the rest in sync with app.py.
+# `flask db check-plans` fails if any of them scans a whole table.
+PLAN_CHECKED_QUERIES = {
+    'latest_application': (LATEST_APPLICATION_QUERY, (1,)),
+    'pass_row': (PASS_ROW_QUERY, (1,)),
+    'dashboard_pending_count': (
+        "SELECT COUNT(id) FROM applications WHERE payment_status = 'COMPLETED' AND status = 'PENDING'",
+        (),
+    ),
+    'expiry_sweep': (
+        "SELECT id, user_id, pass_number FROM applications "
+        "WHERE status = 'APPROVED' AND valid_until < %s ORDER BY valid_until, id LIMIT 500",
+        ('2025-01-01',),
+    ),
+    'admin_applications': (
+        "SELECT a.id, a.application_date, a.status, u.name FROM applications a "
+        "JOIN users u ON a.user_id = u.id WHERE a.payment_status = 'COMPLETED' "
+        "ORDER BY a.application_date ASC, a.id ASC LIMIT 51",
+        (),
+    ),
+    'admin_applications_by_status': (
+        "SELECT a.id, a.application_date, a.status, u.name FROM applications a "
+        "JOIN users u ON a.user_id = u.id WHERE a.payment_status = 'COMPLETED' AND a.status = %s "
+        "AND (a.application_date > %s OR (a.application_date = %s AND a.id > %s)) "
+        "ORDER BY a.application_date ASC, a.id ASC LIMIT 51",
+        ('PENDING', '2025-01-01', '2025-01-01', 0),
+    ),
+    'audit_by_application': (
+        "SELECT id, created_at, event, application_id, user_id, actor, detail FROM audit_events "
+        "WHERE application_id = %s AND id < %s ORDER BY id DESC LIMIT 50",
+        (1, 1000000),
+    ),
+    'audit_by_user': (
+        "SELECT id, created_at, event, application_id, user_id, actor, detail FROM audit_events "
+        "WHERE user_id = %s ORDER BY id DESC LIMIT 50",
+        (1,),
+    ),
+}
+
+# EXPLAIN access types that read every row of the table (or of an entire index)
+FULL_SCAN_TYPES = {'ALL', 'index'}
+
+
+def discover_migrations():
+    """Returns [(version, name, path)] for every numbered script, in version order."""
+    found = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = MIGRATION_FILE_RE.match(filename)
+        if match:
+            found.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    return found
+
+
+def split_statements(sql: str):
+    """Splits a migration script into statements; `--` comment lines are dropped."""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith('--')]
+    return [stmt.strip() for stmt in '\n'.join(lines).split(';') if stmt.strip()]
+
+
+def ensure_version_table(cursor):
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+
+
+def applied_versions(cursor):
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def upgrade(conn, echo=print):
+    """
+    Applies every migration newer than the recorded schema version, in order.
+    Safe to run repeatedly: already-applied versions are skipped. Returns the
+    list of versions applied by this call.
+    """
+    cursor = conn.cursor()
+    applied = []
+    try:
+        ensure_version_table(cursor)
+        done = applied_versions(cursor)
+        for version, name, path in discover_migrations():
+            if version in done:
+                continue
+            echo(f"Applying {version:04d}_{name} ...")
+            with open(path, encoding='utf-8') as fh:
+                statements = split_statements(fh.read())
+            # MySQL DDL commits implicitly, so a migration is only recorded once every
+            # statement in it has succeeded.
+            for stmt in statements:
+                cursor.execute(stmt)
+            cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+            conn.commit()
+            applied.append(version)
+    finally:
+        cursor.close()
+    return applied
+
+
+def check_query_plans(conn):
+    """
+    Runs EXPLAIN on each PLAN_CHECKED_QUERIES entry and returns a list of
+    (query_name, table, access_type) for every full table/index scan found.
+    Meaningful only on a database with realistic row counts: on near-empty tables
+    the optimizer may legitimately prefer a scan.
+    """
+    problems = []
+    cursor = conn.cursor(dictionary=True)
+    try:
+        for name, (sql, params) in PLAN_CHECKED_QUERIES.items():
+            cursor.execute("EXPLAIN " + sql, params)
+            for row in cursor.fetchall():
+                if row.get('type') in FULL_SCAN_TYPES:
+                    problems.append((name, row.get('table'), row.get('type')))
+    finally:
+        cursor.close()
+    return problems
+
+
+db_cli = AppGroup('db', help='Database schema migrations.')
+
+
+@db_cli.command('upgrade')
+def upgrade_command():
+    """Apply all pending migrations."""
+    with db_pool.connection() as conn:
+        applied = upgrade(conn, echo=click.echo)
+    click.echo(f"Applied {len(applied)} migration(s)." if applied else "Database is up to date.")
+
+
+@db_cli.command('status')
+def status_command():
+    """Show applied and pending migrations."""
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            ensure_version_table(cursor)
+            done = applied_versions(cursor)
+        finally:
+            cursor.close()
+    for version, name, _ in discover_migrations():
+        click.echo(f"{version:04d}_{name}: {'applied' if version in done else 'pending'}")
+
+
+@db_cli.command('check-plans')
+def check_plans_command():
+    """Fail if any hot query does a full table scan."""
+    with db_pool.connection() as conn:
+        problems = check_query_plans(conn)
+    for name, table, access_type in problems:
+        click.echo(f"FULL SCAN: {name} reads table '{table}' with access type {access_type}", err=True)
+    if problems:
+        raise SystemExit(1)
+    click.echo(f"All {len(PLAN_CHECKED_QUERIES)} checked queries use indexes.")
+
+
+def init_app(app):
+    app.cli.add_command(db_cli)
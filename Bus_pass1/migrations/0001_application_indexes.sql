@@ -0,0 +1,13 @@
+-- 0001: indexes for the hot applications queries
+
+-- Latest application per rider (apply_pass, digital_pass latest-status lookup)
+CREATE INDEX idx_applications_user_date ON applications (user_id, application_date);
+
+-- Latest APPROVED pass per rider (digital_pass)
+CREATE INDEX idx_applications_user_status_date ON applications (user_id, status, application_date);
+
+-- Admin review queue and dashboard count (payment_status + status, in date order)
+CREATE INDEX idx_applications_review ON applications (payment_status, status, application_date);
+
+-- Admin listing without a status filter (paid applications in date order)
+CREATE INDEX idx_applications_paid_date ON applications (payment_status, application_date);
@@ -0,0 +1,22 @@
+-- 0002: background QR rendering queue (see qr_jobs.py)
+
+CREATE TABLE qr_jobs (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    pass_number VARCHAR(50) NOT NULL UNIQUE,
+    application_id INT NOT NULL,
+    payload VARCHAR(512) NOT NULL,
+    status ENUM('QUEUED', 'RUNNING', 'DONE', 'FAILED') NOT NULL DEFAULT 'QUEUED',
+    attempts INT NOT NULL DEFAULT 0,
+    last_error VARCHAR(255),
+    enqueued_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    run_after TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    started_at TIMESTAMP(6) NULL,
+    finished_at TIMESTAMP(6) NULL,
+    FOREIGN KEY (application_id) REFERENCES applications(id)
+);
+
+-- Worker claim query and queue-depth counts
+CREATE INDEX idx_qr_jobs_claim ON qr_jobs (status, run_after);
+
+-- Recent job latency
+CREATE INDEX idx_qr_jobs_finished ON qr_jobs (status, finished_at);
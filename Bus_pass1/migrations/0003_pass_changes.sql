@@ -0,0 +1,17 @@
+-- 0003: change log of the active pass set, used for validator delta sync (see validation_snapshot.py)
+
+CREATE TABLE pass_changes (
+    seq BIGINT AUTO_INCREMENT PRIMARY KEY,
+    pass_number VARCHAR(50) NOT NULL,
+    op ENUM('ADD', 'REMOVE') NOT NULL,
+    start_point VARCHAR(100),
+    end_point VARCHAR(100),
+    valid_until DATE,
+    changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Pruning old changes
+CREATE INDEX idx_pass_changes_changed_at ON pass_changes (changed_at);
+
+-- Full snapshot build reads every APPROVED pass
+CREATE INDEX idx_applications_status ON applications (status);
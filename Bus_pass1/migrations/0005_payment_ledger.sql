@@ -0,0 +1,17 @@
+-- 0005: payment gateway notifications ledger (see payments.py)
+-- One row per distinct idempotency key; the unique key makes replays no-ops.
+
+CREATE TABLE payment_ledger (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    idempotency_key VARCHAR(100) NOT NULL UNIQUE,
+    application_id INT NOT NULL,
+    event ENUM('succeeded', 'failed') NOT NULL,
+    amount DECIMAL(10, 2),
+    gateway_ref VARCHAR(100),
+    outcome ENUM('applied', 'ignored', 'rejected') NOT NULL,
+    detail VARCHAR(100),
+    received_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6)
+);
+
+-- Payment history per application
+CREATE INDEX idx_payment_ledger_application ON payment_ledger (application_id, received_at);
@@ -0,0 +1,54 @@
+-- 0006: stops, routes and zone fares, loaded into memory by fares.py
+-- zone_fares is symmetric and stored with from_zone <= to_zone. fare_config.version
+-- is bumped on every edit so running processes know to reload.
+
+CREATE TABLE stops (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(100) NOT NULL UNIQUE,
+    zone TINYINT UNSIGNED NOT NULL,
+    active BOOLEAN NOT NULL DEFAULT TRUE
+);
+
+CREATE TABLE zone_fares (
+    from_zone TINYINT UNSIGNED NOT NULL,
+    to_zone TINYINT UNSIGNED NOT NULL,
+    amount DECIMAL(10, 2) NOT NULL,
+    PRIMARY KEY (from_zone, to_zone)
+);
+
+-- While no route is active every pair of active stops is served; once routes exist,
+-- only stops sharing an active route can be combined on a pass.
+CREATE TABLE routes (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    code VARCHAR(20) NOT NULL UNIQUE,
+    name VARCHAR(100) NOT NULL,
+    active BOOLEAN NOT NULL DEFAULT TRUE
+);
+
+CREATE TABLE route_stops (
+    route_id INT NOT NULL,
+    position SMALLINT UNSIGNED NOT NULL,
+    stop_id INT NOT NULL,
+    PRIMARY KEY (route_id, position),
+    UNIQUE KEY uq_route_stop (route_id, stop_id),
+    FOREIGN KEY (route_id) REFERENCES routes(id) ON DELETE CASCADE,
+    FOREIGN KEY (stop_id) REFERENCES stops(id)
+);
+
+CREATE TABLE fare_config (
+    id TINYINT PRIMARY KEY,
+    version BIGINT NOT NULL
+);
+
+-- The previously hardcoded stops; every zone pair starts at the old flat fare
+INSERT INTO stops (name, zone) VALUES
+    ('Majestic', 1),
+    ('Jayanagar', 2), ('Koramangala', 2), ('Indiranagar', 2), ('Yeshwanthpur', 2),
+    ('Whitefield', 3), ('Electronic City', 3), ('Marathahalli', 3);
+
+INSERT INTO zone_fares (from_zone, to_zone, amount) VALUES
+    (1, 1, 500.00), (1, 2, 500.00), (1, 3, 500.00),
+    (2, 2, 500.00), (2, 3, 500.00),
+    (3, 3, 500.00);
+
+INSERT INTO fare_config (id, version) VALUES (1, 1);
@@ -0,0 +1,22 @@
+-- 0007: stored pass validity, expiry and opt-in renewals (see pass_schedule.py)
+
+ALTER TABLE applications
+    MODIFY status ENUM('PENDING', 'PAID', 'APPROVED', 'REJECTED', 'EXPIRED') DEFAULT 'PENDING',
+    ADD COLUMN valid_from DATE NULL,
+    ADD COLUMN valid_until DATE NULL,
+    ADD COLUMN renewal_of INT NULL,
+    -- A pass is renewed at most once, so overlapping scheduler runs cannot double-renew
+    ADD UNIQUE KEY uq_applications_renewal_of (renewal_of);
+
+ALTER TABLE users ADD COLUMN auto_renew BOOLEAN NOT NULL DEFAULT FALSE;
+
+-- Windows of already issued passes, as pass_tokens.pass_validity_window() computed them
+UPDATE applications
+SET valid_from = DATE(application_date),
+    valid_until = LAST_DAY(DATE(application_date) + INTERVAL 1 MONTH)
+WHERE status = 'APPROVED';
+
+-- Expiry sweep and renewal scan read APPROVED passes in valid_until order; this also
+-- serves the snapshot's status = 'APPROVED' lookup, so the 0003 index is redundant
+CREATE INDEX idx_applications_status_valid_until ON applications (status, valid_until);
+DROP INDEX idx_applications_status ON applications;
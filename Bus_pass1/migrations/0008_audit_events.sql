@@ -0,0 +1,18 @@
+-- 0008: append-only audit log of application and pass transitions (see audit.py)
+-- Rows are only ever inserted, in batches by a background writer; created_at is when
+-- the transition committed, not when its batch was written. There are no foreign keys,
+-- so history outlives the rows it describes.
+
+CREATE TABLE audit_events (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    created_at DATETIME(6) NOT NULL,
+    event VARCHAR(40) NOT NULL,
+    application_id INT NULL,
+    user_id INT NULL,
+    actor VARCHAR(40) NOT NULL,
+    detail JSON NULL
+);
+
+-- History of one application or one rider, newest first
+CREATE INDEX idx_audit_events_application ON audit_events (application_id, id);
+CREATE INDEX idx_audit_events_user ON audit_events (user_id, id);
@@ -0,0 +1,10 @@
+-- 0009: single-row sequence for pass_changes.seq (see validation_snapshot.record_pass_changes)
+-- Writers take their seqs by updating this row, whose lock they hold until commit, so
+-- change log entries commit in seq order and MAX(seq) is always a safe sync watermark.
+
+CREATE TABLE pass_change_seq (
+    id TINYINT PRIMARY KEY,
+    seq BIGINT NOT NULL
+);
+
+INSERT INTO pass_change_seq (id, seq) SELECT 1, COALESCE(MAX(seq), 0) FROM pass_changes;
@@ -0,0 +1,255 @@
+# pass_cache.py
+#
+# Per-user cache of the row shown on the digital pass page. Without a shared
+# backend entries live in a per-process LRU; with PASS_CACHE_URL set they live
+# only in the shared store, so an invalidation made by any worker is seen by all.
+#
+# Every key has a version that invalidate() moves on. A lookup that misses
+# remembers the version it saw, and its loaded row is only ever served while that
+# version is still current, so a load that raced an invalidation (in any worker)
+# can never put a stale pass back in front of the rider. Versions are per user:
+# invalidating one rider does not discard loads in flight for anyone else.
+
+import time
+import pickle
+import threading
+from collections import OrderedDict
+
+from config import PASS_CACHE_TTL, PASS_CACHE_MAX_ITEMS, PASS_CACHE_URL
+
+KEY_PREFIX = 'pass:'
+VERSION_PREFIX = 'pass-version:'
+# Stored in place of an invalidated entry until it is reloaded, so the reload can
+# go to the primary rather than a possibly lagging replica
+CHANGED = '__changed__'
+
+
+class TTLCache:
+    """
+    Thread-safe in-process LRU cache whose entries expire after `ttl` seconds.
+    Stores are compare-and-set under the lock: each entry carries a version from
+    a process-wide clock, and store() only succeeds if the entry still has the
+    version lookup() returned.
+    """
+
+    def __init__(self, max_items, ttl):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires, value, version)
+        self._lock = threading.Lock()
+        self._clock = 0
+        # Moves on whenever an entry disappears, so a load that began on a missing
+        # key cannot write back over an invalidation whose marker was evicted
+        self._absent_epoch = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def _tick(self):
+        self._clock += 1
+        return self._clock
+
+    def _current(self, key, now):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= now:
+            del self._entries[key]
+            self._absent_epoch += 1
+            entry = None
+        return entry
+
+    def lookup(self, key):
+        """Returns (value or None, changed since last loaded, version for store())."""
+        with self._lock:
+            entry = self._current(key, time.monotonic())
+            if entry is None:
+                self.misses += 1
+                return None, False, ('absent', self._absent_epoch)
+            if entry[1] == CHANGED:
+                self.misses += 1
+                return None, True, entry[2]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], False, entry[2]
+
+    def store(self, key, value, version):
+        with self._lock:
+            entry = self._current(key, time.monotonic())
+            current = entry[2] if entry is not None else ('absent', self._absent_epoch)
+            if current != version:
+                return False
+            self._entries.pop(key, None)
+            self._put(key, value)
+            return True
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._put(key, CHANGED)
+
+    def _put(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value, self._tick())
+        while len(self._entries) > self.max_items:
+            self._entries.popitem(last=False)
+            self._absent_epoch += 1
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {'backend': 'local', 'items': len(self._entries), 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions}
+
+
+class LocalSharedStore:
+    """
+    In-memory stand-in for the subset of the redis client used here (get / mget /
+    set with `ex` / incr / expire / delete on bytes values), for tests and
+    single-host setups.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] <= time.monotonic():
+            del self._data[key]
+            return None
+        return entry[1]
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key)
+
+    def mget(self, keys):
+        with self._lock:
+            return [self._get(key) for key in keys]
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ex if ex else None, value)
+        return True
+
+    def incr(self, key):
+        with self._lock:
+            value = int(self._get(key) or 0) + 1
+            expires = self._data[key][0] if key in self._data else None
+            self._data[key] = (expires, str(value).encode())
+            return value
+
+    def expire(self, key, seconds):
+        with self._lock:
+            if self._get(key) is None:
+                return False
+            self._data[key] = (time.monotonic() + seconds, self._data[key][1])
+            return True
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(1 for key in keys if self._data.pop(key, None) is not None)
+
+
+class SharedCache:
+    """
+    Pickling adapter over a redis-like client; backend errors count as misses.
+
+    Each user has a version counter (VERSION_PREFIX key, bumped atomically with
+    INCR by invalidate()) and every entry is stored together with the version its
+    load started at. A lookup reads both in one MGET and treats an entry whose
+    version is not current as changed, so a stale write-back from any worker is
+    never served; no compare-and-set round trip is needed.
+    """
+
+    def __init__(self, client, ttl):
+        self.client = client
+        self.ttl = ttl
+        # Outlives any entry written at an older version, so a counter never
+        # restarts while such an entry could still be read
+        self.version_ttl = ttl * 10
+        self.hits = self.misses = self.errors = 0
+
+    def lookup(self, key):
+        try:
+            raw, version = self.client.mget([KEY_PREFIX + key, VERSION_PREFIX + key])
+        except Exception:
+            self.errors += 1
+            self.misses += 1
+            return None, False, None
+        version = int(version or 0)
+        if raw is None:
+            self.misses += 1
+            return None, False, version
+        entry_version, value = pickle.loads(raw)
+        if entry_version != version or value == CHANGED:
+            self.misses += 1
+            return None, True, version
+        self.hits += 1
+        return value, False, version
+
+    def store(self, key, value, version):
+        if version is None:
+            return False
+        try:
+            self.client.set(KEY_PREFIX + key, pickle.dumps((version, value)), ex=self.ttl)
+            return True
+        except Exception:
+            self.errors += 1
+            return False
+
+    def invalidate(self, key):
+        try:
+            version = self.client.incr(VERSION_PREFIX + key)
+            self.client.expire(VERSION_PREFIX + key, self.version_ttl)
+            # Marks the entry changed even if it had expired, so the reload goes to the primary
+            self.client.set(KEY_PREFIX + key, pickle.dumps((version, CHANGED)), ex=self.ttl)
+        except Exception:
+            # An entry at the old version still expires after PASS_CACHE_TTL
+            self.errors += 1
+
+    def stats(self):
+        return {'backend': type(self.client).__name__, 'hits': self.hits,
+                'misses': self.misses, 'errors': self.errors}
+
+
+def make_cache(url=PASS_CACHE_URL, ttl=PASS_CACHE_TTL, max_items=PASS_CACHE_MAX_ITEMS):
+    if not url:
+        return TTLCache(max_items, ttl)
+    if url.startswith('local://'):
+        return SharedCache(LocalSharedStore(), ttl)
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        import redis  # optional dependency, only needed for a redis backend
+        return SharedCache(redis.Redis.from_url(url), ttl)
+    raise ValueError(f"Unsupported PASS_CACHE_URL: {url}")
+
+
+class PassCache:
+    """
+    Caches each user's digital pass lookup. Callers invalidate() after committing
+    a change; a lookup that was in flight while that user was invalidated is
+    returned but never served from the cache afterwards (see the backends).
+
+    `loader(recently_changed)` is told whether the entry was invalidated since it
+    was last loaded, in which case it should read from the primary.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get_or_load(self, user_id, loader):
+        key = str(user_id)
+        value, changed, version = self.backend.lookup(key)
+        if value is not None:
+            return value
+        value = loader(changed)
+        self.backend.store(key, value, version)
+        return value
+
+    def invalidate(self, *user_ids):
+        for user_id in user_ids:
+            self.backend.invalidate(str(user_id))
+
+    def stats(self):
+        return self.backend.stats()
+
+
+pass_cache = PassCache(make_cache())
@@ -0,0 +1,189 @@
+# pass_schedule.py
+#
+# Background pass lifecycle jobs, run by `flask passes run` (or one-off with
+# `flask passes expire` / `flask passes renew`):
+#
+#   expire  APPROVED passes whose valid_until has passed become EXPIRED, in
+#           batches of PASS_EXPIRY_BATCH_SIZE rows, each its own short
+#           transaction, so the sweep never holds many row locks for long.
+#   renew   riders who opted in (users.auto_renew) get a PENDING renewal
+#           application, awaiting payment, PASS_RENEWAL_LEAD_DAYS before their
+#           pass ends. Renewals are inserted in multi-row batches; the unique
+#           renewal_of key means a pass is renewed at most once.
+#
+# Expiring keeps the APPROVED set (and every active-pass query and validator
+# snapshot built on it) proportional to the passes in use, not to history.
+
+import time
+import datetime
+
+import click
+import mysql.connector
+from flask.cli import AppGroup
+
+import counters
+import fares
+import validation_snapshot
+from audit import audit_log
+from config import (
+    PASS_EXPIRY_BATCH_SIZE, PASS_EXPIRY_BATCH_PAUSE, PASS_RENEWAL_BATCH_SIZE,
+    PASS_RENEWAL_LEAD_DAYS, PASS_SCHEDULER_INTERVAL,
+)
+from db import pool as db_pool
+from pass_cache import pass_cache
+from pass_tokens import renewal_validity_window
+
+
+def expire_passes(conn, today=None, batch_size=PASS_EXPIRY_BATCH_SIZE, pause=PASS_EXPIRY_BATCH_PAUSE):
+    """Expires every APPROVED pass that ended before `today`; returns the number expired."""
+    today = today or datetime.date.today()
+    expired = 0
+    cursor = conn.cursor()
+    try:
+        while True:
+            # Oldest first through idx_applications_status_valid_until; the batch's
+            # rows stay locked only until the commit below
+            cursor.execute(
+                "SELECT id, user_id, pass_number FROM applications "
+                "WHERE status = 'APPROVED' AND valid_until < %s "
+                "ORDER BY valid_until, id LIMIT %s FOR UPDATE",
+                (today, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            try:
+                cursor.execute(
+                    f"UPDATE applications SET status = 'EXPIRED' "
+                    f"WHERE id IN ({', '.join(['%s'] * len(rows))}) AND status = 'APPROVED'",
+                    [row[0] for row in rows]
+                )
+                changed = cursor.rowcount
+                counters.on_expiry(cursor, changed)
+                # Validators drop expired passes on their own; logging them keeps delta
+                # clients' pass sets (and the next full snapshot) from growing forever
+                validation_snapshot.record_pass_changes(
+                    cursor, [(pass_number, 'REMOVE', None, None, None) for _, _, pass_number in rows if pass_number]
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            expired += changed
+            pass_cache.invalidate(*{user_id for _, user_id, _ in rows})
+            for app_id, user_id, pass_number in rows:
+                audit_log.record('expired', app_id, user_id, 'system', {'pass_number': pass_number})
+            if len(rows) < batch_size:
+                break
+            time.sleep(pause)
+    finally:
+        cursor.close()
+    return expired
+
+
+def create_renewals(conn, today=None, lead_days=PASS_RENEWAL_LEAD_DAYS, batch_size=PASS_RENEWAL_BATCH_SIZE):
+    """
+    Creates renewal applications for opted-in riders whose pass ends within
+    `lead_days`. Returns (created, skipped) where skipped passes are on a route
+    that is no longer sold. The renewal is priced from the current fare table.
+    """
+    today = today or datetime.date.today()
+    fare_table = fares.current()
+    created = skipped = 0
+    after = (today - datetime.timedelta(days=1), 0)
+    cursor = conn.cursor()
+    try:
+        while True:
+            # Keyset scan over (valid_until, id) of passes ending soon with no renewal yet
+            cursor.execute(
+                "SELECT a.id, a.user_id, a.start_point, a.end_point, a.valid_until "
+                "FROM applications a "
+                "JOIN users u ON u.id = a.user_id "
+                "LEFT JOIN applications r ON r.renewal_of = a.id "
+                "WHERE a.status = 'APPROVED' AND a.valid_until <= %s "
+                "AND (a.valid_until > %s OR (a.valid_until = %s AND a.id > %s)) "
+                "AND u.auto_renew AND r.id IS NULL "
+                "ORDER BY a.valid_until, a.id LIMIT %s",
+                (today + datetime.timedelta(days=lead_days), after[0], after[0], after[1], batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            after = (rows[-1][4], rows[-1][0])
+
+            values, routes, users, events = [], [], set(), []
+            for app_id, user_id, start_point, end_point, valid_until in rows:
+                amount = fare_table.fare(start_point, end_point)
+                if amount is None:
+                    skipped += 1
+                    continue
+                valid_from, renewal_until = renewal_validity_window(valid_until)
+                values.append((user_id, start_point, end_point, amount, valid_from, renewal_until, app_id))
+                routes.append((start_point, end_point))
+                users.add(user_id)
+                events.append((app_id, user_id, {'amount': amount, 'valid_from': valid_from,
+                                                 'valid_until': renewal_until}))
+            if values:
+                try:
+                    cursor.executemany(
+                        "INSERT INTO applications (user_id, start_point, end_point, amount, status, "
+                        "payment_status, application_date, valid_from, valid_until, renewal_of) "
+                        "VALUES (%s, %s, %s, %s, 'PENDING', 'PENDING', NOW(), %s, %s, %s)",
+                        values
+                    )
+                    counters.on_applications(cursor, routes)
+                    conn.commit()
+                    created += len(values)
+                    pass_cache.invalidate(*users)
+                    # Logged against the pass being renewed (the renewal's own id is not returned)
+                    for app_id, user_id, detail in events:
+                        audit_log.record('renewal_created', app_id, user_id, 'system', detail)
+                except mysql.connector.IntegrityError:
+                    # A concurrent run renewed some of these first; it owns this batch
+                    conn.rollback()
+            if len(rows) < batch_size:
+                break
+    finally:
+        cursor.close()
+    return created, skipped
+
+
+passes_cli = AppGroup('passes', help='Pass expiry and renewals.')
+
+
+@passes_cli.command('expire')
+def expire_command():
+    """Expire passes whose validity has ended."""
+    with db_pool.connection() as conn:
+        expired = expire_passes(conn)
+    click.echo(f"Expired {expired} pass(es).")
+
+
+@passes_cli.command('renew')
+@click.option('--lead-days', type=int, default=PASS_RENEWAL_LEAD_DAYS, show_default=True)
+def renew_command(lead_days):
+    """Create renewal applications for riders who opted in."""
+    with db_pool.connection() as conn:
+        created, skipped = create_renewals(conn, lead_days=lead_days)
+    click.echo(f"Created {created} renewal application(s), {skipped} skipped (route no longer sold).")
+
+
+@passes_cli.command('run')
+@click.option('--interval', type=int, default=PASS_SCHEDULER_INTERVAL, show_default=True,
+              help='Seconds between runs; 0 runs once.')
+def run_command(interval):
+    """Expire and renew on a schedule."""
+    while True:
+        started = time.monotonic()
+        with db_pool.connection() as conn:
+            expired = expire_passes(conn)
+            created, skipped = create_renewals(conn)
+        click.echo(f"{datetime.datetime.now():%Y-%m-%d %H:%M:%S} expired {expired}, "
+                   f"renewals created {created}, skipped {skipped}.")
+        if not interval:
+            return
+        time.sleep(max(0, interval - (time.monotonic() - started)))
+
+
+def init_app(app):
+    app.cli.add_command(passes_cli)
@@ -0,0 +1,127 @@
+# pass_tokens.py
+
+import hmac
+import base64
+import datetime
+
+from config import PASS_SIGNING_KEYS, PASS_SIGNING_KEY_ID
+
+# Token layout: "<kid>.<payload>.<mac>", payload and mac base64url without padding.
+# The payload is "pass_number|start_point|end_point|valid_from|valid_until" with
+# both dates as proleptic Gregorian ordinals (date.toordinal()); stop names never
+# contain '|' (the /admin/fares stop editor refuses it). The validity
+# window is inclusive. The MAC is the first 16 bytes of HMAC-SHA256(key, "<kid>.<payload>").
+MAC_BYTES = 16
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _mac(key: bytes, message: bytes) -> bytes:
+    # hmac.digest() is the one-shot C implementation, much faster than hmac.new()
+    return hmac.digest(key, message, 'sha256')[:MAC_BYTES]
+
+
+def pass_validity_window(issued_on: datetime.date):
+    """Monthly pass: valid from the issue date until the last day of the following month."""
+    first_of_next = (issued_on.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+    last_of_next = (first_of_next + datetime.timedelta(days=32)).replace(day=1) - datetime.timedelta(days=1)
+    return issued_on, last_of_next
+
+
+def renewal_validity_window(previous_valid_until: datetime.date):
+    """Renewal of a pass: the calendar month after the previous pass ends."""
+    valid_from = previous_valid_until + datetime.timedelta(days=1)
+    first_of_next = (valid_from.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+    return valid_from, first_of_next - datetime.timedelta(days=1)
+
+
+def sign_pass_token(pass_number, start_point, end_point, valid_from, valid_until, kid=None) -> str:
+    """Returns a compact signed token for a pass, signed with the active (or given) key."""
+    kid = kid or PASS_SIGNING_KEY_ID
+    key = PASS_SIGNING_KEYS[kid].encode()
+    payload = '|'.join([pass_number, start_point, end_point,
+                        str(valid_from.toordinal()), str(valid_until.toordinal())])
+    signed = f"{kid}.{_b64encode(payload.encode())}"
+    return f"{signed}.{_b64encode(_mac(key, signed.encode()))}"
+
+
+class PassTokenVerifier:
+    """
+    Validates pass tokens without any database access.
+
+    Every key in `keys` is accepted, so during a rotation tokens signed with the
+    previous key keep verifying until that key is removed from config.
+    """
+
+    def __init__(self, keys):
+        self._keys = {kid: secret.encode() for kid, secret in keys.items()}
+
+    def verify(self, token, on_day=None):
+        """
+        Returns a dict with `valid` and, for well-formed tokens, the pass fields.
+        `on_day` is the ordinal day the pass was scanned (defaults to today).
+        """
+        if on_day is None:
+            on_day = datetime.date.today().toordinal()
+        try:
+            signed, mac_text = token.rsplit('.', 1)
+            kid, payload_text = signed.split('.', 1)
+        except (AttributeError, ValueError):
+            return {'valid': False, 'reason': 'malformed'}
+        key = self._keys.get(kid)
+        if key is None:
+            return {'valid': False, 'reason': 'unknown_key'}
+        try:
+            mac = _b64decode(mac_text)
+        except ValueError:
+            return {'valid': False, 'reason': 'malformed'}
+        if not hmac.compare_digest(mac, _mac(key, signed.encode())):
+            return {'valid': False, 'reason': 'bad_signature'}
+        try:
+            pass_number, start_point, end_point, valid_from, valid_until = \
+                _b64decode(payload_text).decode().split('|')
+            valid_from, valid_until = int(valid_from), int(valid_until)
+        except ValueError:
+            return {'valid': False, 'reason': 'malformed'}
+
+        result = {
+            'valid': valid_from <= on_day <= valid_until,
+            'pass_number': pass_number,
+            'route': f"{start_point}-{end_point}",
+            'valid_until': datetime.date.fromordinal(valid_until).isoformat(),
+        }
+        if on_day < valid_from:
+            result['reason'] = 'not_yet_valid'
+        elif on_day > valid_until:
+            result['reason'] = 'expired'
+        return result
+
+    def verify_many(self, scans):
+        """
+        Verifies a batch of scans. Each scan is a token string, or a dict with
+        `token` and optional `scanned_at` (unix seconds) so offline uploads are
+        judged against the time of the scan rather than the time of upload.
+        """
+        today = datetime.date.today().toordinal()
+        results = []
+        for scan in scans:
+            if isinstance(scan, dict):
+                scanned_at = scan.get('scanned_at')
+                try:
+                    day = datetime.date.fromtimestamp(scanned_at).toordinal() if scanned_at is not None else today
+                except (TypeError, ValueError, OverflowError, OSError):
+                    results.append({'valid': False, 'reason': 'malformed'})
+                    continue
+                results.append(self.verify(scan.get('token'), day))
+            else:
+                results.append(self.verify(scan, today))
+        return results
+
+
+verifier = PassTokenVerifier(PASS_SIGNING_KEYS)
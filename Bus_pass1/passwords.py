@@ -0,0 +1,112 @@
+# passwords.py
+#
+# Password hashing on a small bounded thread pool. The KDFs in hashlib release
+# the GIL, so a flood of logins is limited to PASSWORD_HASH_WORKERS cores and
+# at most PASSWORD_HASH_QUEUE waiting requests; anything beyond that fails fast
+# with HasherBusy instead of starving every other route on the worker.
+
+import hmac
+import hashlib
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from config import PASSWORD_HASH_METHOD, PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE, PASSWORD_HASH_TIMEOUT
+from metrics import registry, password_hash_duration, Counter
+
+KNOWN_METHODS = ('scrypt', 'pbkdf2')
+# Marks accounts created without a password (eg. bulk imports); never matches any input
+UNUSABLE_PREFIX = '!'
+
+hasher_rejections = registry.register(Counter(
+    'password_hash_rejected_total', 'Hash requests refused because the hasher pool was full.', ('operation',)))
+
+
+class HasherBusy(Exception):
+    """The hasher pool and its queue are full (or the wait timed out); retry shortly."""
+
+
+def hash_prefix(stored: str) -> str:
+    """Method and cost part of a Werkzeug hash, eg. 'scrypt:32768:8:1'."""
+    return stored.split('$', 1)[0]
+
+
+def is_legacy_plaintext(stored: str) -> bool:
+    """Admin passwords were historically stored in plain text (see bus_pass_db.sql)."""
+    if stored.startswith(UNUSABLE_PREFIX):
+        return False
+    return '$' not in stored or hash_prefix(stored).split(':', 1)[0] not in KNOWN_METHODS
+
+
+def make_unusable_password() -> str:
+    return UNUSABLE_PREFIX + secrets.token_hex(16)
+
+
+def password_fingerprint(stored: str) -> str:
+    """Short digest of a stored hash; set-password links carry it so they stop working once used."""
+    return hashlib.sha256(stored.encode()).hexdigest()[:16]
+
+
+def hash_password_now(password: str) -> str:
+    """Hashes on the calling thread, for offline jobs such as bulk imports."""
+    return generate_password_hash(password, method=PASSWORD_HASH_METHOD)
+
+
+class PasswordHasher:
+    def __init__(self, method, workers, queue_size, timeout):
+        self.method = method
+        # Werkzeug fills in default costs ('scrypt' -> 'scrypt:32768:8:1'); compare against the full form
+        self.current_prefix = hash_prefix(generate_password_hash('', method=method))
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def _run(self, operation, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            hasher_rejections.inc(operation=operation)
+            raise HasherBusy()
+
+        def task():
+            try:
+                with password_hash_duration.time(operation=operation):
+                    return fn(*args)
+            finally:
+                self._slots.release()
+
+        future = self._executor.submit(task)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # The hash still completes in the background and frees its slot then
+            hasher_rejections.inc(operation=operation)
+            raise HasherBusy()
+
+    def hash(self, password: str) -> str:
+        return self._run('hash', generate_password_hash, password, self.method)
+
+    def needs_rehash(self, stored: str) -> bool:
+        return is_legacy_plaintext(stored) or hash_prefix(stored) != self.current_prefix
+
+    def verify(self, stored: str, password: str):
+        """
+        Checks `password` against a stored hash (or a legacy plain-text value).
+        Returns (matches, new_hash): `new_hash` is set when the password matched
+        but was stored with an outdated method or cost and should be saved.
+        """
+        if stored.startswith(UNUSABLE_PREFIX):
+            return False, None
+        if is_legacy_plaintext(stored):
+            matches = hmac.compare_digest(stored.encode(), password.encode())
+        else:
+            matches = self._run('verify', check_password_hash, stored, password)
+        if matches and self.needs_rehash(stored):
+            try:
+                return True, self.hash(password)
+            except HasherBusy:
+                pass  # upgrade on a later login instead
+        return matches, None
+
+
+hasher = PasswordHasher(PASSWORD_HASH_METHOD, PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE, PASSWORD_HASH_TIMEOUT)
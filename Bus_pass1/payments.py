@@ -0,0 +1,228 @@
+# payments.py
+#
+# Applies payment gateway events (succeeded / failed) to applications.
+# Events are idempotent on their `idempotency_key`: each key is recorded once in
+# payment_ledger together with its outcome, and a replay just returns that
+# outcome. A batch is applied in one transaction with state-checked updates, so
+# retries, double submits and out-of-order events cannot double-count a payment.
+
+import hmac
+import hashlib
+import threading
+from decimal import Decimal, InvalidOperation
+from collections import OrderedDict
+
+import mysql.connector
+
+import counters
+from audit import audit_log
+from config import PAYMENT_WEBHOOK_SECRET, PAYMENT_RECENT_KEYS
+from pass_cache import pass_cache
+
+EVENTS = ('succeeded', 'failed')
+MAX_KEY_LENGTH = 100
+SIGNATURE_HEADER = 'X-Payment-Signature'
+
+
+class InvalidEvent(ValueError):
+    pass
+
+
+def sign_body(body: bytes, secret: str = PAYMENT_WEBHOOK_SECRET) -> str:
+    """Value of the signature header for a request body: 'sha256=<hex HMAC>'."""
+    return 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def signature_valid(body: bytes, header: str) -> bool:
+    return bool(header) and hmac.compare_digest(sign_body(body), header)
+
+
+def parse_event(raw) -> dict:
+    """Validates one gateway event; raises InvalidEvent."""
+    if not isinstance(raw, dict):
+        raise InvalidEvent('event must be an object')
+    key = raw.get('idempotency_key')
+    if not isinstance(key, str) or not key or len(key) > MAX_KEY_LENGTH:
+        raise InvalidEvent(f'idempotency_key must be a string of 1-{MAX_KEY_LENGTH} characters')
+    if raw.get('status') not in EVENTS:
+        raise InvalidEvent(f"status must be one of {', '.join(EVENTS)}")
+    try:
+        application_id = int(raw.get('application_id'))
+    except (TypeError, ValueError):
+        raise InvalidEvent('application_id must be an integer')
+    amount = raw.get('amount')
+    if amount is not None:
+        try:
+            amount = Decimal(str(amount)).quantize(Decimal('0.01'))
+        except InvalidOperation:
+            raise InvalidEvent('amount must be a number')
+    return {
+        'idempotency_key': key,
+        'application_id': application_id,
+        'status': raw['status'],
+        'amount': amount,
+        'gateway_ref': str(raw.get('gateway_ref') or '')[:100] or None,
+    }
+
+
+class RecentKeys:
+    """Bounded memory of recently settled idempotency keys and their outcomes."""
+
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._entries.get(key)
+
+    def add_many(self, outcomes):
+        with self._lock:
+            for key, outcome in outcomes:
+                self._entries[key] = outcome
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+
+recent_keys = RecentKeys(PAYMENT_RECENT_KEYS)
+
+
+def _result(event, outcome, detail=None, duplicate=False):
+    return {'idempotency_key': event['idempotency_key'], 'application_id': event['application_id'],
+            'outcome': outcome, 'detail': detail, 'duplicate': duplicate}
+
+
+def _plan(event, row):
+    """Decides (outcome, detail) for one new event against the locked application row."""
+    if row is None:
+        return 'rejected', 'unknown application'
+    if event['status'] == 'succeeded':
+        if row['payment_status'] == 'COMPLETED':
+            return 'ignored', 'already paid'
+        if event['amount'] is not None and event['amount'] != row['amount']:
+            return 'rejected', f"amount mismatch (expected {row['amount']})"
+        return 'applied', None
+    if row['payment_status'] != 'PENDING':
+        return 'ignored', f"payment already {row['payment_status'].lower()}"
+    return 'applied', None
+
+
+def _apply_once(conn, events, actor):
+    cursor = conn.cursor(dictionary=True)
+    try:
+        keys = [event['idempotency_key'] for event in events]
+        cursor.execute(
+            f"SELECT idempotency_key, outcome, detail FROM payment_ledger "
+            f"WHERE idempotency_key IN ({', '.join(['%s'] * len(keys))})",
+            keys
+        )
+        settled = {row['idempotency_key']: (row['outcome'], row['detail']) for row in cursor.fetchall()}
+        fresh = [event for event in events if event['idempotency_key'] not in settled]
+
+        rows = {}
+        if fresh:
+            # Locks the applications until commit; concurrent batches for them wait here
+            app_ids = sorted({event['application_id'] for event in fresh})
+            cursor.execute(
+                f"SELECT id, user_id, status, payment_status, amount FROM applications "
+                f"WHERE id IN ({', '.join(['%s'] * len(app_ids))}) FOR UPDATE",
+                app_ids
+            )
+            rows = {row['id']: dict(row) for row in cursor.fetchall()}
+
+        outcomes, paid, failed, touched_users, transitions = {}, [], [], set(), []
+        for event in fresh:
+            row = rows.get(event['application_id'])
+            outcome, detail = _plan(event, row)
+            outcomes[event['idempotency_key']] = (outcome, detail)
+            if outcome != 'applied':
+                continue
+            touched_users.add(row['user_id'])
+            transitions.append((event, row['user_id']))
+            if event['status'] == 'succeeded':
+                paid.append(dict(row))
+                row.update(payment_status='COMPLETED', status='PENDING')
+            else:
+                failed.append(dict(row))
+                row.update(payment_status='FAILED')
+
+        if paid:
+            cursor.executemany(
+                "UPDATE applications SET payment_status = 'COMPLETED', status = 'PENDING' "
+                "WHERE id = %s AND payment_status <> 'COMPLETED'",
+                [(row['id'],) for row in paid]
+            )
+            counters.on_payments(cursor, paid)
+        if failed:
+            cursor.executemany(
+                "UPDATE applications SET payment_status = 'FAILED' WHERE id = %s AND payment_status = 'PENDING'",
+                [(row['id'],) for row in failed]
+            )
+            counters.on_payment_failures(cursor, failed)
+        if fresh:
+            cursor.executemany(
+                "INSERT INTO payment_ledger (idempotency_key, application_id, event, amount, gateway_ref, "
+                "outcome, detail) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                [(event['idempotency_key'], event['application_id'], event['status'], event['amount'],
+                  event['gateway_ref'], *outcomes[event['idempotency_key']]) for event in fresh]
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    results = []
+    for event in events:
+        key = event['idempotency_key']
+        if key in settled:
+            results.append(_result(event, *settled[key], duplicate=True))
+        else:
+            results.append(_result(event, *outcomes[key]))
+    recent_keys.add_many(outcomes.items())
+    pass_cache.invalidate(*touched_users)
+    for event, user_id in transitions:
+        audit_log.record(f"payment_{event['status']}", event['application_id'], user_id, actor, {
+            'idempotency_key': event['idempotency_key'], 'amount': event['amount'], 'gateway_ref': event['gateway_ref'],
+        })
+    return results
+
+
+def apply_events(conn, events, actor='gateway'):
+    """
+    Applies parsed events (see parse_event) in one transaction and returns one
+    result per event, in order. Replayed keys are answered from memory when
+    possible, else from the ledger; repeats within the batch count once.
+    Applied events are audit-logged as done by `actor`.
+    """
+    results = [None] * len(events)
+    pending, first_index = [], {}
+    for index, event in enumerate(events):
+        key = event['idempotency_key']
+        known = recent_keys.get(key)
+        if known is not None:
+            results[index] = _result(event, *known, duplicate=True)
+        elif key in first_index:
+            results[index] = None  # filled in from the first occurrence below
+        else:
+            first_index[key] = index
+            pending.append(event)
+
+    if pending:
+        try:
+            applied = _apply_once(conn, pending, actor)
+        except mysql.connector.IntegrityError:
+            # Another request recorded one of these keys concurrently; rerun and
+            # its outcome is now read back from the ledger as a duplicate
+            applied = _apply_once(conn, pending, actor)
+        for event, result in zip(pending, applied):
+            results[first_index[event['idempotency_key']]] = result
+
+    for index, event in enumerate(events):
+        if results[index] is None:
+            first = results[first_index[event['idempotency_key']]]
+            results[index] = dict(first, duplicate=True)
+    return results
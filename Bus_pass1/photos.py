@@ -0,0 +1,135 @@
+# photos.py
+
+import os
+import shutil
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+from config import PHOTO_MAX_SIZE, PHOTO_THUMB_SIZE, PHOTO_MAX_PIXELS, PHOTO_QUALITY, PHOTO_WORKERS
+from db import pool as db_pool
+
+# Relative to the app's working directory, like the rest of static/uploads
+PHOTO_FOLDER = os.path.join('static', 'uploads', 'photos')
+
+ACCEPTED_FORMATS = {'JPEG', 'PNG', 'WEBP'}
+
+# WebP is smaller at the same quality; fall back to JPEG if Pillow was built without it
+OUTPUT_FORMAT, OUTPUT_EXTENSION = ('WEBP', '.webp') if features.check('webp') else ('JPEG', '.jpg')
+
+logger = logging.getLogger(__name__)
+
+# Pillow releases the GIL while decoding, resizing and encoding, so threads give
+# real parallelism here without the cost of shipping images between processes.
+_executor = ThreadPoolExecutor(max_workers=PHOTO_WORKERS, thread_name_prefix='photo')
+
+
+class InvalidPhoto(ValueError):
+    """The upload is not an acceptable image."""
+
+
+def photo_db_paths(stem: str):
+    """Returns the static-relative paths of the pass photo and its admin thumbnail."""
+    return f"uploads/photos/{stem}{OUTPUT_EXTENSION}", f"uploads/photos/{stem}_thumb{OUTPUT_EXTENSION}"
+
+
+def thumbnail_path(photo_path: str) -> str:
+    """Maps a stored photo_path to its thumbnail's path (photos uploaded before
+    thumbnails existed simply 404 and fall back to a placeholder)."""
+    stem, ext = os.path.splitext(photo_path)
+    return f"{stem}_thumb{ext}"
+
+
+def spool_upload(file_storage) -> str:
+    """Streams an uploaded file to a private temp file in chunks and returns its path."""
+    fd, temp_path = tempfile.mkstemp(prefix='photo-', suffix='.upload')
+    with os.fdopen(fd, 'wb') as out:
+        shutil.copyfileobj(file_storage.stream, out, 64 * 1024)
+    return temp_path
+
+
+def validate_photo(temp_path: str):
+    """
+    Checks that the file really is a JPEG/PNG/WebP image of sane dimensions by
+    parsing it (not by trusting its extension). Only headers and structure are
+    read here; the full decode happens in the worker pool.
+    """
+    try:
+        with Image.open(temp_path) as img:
+            if img.format not in ACCEPTED_FORMATS:
+                raise InvalidPhoto(f"unsupported image format {img.format}")
+            width, height = img.size
+            if width * height > PHOTO_MAX_PIXELS:
+                raise InvalidPhoto("image dimensions are too large")
+            img.verify()
+    except (UnidentifiedImageError, OSError, SyntaxError, Image.DecompressionBombError) as exc:
+        raise InvalidPhoto("file is not a readable image") from exc
+
+
+def process_photo(temp_path: str, stem: str):
+    """
+    Decodes the upload, applies and then drops its EXIF data, and writes a
+    bounded pass photo plus a small admin thumbnail in OUTPUT_FORMAT.
+    """
+    try:
+        with Image.open(temp_path) as img:
+            # Let the JPEG decoder downscale while decoding (much cheaper than a full decode)
+            img.draft('RGB', (PHOTO_MAX_SIZE * 2, PHOTO_MAX_SIZE * 2))
+            img = ImageOps.exif_transpose(img)
+            img = img.convert('RGBA' if OUTPUT_FORMAT == 'WEBP' and 'A' in img.getbands() else 'RGB')
+
+            img.thumbnail((PHOTO_MAX_SIZE, PHOTO_MAX_SIZE), Image.Resampling.LANCZOS, reducing_gap=2.0)
+            photo_path, thumb_path = (os.path.join('static', path) for path in photo_db_paths(stem))
+            # No exif= argument is passed, so no metadata is written to the output
+            if OUTPUT_FORMAT == 'WEBP':
+                img.save(photo_path, OUTPUT_FORMAT, quality=PHOTO_QUALITY, method=4)
+            else:
+                img.save(photo_path, OUTPUT_FORMAT, quality=PHOTO_QUALITY, optimize=True, progressive=True)
+
+            img.thumbnail((PHOTO_THUMB_SIZE, PHOTO_THUMB_SIZE), Image.Resampling.LANCZOS)
+            img.save(thumb_path, OUTPUT_FORMAT, quality=PHOTO_QUALITY)
+    finally:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+
+def attach_photo(temp_path: str, stem: str, user_id: int, connect=db_pool.connection):
+    """
+    Processes the upload and only then points the user's photo_path at it, so a
+    photo that failed to process is never referenced. Files written for a photo
+    that could not be attached are removed again.
+    """
+    written = [os.path.join('static', path) for path in photo_db_paths(stem)]
+    try:
+        process_photo(temp_path, stem)
+        with connect() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("UPDATE users SET photo_path = %s WHERE id = %s", (photo_db_paths(stem)[0], user_id))
+                conn.commit()
+            finally:
+                cursor.close()
+    except Exception:
+        logger.exception(f"Attaching photo {stem} to user {user_id} failed")
+        for path in written:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        raise
+
+
+def submit(temp_path: str, stem: str, user_id: int):
+    """Queues a validated upload for processing and attaching to `user_id` on the photo worker pool."""
+    return _executor.submit(attach_photo, temp_path, stem, user_id)
+
+
+def discard(temp_path: str):
+    try:
+        os.remove(temp_path)
+    except OSError:
+        pass
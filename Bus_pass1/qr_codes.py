@@ -0,0 +1,161 @@
+# qr_codes.py
+
+import io
+import os
+import hashlib
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import qrcode
+import qrcode.image.svg
+
+from metrics import qr_render_duration
+from config import QR_RENDER_WORKERS, QR_IMAGE_CACHE_MAX_ITEMS, QR_IMAGE_CACHE_MAX_BYTES
+
+# Relative to the app's working directory, like the rest of static/uploads
+QR_CODE_FOLDER = os.path.join('static', 'uploads', 'qrcodes')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def qr_code_paths(pass_number: str):
+    """
+    Returns (filesystem path, static-relative path stored in the DB) for a pass's
+    QR image, eg. ('static/uploads/qrcodes/BP-1-20250101.png', 'uploads/qrcodes/BP-1-20250101.png').
+    """
+    filename = f"{pass_number}.png"
+    return os.path.join(QR_CODE_FOLDER, filename), f"uploads/qrcodes/{filename}"
+
+
+def render_qr_file(data: str, full_path: str) -> str:
+    """Renders `data` as a QR code PNG at `full_path` and returns the path."""
+    img = qrcode.make(data)
+    img.save(full_path)
+    return full_path
+
+
+def get_render_pool() -> ProcessPoolExecutor:
+    """
+    Shared process pool for QR rendering, created on first use. Uses the 'spawn'
+    start method so workers never inherit the web server's threads or DB sockets.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=QR_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def render_qr_files(jobs):
+    """
+    Renders many QR codes in parallel across the process pool.
+
+    `jobs` is a list of (data, full_path). Returns a list in the same order whose
+    items are either the written path or the exception raised for that job.
+    """
+    if not jobs:
+        return []
+    with qr_render_duration.time(kind='file_batch'):
+        pool = get_render_pool()
+        futures = [pool.submit(render_qr_file, data, full_path) for data, full_path in jobs]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except BrokenProcessPool as exc:
+                _discard_pool(pool)
+                results.append(exc)
+            except Exception as exc:
+                results.append(exc)
+    return results
+
+
+def _discard_pool(pool):
+    """Drops a pool whose worker died so the next batch starts a fresh one."""
+    global _executor
+    with _executor_lock:
+        if _executor is pool:
+            _executor = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+# On-demand rendering (served by the /pass/<pass_number>/qr.<fmt> route)
+QR_MIMETYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+
+def render_qr_bytes(data: str, fmt: str = 'png') -> bytes:
+    """Renders `data` as an encoded QR image in memory ('png' or 'svg')."""
+    buffer = io.BytesIO()
+    with qr_render_duration.time(kind=fmt):
+        if fmt == 'svg':
+            qrcode.make(data, image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+        else:
+            qrcode.make(data).save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def qr_etag(data: str, fmt: str) -> str:
+    """Strong validator for an image: identical payload and format give identical bytes."""
+    return hashlib.sha256(f"{fmt}:{data}".encode()).hexdigest()[:32]
+
+
+class QRImageCache:
+    """
+    Thread-safe LRU cache of encoded QR images keyed by (fmt, payload), bounded
+    both by entry count and by total encoded bytes.
+    """
+
+    def __init__(self, max_items, max_bytes):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            image = self._entries.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key, image: bytes):
+        if len(image) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = image
+            self._bytes += len(image)
+            while len(self._entries) > self.max_items or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def get_or_render(self, data: str, fmt: str) -> bytes:
+        key = (fmt, data)
+        image = self.get(key)
+        if image is None:
+            image = render_qr_bytes(data, fmt)
+            self.put(key, image)
+        return image
+
+    def stats(self):
+        with self._lock:
+            return {'items': len(self._entries), 'bytes': self._bytes, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions}
+
+
+image_cache = QRImageCache(QR_IMAGE_CACHE_MAX_ITEMS, QR_IMAGE_CACHE_MAX_BYTES)
@@ -0,0 +1,225 @@
+# qr_jobs.py
+
+import os
+import time
+import socket
+
+import click
+import mysql.connector
+from flask.cli import AppGroup
+
+from config import QR_JOB_BATCH_SIZE, QR_JOB_MAX_ATTEMPTS, QR_JOB_POLL_SECONDS, QR_JOB_STALE_SECONDS
+from db import pool as db_pool
+from qr_codes import render_qr_files, qr_code_paths
+
+
+def enqueue(cursor, jobs):
+    """
+    Queues QR renders inside the caller's transaction. `jobs` is a list of
+    (pass_number, application_id, payload).
+
+    Idempotent per pass_number: re-enqueueing a queued, running or finished pass
+    is a no-op, while a FAILED one is reset for another round of attempts.
+    """
+    if not jobs:
+        return
+    # MySQL evaluates ON DUPLICATE KEY assignments left to right, so attempts and
+    # run_after must be reset before status is changed.
+    cursor.executemany(
+        """
+        INSERT INTO qr_jobs (pass_number, application_id, payload)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            attempts = IF(status = 'FAILED', 0, attempts),
+            run_after = IF(status = 'FAILED', CURRENT_TIMESTAMP(6), run_after),
+            status = IF(status = 'FAILED', 'QUEUED', status)
+        """,
+        jobs
+    )
+
+
+def reclaim_stale(conn):
+    """Requeues jobs left RUNNING by a worker that died mid-batch."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "UPDATE qr_jobs SET status = 'QUEUED' "
+            "WHERE status = 'RUNNING' AND started_at < NOW(6) - INTERVAL %s SECOND",
+            (QR_JOB_STALE_SECONDS,)
+        )
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+
+def claim_batch(conn, limit):
+    """
+    Atomically marks up to `limit` due jobs RUNNING and returns them. SKIP LOCKED
+    (MySQL 8.0+) lets several workers claim disjoint batches without blocking.
+    """
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            """
+            SELECT id, pass_number, application_id, payload, attempts
+            FROM qr_jobs
+            WHERE status = 'QUEUED' AND run_after <= NOW(6)
+            ORDER BY run_after
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+            """,
+            (limit,)
+        )
+        jobs = cursor.fetchall()
+        if jobs:
+            placeholders = ', '.join(['%s'] * len(jobs))
+            cursor.execute(
+                f"UPDATE qr_jobs SET status = 'RUNNING', started_at = NOW(6), attempts = attempts + 1 "
+                f"WHERE id IN ({placeholders})",
+                [job['id'] for job in jobs]
+            )
+        conn.commit()
+        return jobs
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def retry_delay(attempts: int) -> int:
+    """Exponential backoff in seconds before retry number `attempts`."""
+    return min(2 ** attempts, 300)
+
+
+def process_batch(conn, jobs):
+    """Renders the claimed jobs in parallel and records the outcome of each."""
+    paths = [qr_code_paths(job['pass_number']) for job in jobs]
+    rendered = render_qr_files([(job['payload'], full_path) for job, (full_path, _) in zip(jobs, paths)])
+
+    done, retries, failed = [], [], []
+    for job, (_, db_path), result in zip(jobs, paths, rendered):
+        if not isinstance(result, Exception):
+            done.append((job, db_path))
+        elif job['attempts'] + 1 >= QR_JOB_MAX_ATTEMPTS:
+            failed.append((str(result)[:255], job['id']))
+        else:
+            retries.append((retry_delay(job['attempts'] + 1), str(result)[:255], job['id']))
+
+    cursor = conn.cursor()
+    try:
+        if done:
+            # Only attach the image if the application still carries this pass
+            # (it may have been rejected while the job was queued).
+            cursor.executemany(
+                "UPDATE applications SET qr_code_path = %s WHERE id = %s AND pass_number = %s",
+                [(db_path, job['application_id'], job['pass_number']) for job, db_path in done]
+            )
+            cursor.executemany(
+                "UPDATE qr_jobs SET status = 'DONE', finished_at = NOW(6), last_error = NULL WHERE id = %s",
+                [(job['id'],) for job, _ in done]
+            )
+        if retries:
+            cursor.executemany(
+                "UPDATE qr_jobs SET status = 'QUEUED', run_after = NOW(6) + INTERVAL %s SECOND, last_error = %s "
+                "WHERE id = %s",
+                retries
+            )
+        if failed:
+            cursor.executemany(
+                "UPDATE qr_jobs SET status = 'FAILED', finished_at = NOW(6), last_error = %s WHERE id = %s",
+                failed
+            )
+        conn.commit()
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return len(done), len(retries), len(failed)
+
+
+def run_worker(batch_size=QR_JOB_BATCH_SIZE, poll_seconds=QR_JOB_POLL_SECONDS, once=False, echo=print):
+    """Claims and renders jobs until interrupted (or until the queue is empty with once=True)."""
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    echo(f"QR worker {worker} started (batch size {batch_size}).")
+    last_reclaim = 0.0
+    while True:
+        try:
+            with db_pool.connection() as conn:
+                if time.monotonic() - last_reclaim > QR_JOB_STALE_SECONDS / 2:
+                    reclaimed = reclaim_stale(conn)
+                    if reclaimed:
+                        echo(f"Requeued {reclaimed} stale job(s).")
+                    last_reclaim = time.monotonic()
+                jobs = claim_batch(conn, batch_size)
+                if jobs:
+                    started = time.perf_counter()
+                    done, retried, failed = process_batch(conn, jobs)
+                    echo(f"Rendered {done}, retrying {retried}, failed {failed} "
+                         f"in {time.perf_counter() - started:.2f}s.")
+        except mysql.connector.Error as err:
+            echo(f"QR worker database error: {err}")
+            jobs = []
+        if not jobs:
+            if once:
+                return
+            time.sleep(poll_seconds)
+
+
+def queue_stats(conn):
+    """Queue depth per state, age of the oldest due job and recent job latency (seconds)."""
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT status, COUNT(*) AS jobs FROM qr_jobs GROUP BY status")
+        depth = {row['status']: row['jobs'] for row in cursor.fetchall()}
+        cursor.execute(
+            "SELECT TIMESTAMPDIFF(MICROSECOND, MIN(enqueued_at), NOW(6)) / 1e6 AS oldest "
+            "FROM qr_jobs WHERE status = 'QUEUED'"
+        )
+        oldest = cursor.fetchone()['oldest']
+        cursor.execute(
+            """
+            SELECT COUNT(*) AS jobs,
+                   AVG(TIMESTAMPDIFF(MICROSECOND, enqueued_at, finished_at)) / 1e6 AS avg_latency,
+                   MAX(TIMESTAMPDIFF(MICROSECOND, enqueued_at, finished_at)) / 1e6 AS max_latency
+            FROM qr_jobs
+            WHERE status = 'DONE' AND finished_at >= NOW(6) - INTERVAL 1 HOUR
+            """
+        )
+        recent = cursor.fetchone()
+    finally:
+        cursor.close()
+    return {
+        'depth': {state: depth.get(state, 0) for state in ('QUEUED', 'RUNNING', 'DONE', 'FAILED')},
+        'oldest_queued_seconds': float(oldest) if oldest is not None else None,
+        'last_hour': {
+            'completed': recent['jobs'],
+            'avg_latency_seconds': float(recent['avg_latency']) if recent['avg_latency'] is not None else None,
+            'max_latency_seconds': float(recent['max_latency']) if recent['max_latency'] is not None else None,
+        },
+    }
+
+
+qr_cli = AppGroup('qr', help='Background QR code rendering.')
+
+
+@qr_cli.command('worker')
+@click.option('--batch-size', default=QR_JOB_BATCH_SIZE, show_default=True, help='Jobs claimed per round.')
+@click.option('--once', is_flag=True, help='Exit when the queue is empty instead of polling.')
+def worker_command(batch_size, once):
+    """Run a QR rendering worker."""
+    run_worker(batch_size=batch_size, once=once, echo=click.echo)
+
+
+@qr_cli.command('stats')
+def stats_command():
+    """Print queue depth and job latency."""
+    with db_pool.connection() as conn:
+        stats = queue_stats(conn)
+    click.echo(stats)
+
+
+def init_app(app):
+    app.cli.add_command(qr_cli)
@@ -0,0 +1,41 @@
+# tests/conftest.py
+#
+# Run from Bus_pass1 with `python -m pytest tests`. Tests that need MySQL use the
+# scratch database named by BUS_PASS_TEST_DB (schema from bus_pass_db.sql plus
+# `flask db upgrade`) and are skipped when it is not set.
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+
+TEST_DB = os.environ.get('BUS_PASS_TEST_DB')
+
+requires_mysql = pytest.mark.skipif(not TEST_DB, reason='BUS_PASS_TEST_DB is not set')
+
+
+@pytest.fixture
+def mysql_connect():
+    """Opens connections to the scratch database; all are closed after the test."""
+    import mysql.connector
+
+    opened = []
+
+    def connect():
+        conn = mysql.connector.connect(
+            host=config.DB_HOST, port=config.DB_PORT, user=config.DB_USER,
+            password=config.DB_PASSWORD, database=TEST_DB, autocommit=False,
+        )
+        opened.append(conn)
+        return conn
+
+    yield connect
+    for conn in opened:
+        try:
+            conn.rollback()
+        finally:
+            conn.close()
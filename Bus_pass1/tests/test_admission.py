@@ -0,0 +1,126 @@
+# tests/test_admission.py
+#
+# Token buckets refill at their rate up to their burst, refused requests are
+# told how long to wait, and every admitted request holds a concurrency slot of
+# its route class until it is released.
+
+import pytest
+from flask import Flask
+
+import admission
+from admission import TokenBucket, ClientBuckets, AdmissionController
+
+
+def controller(public=2, admin=1, global_rate=100, global_burst=100, client_rate=1, client_burst=3):
+    limits = AdmissionController({'public': public, 'admin': admin, 'static': 4, 'gateway': 1},
+                                 global_rate, global_burst, client_rate, client_burst, max_clients=10)
+    limits.global_bucket = TokenBucket(global_rate, global_burst, now=0.0)
+    return limits
+
+
+def test_bucket_allows_a_burst_then_refills_at_its_rate():
+    bucket = TokenBucket(rate=2, burst=3, now=0.0)
+
+    assert [bucket.take(0.0) for _ in range(3)] == [0, 0, 0]
+    assert bucket.take(0.0) == pytest.approx(0.5)  # one token every 1/rate seconds
+    assert bucket.take(0.25) == pytest.approx(0.25)
+    assert bucket.take(0.5) == 0
+    # A long pause refills only up to the burst
+    assert [bucket.take(100.0) for _ in range(4)][-1] == pytest.approx(0.5)
+
+
+def test_client_buckets_are_separate_and_bounded():
+    buckets = ClientBuckets(rate=1, burst=1, max_clients=2)
+
+    assert buckets.take('a', 0.0) == 0
+    assert buckets.take('a', 0.0) == pytest.approx(1.0)
+    assert buckets.take('b', 0.0) == 0
+    buckets.take('c', 0.0)  # forgets 'a', the least recently seen
+    assert buckets.take('a', 0.0) == 0
+
+
+def test_public_client_over_its_rate_gets_429_with_retry_after():
+    limits = controller(public=10)
+    admitted = [limits.admit('public', 'ip:1', now=0.0) for _ in range(3)]
+    for _ in admitted:
+        limits.release('public')
+
+    assert admitted == [None, None, None]
+    assert limits.admit('public', 'ip:1', now=0.0) == (429, 'client_rate', pytest.approx(1.0))
+    assert limits.admit('public', 'ip:2', now=0.0) is None  # other clients are unaffected
+    assert limits.admit('public', 'ip:1', now=1.0) is None
+
+
+def test_global_rate_gives_503():
+    limits = controller(public=10, global_rate=1, global_burst=1, client_burst=10)
+
+    assert limits.admit('public', 'ip:1', now=0.0) is None
+    assert limits.admit('public', 'ip:2', now=0.0) == (503, 'global_rate', pytest.approx(1.0))
+
+
+def test_concurrency_slots_are_held_until_released():
+    limits = controller(public=2)
+
+    assert limits.admit('public', 'ip:1', now=0.0) is None
+    assert limits.admit('public', 'ip:2', now=0.0) is None
+    assert limits.admit('public', 'ip:3', now=0.0) == (503, 'concurrency', 1)
+    assert limits.stats()['public'] == 2
+
+    limits.release('public')
+    assert limits.stats()['public'] == 1
+    assert limits.admit('public', 'ip:3', now=0.0) is None
+
+
+def test_admin_class_has_its_own_slots_and_no_rate_limit():
+    limits = controller(public=1, admin=1, client_burst=1)
+    limits.admit('public', 'ip:1', now=0.0)  # public is now full
+
+    for _ in range(5):
+        assert limits.admit('admin', 'ip:1', now=0.0) is None
+        limits.release('admin')
+    assert limits.admit('admin', 'ip:1', now=0.0) is None
+    assert limits.admit('admin', 'ip:1', now=0.0) == (503, 'concurrency', 1)
+
+
+@pytest.mark.parametrize('path, admin_session, expected', [
+    ('/admin/applications', True, 'admin'),
+    ('/admin/login', False, 'public'),
+    ('/admin/applications', False, 'public'),
+    ('/payments/notify', False, 'gateway'),
+    ('/static/css/style.css', False, 'static'),
+    ('/apply_pass', True, 'public'),
+])
+def test_route_class(path, admin_session, expected):
+    assert admission.route_class_for(path, admin_session) == expected
+
+
+@pytest.mark.parametrize('wait, header', [(0.01, '1'), (1.0, '1'), (1.2, '2'), (7.9, '8')])
+def test_retry_after_is_rounded_up_to_whole_seconds(wait, header):
+    with Flask(__name__).test_request_context('/apply_pass'):
+        response = admission._shed_response(429, wait)
+
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == header
+
+
+def test_request_hooks_release_the_slot_even_when_the_view_fails(monkeypatch):
+    limits = controller(public=1)
+    monkeypatch.setattr(admission, 'controller', limits)
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.before_request(admission._before_request)
+    app.teardown_request(admission._teardown_request)
+
+    @app.route('/ok')
+    def ok():
+        assert limits.stats()['public'] == 1
+        return 'ok'
+
+    @app.route('/boom')
+    def boom():
+        raise RuntimeError('view failed')
+
+    client = app.test_client()
+    assert client.get('/ok').status_code == 200
+    assert client.get('/boom').status_code == 500
+    assert limits.stats()['public'] == 0
@@ -0,0 +1,59 @@
+# tests/test_fares.py
+#
+# A pair is sold when its stops are different, active, share an active route (if
+# any route is active) and their zones have a fare. The apply form prices pairs
+# from form_data() by the same rule.
+
+from decimal import Decimal
+
+from fares import FareTable, Stop, Route
+
+STOPS = [
+    Stop(1, 'Majestic', 1, True),
+    Stop(2, 'Jayanagar', 1, True),
+    Stop(3, 'Koramangala', 2, True),
+    Stop(4, 'Whitefield', 3, True),
+    Stop(5, 'Marathahalli', 3, False),
+]
+ZONE_FARES = {(1, 1): Decimal('300.00'), (1, 2): Decimal('450.00'), (2, 3): Decimal('400.00')}
+
+
+def test_without_routes_any_two_active_stops_are_priced_by_zone():
+    table = FareTable(1, STOPS, ZONE_FARES, [])
+
+    assert table.fare('Majestic', 'Jayanagar') == Decimal('300.00')
+    assert table.fare('Koramangala', 'Majestic') == Decimal('450.00')
+    assert table.fare('Majestic', 'Majestic') is None
+    assert table.fare('Majestic', 'Whitefield') is None  # no zone 1-3 fare
+    assert table.fare('Koramangala', 'Marathahalli') is None  # inactive stop
+    assert table.fare('Majestic', 'Nowhere') is None
+    assert table.min_fare() == Decimal('300.00')
+
+
+def test_active_routes_limit_pairs_to_stops_sharing_one():
+    routes = [
+        Route(1, '201', 'Ring', True, ['Majestic', 'Koramangala', 'Whitefield']),
+        Route(2, '500D', 'Outer', True, ['Jayanagar', 'Koramangala']),
+        Route(3, 'OLD', 'Closed', False, ['Majestic', 'Jayanagar']),
+    ]
+    table = FareTable(1, STOPS, ZONE_FARES, routes)
+
+    assert table.fare('Majestic', 'Koramangala') == Decimal('450.00')
+    assert table.fare('Jayanagar', 'Koramangala') == Decimal('450.00')
+    assert table.fare('Koramangala', 'Whitefield') == Decimal('400.00')
+    assert table.fare('Majestic', 'Jayanagar') is None  # only on an inactive route
+    # The 300.00 zone 1-1 fare is not sold on any active route
+    assert table.min_fare() == Decimal('400.00')
+
+    data = table.form_data()
+    assert data['zones']['Whitefield'] == 3
+    assert 'Marathahalli' not in data['zones']
+    assert data['routes']['Koramangala'] == ['201', '500D']
+    assert data['fares'] == {'1|1': '300.00', '1|2': '450.00', '2|3': '400.00'}
+
+
+def test_nothing_sold():
+    table = FareTable(1, STOPS[:1], ZONE_FARES, [])
+
+    assert table.min_fare() is None
+    assert table.form_data()['routes'] is None
@@ -0,0 +1,43 @@
+# tests/test_metrics.py
+#
+# Iterating an instrumented cursor must stream rows from the wrapped cursor, not
+# buffer the whole result, and still record the read once it is consumed.
+
+from metrics import InstrumentedCursor, db_query_rows, statement_label
+
+
+class StreamingCursor:
+    with_rows = True
+    rowcount = -1
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.yielded = 0
+
+    def execute(self, operation, params=None):
+        pass
+
+    def __iter__(self):
+        for row in self.rows:
+            self.yielded += 1
+            yield row
+
+    def fetchall(self):
+        raise AssertionError('iteration should not buffer the result')
+
+    def close(self):
+        pass
+
+
+def test_iteration_streams_rows_and_records_the_read():
+    raw = StreamingCursor([(1,), (2,), (3,)])
+    cursor = InstrumentedCursor(raw)
+    cursor.execute("SELECT id FROM test_metrics_streaming")
+
+    rows = iter(cursor)
+    assert next(rows) == (1,)
+    assert raw.yielded == 1
+
+    assert list(rows) == [(2,), (3,)]
+    series = db_query_rows._series[(statement_label("SELECT id FROM test_metrics_streaming"),)]
+    assert series[-2:] == [3, 1]  # 3 rows, in one recorded read
@@ -0,0 +1,85 @@
+# tests/test_pass_cache.py
+#
+# A pass row loaded while the rider's pass changed must never be served from the
+# cache afterwards, whichever worker did the invalidation.
+
+import pytest
+
+from pass_cache import PassCache, TTLCache, SharedCache, LocalSharedStore
+
+
+def local_workers():
+    # One process: both callers share the per-process LRU
+    cache = PassCache(TTLCache(max_items=100, ttl=60))
+    return cache, cache
+
+
+def shared_workers():
+    # Two worker processes sharing one store
+    store = LocalSharedStore()
+    return PassCache(SharedCache(store, ttl=60)), PassCache(SharedCache(store, ttl=60))
+
+
+def unexpected_load(recently_changed):
+    raise AssertionError('should have been served from the cache')
+
+
+@pytest.fixture(params=[local_workers, shared_workers], ids=['local', 'shared'])
+def workers(request):
+    return request.param()
+
+
+def test_load_racing_an_invalidation_is_not_cached(workers):
+    worker_a, worker_b = workers
+
+    def stale_load(recently_changed):
+        # Worker B approves the pass while A is still reading the old row
+        worker_b.invalidate(7)
+        return {'status': 'PENDING'}
+
+    assert worker_a.get_or_load(7, stale_load) == {'status': 'PENDING'}
+
+    reloads = []
+
+    def fresh_load(recently_changed):
+        reloads.append(recently_changed)
+        return {'status': 'APPROVED'}
+
+    assert worker_a.get_or_load(7, fresh_load) == {'status': 'APPROVED'}
+    assert reloads == [True]  # read from the primary
+    assert worker_b.get_or_load(7, unexpected_load) == {'status': 'APPROVED'}
+
+
+def test_invalidating_another_rider_keeps_the_load(workers):
+    worker_a, worker_b = workers
+
+    def load(recently_changed):
+        worker_b.invalidate(8)
+        return {'status': 'APPROVED'}
+
+    worker_a.get_or_load(7, load)
+    assert worker_a.get_or_load(7, unexpected_load) == {'status': 'APPROVED'}
+
+
+def test_invalidation_after_caching_forces_a_primary_reload(workers):
+    worker_a, worker_b = workers
+    worker_a.get_or_load(7, lambda recently_changed: {'status': 'PENDING'})
+    worker_b.invalidate(7)
+
+    reloads = []
+    worker_a.get_or_load(7, lambda recently_changed: reloads.append(recently_changed) or {'status': 'APPROVED'})
+    assert reloads == [True]
+
+
+def test_evicted_invalidation_marker_does_not_let_a_stale_load_in():
+    cache = PassCache(TTLCache(max_items=1, ttl=60))
+
+    def stale_load(recently_changed):
+        cache.invalidate(7)
+        cache.invalidate(8)  # evicts 7's marker
+        return {'status': 'PENDING'}
+
+    cache.get_or_load(7, stale_load)
+    reloads = []
+    cache.get_or_load(7, lambda recently_changed: reloads.append(recently_changed) or {'status': 'APPROVED'})
+    assert len(reloads) == 1
@@ -0,0 +1,66 @@
+# tests/test_pass_changes.py
+#
+# Validator delta sync must never skip a change: change log writers commit in seq
+# order, so the version a device synced to is a safe watermark.
+
+import datetime
+import threading
+
+from conftest import requires_mysql
+
+import validation_snapshot
+from validation_snapshot import SnapshotReader
+
+
+def added(pass_number):
+    return (pass_number, 'ADD', 'Majestic', 'Jayanagar', datetime.date.today() + datetime.timedelta(days=30))
+
+
+@requires_mysql
+def test_interleaved_writers_are_not_skipped_by_delta_sync(mysql_connect):
+    setup = mysql_connect()
+    cursor = setup.cursor()
+    cursor.execute("DELETE FROM pass_changes")
+    cursor.execute("UPDATE pass_change_seq SET seq = 0 WHERE id = 1")
+    setup.commit()
+    cursor.close()
+
+    first, second, device = mysql_connect(), mysql_connect(), mysql_connect()
+    first_cursor = first.cursor()
+    validation_snapshot.record_pass_changes(first_cursor, [added('BP-1-TEST')])  # seq 1, not committed
+
+    second_recorded, second_may_commit = threading.Event(), threading.Event()
+
+    def second_writer():
+        second_cursor = second.cursor()
+        validation_snapshot.record_pass_changes(second_cursor, [added('BP-2-TEST')])
+        second_recorded.set()
+        second_may_commit.wait(30)
+        second.commit()
+        second_cursor.close()
+
+    thread = threading.Thread(target=second_writer)
+    thread.start()
+    try:
+        # The second writer cannot take (and commit) seq 2 while seq 1 is still open
+        assert not second_recorded.wait(1.0)
+        first.commit()
+        first_cursor.close()
+        assert second_recorded.wait(30)
+
+        # A device syncing between the two commits gets seq 1 only...
+        version, blob = validation_snapshot.delta_since(device, 0)
+        device.commit()
+        assert version == 1
+        assert SnapshotReader(blob).lookup('BP-1-TEST')
+    finally:
+        second_may_commit.set()
+        thread.join(30)
+
+    # ...and the second change on its next sync
+    version, blob = validation_snapshot.delta_since(device, version)
+    device.commit()
+    reader = SnapshotReader(blob)
+    assert version == 2
+    assert reader.lookup('BP-2-TEST')
+    assert reader.lookup('BP-1-TEST') is None
@@ -0,0 +1,103 @@
+# tests/test_pass_tokens.py
+#
+# Pass tokens verify offline: any configured key is accepted (so rotation keeps
+# old passes working), anything altered or malformed is refused, and a pass is
+# only valid inside its inclusive validity window.
+
+import datetime
+
+import pytest
+
+import pass_tokens
+from pass_tokens import PassTokenVerifier, sign_pass_token
+
+VALID_FROM = datetime.date(2026, 3, 10)
+VALID_UNTIL = datetime.date(2026, 4, 30)
+
+
+@pytest.fixture(autouse=True)
+def signing_keys(monkeypatch):
+    monkeypatch.setattr(pass_tokens, 'PASS_SIGNING_KEYS', {'k1': 'old-secret', 'k2': 'new-secret'})
+    monkeypatch.setattr(pass_tokens, 'PASS_SIGNING_KEY_ID', 'k2')
+
+
+def token(kid=None):
+    return sign_pass_token('BP-42', 'Majestic', 'Jayanagar', VALID_FROM, VALID_UNTIL, kid=kid)
+
+
+def verify(token_text, day=VALID_FROM, keys=None):
+    verifier = PassTokenVerifier(keys or {'k1': 'old-secret', 'k2': 'new-secret'})
+    return verifier.verify(token_text, day.toordinal())
+
+
+def test_valid_token_carries_the_pass_fields():
+    signed = token()
+
+    assert signed.startswith('k2.')
+    assert verify(signed) == {'valid': True, 'pass_number': 'BP-42', 'route': 'Majestic-Jayanagar',
+                              'valid_until': '2026-04-30'}
+
+
+def test_key_rotation():
+    old = token(kid='k1')
+
+    # While both keys are configured, passes signed with the previous key still verify
+    assert verify(old)['valid']
+    # Once the previous key is removed they are refused
+    assert verify(old, keys={'k2': 'new-secret'}) == {'valid': False, 'reason': 'unknown_key'}
+    # A kid pointing at a different key's secret does not verify
+    assert verify(old, keys={'k1': 'new-secret'}) == {'valid': False, 'reason': 'bad_signature'}
+
+
+def test_tampered_tokens_are_refused():
+    kid, payload, mac = token().split('.')
+    forged_payload = pass_tokens._b64encode(b'BP-42|Majestic|Whitefield|739000|800000')
+    flipped_mac = mac[:-2] + ('AA' if mac[-2:] != 'AA' else 'BB')
+
+    assert verify(f"{kid}.{forged_payload}.{mac}")['reason'] == 'bad_signature'
+    assert verify(f"{kid}.{payload}.{flipped_mac}")['reason'] == 'bad_signature'
+    assert verify(f"{kid}.{payload}.")['reason'] == 'bad_signature'
+    assert verify(f"k1.{payload}.{mac}")['reason'] == 'bad_signature'
+
+
+@pytest.mark.parametrize('bad', [None, 42, '', 'no-dots', 'k2.only-two', 'k2.payload.@@@', 'k9.payload.mac'])
+def test_malformed_tokens_are_refused(bad):
+    result = verify(bad)
+
+    assert result['valid'] is False
+    assert result['reason'] in ('malformed', 'unknown_key', 'bad_signature')
+
+
+def test_correctly_signed_but_malformed_payload():
+    key = b'new-secret'
+    signed = f"k2.{pass_tokens._b64encode(b'BP-42|Majestic|not-a-day')}"
+    forged = f"{signed}.{pass_tokens._b64encode(pass_tokens._mac(key, signed.encode()))}"
+
+    assert verify(forged) == {'valid': False, 'reason': 'malformed'}
+
+
+@pytest.mark.parametrize('day, valid, reason', [
+    (VALID_FROM - datetime.timedelta(days=1), False, 'not_yet_valid'),
+    (VALID_FROM, True, None),
+    (VALID_UNTIL, True, None),
+    (VALID_UNTIL + datetime.timedelta(days=1), False, 'expired'),
+])
+def test_validity_window_is_inclusive(day, valid, reason):
+    result = verify(token(), day)
+
+    assert result['valid'] is valid
+    assert result.get('reason') == reason
+    assert result['pass_number'] == 'BP-42'
+
+
+def test_offline_scans_are_judged_at_scan_time():
+    verifier = PassTokenVerifier({'k2': 'new-secret'})
+    scanned_in_window = datetime.datetime(2026, 4, 30, 12).timestamp()
+
+    results = verifier.verify_many([
+        {'token': token(), 'scanned_at': scanned_in_window},
+        {'token': token(), 'scanned_at': 'yesterday'},
+    ])
+
+    assert results[0]['valid'] is True
+    assert results[1] == {'valid': False, 'reason': 'malformed'}
@@ -0,0 +1,165 @@
+# tests/test_payments.py
+#
+# Gateway events are applied exactly once per idempotency key: replays (from
+# memory, from the ledger or within one batch) return the first outcome, a
+# success for the wrong amount is refused, and a failed payment can still be
+# completed by a later success.
+
+import uuid
+from decimal import Decimal
+
+import pytest
+
+from conftest import requires_mysql
+
+import payments
+from payments import RecentKeys, apply_events, parse_event, _plan
+
+
+# Ledger keys are never deleted, so each run uses its own
+RUN = uuid.uuid4().hex[:12]
+
+
+def ledger_key(name):
+    return f"test-{name}-{RUN}"
+
+
+def event(key, status='succeeded', application_id=1, amount=None):
+    return parse_event({'idempotency_key': key, 'application_id': application_id, 'status': status,
+                        'amount': amount})
+
+
+def row(payment_status='PENDING', amount='500.00'):
+    return {'id': 1, 'user_id': 1, 'status': 'PENDING', 'payment_status': payment_status,
+            'amount': Decimal(amount)}
+
+
+@pytest.mark.parametrize('status, payment_status, amount, expected', [
+    ('succeeded', 'PENDING', None, ('applied', None)),
+    ('succeeded', 'PENDING', '500', ('applied', None)),
+    ('succeeded', 'PENDING', '499.99', ('rejected', 'amount mismatch (expected 500.00)')),
+    ('succeeded', 'FAILED', '500', ('applied', None)),
+    ('succeeded', 'COMPLETED', '500', ('ignored', 'already paid')),
+    ('failed', 'PENDING', None, ('applied', None)),
+    ('failed', 'COMPLETED', None, ('ignored', 'payment already completed')),
+    ('failed', 'FAILED', None, ('ignored', 'payment already failed')),
+])
+def test_plan(status, payment_status, amount, expected):
+    assert _plan(event('k', status, amount=amount), row(payment_status)) == expected
+
+
+def test_plan_unknown_application():
+    assert _plan(event('k'), None) == ('rejected', 'unknown application')
+
+
+def test_recent_keys_forget_the_oldest_past_max_items():
+    keys = RecentKeys(max_items=2)
+    keys.add_many([('a', ('applied', None)), ('b', ('ignored', 'already paid'))])
+    keys.get('a')  # reads do not refresh an entry's age
+    keys.add_many([('c', ('applied', None))])
+
+    assert keys.get('a') is None
+    assert keys.get('b') == ('ignored', 'already paid')
+    assert keys.get('c') == ('applied', None)
+
+    keys.add_many([('b', ('applied', None)), ('d', ('applied', None))])
+    assert keys.get('b') == ('applied', None)  # re-added, so now the newest
+    assert keys.get('c') is None
+
+
+def test_replays_in_recent_keys_skip_the_database():
+    payments.recent_keys.add_many([('seen-before', ('applied', None))])
+
+    # A connection would be needed for anything not answered from memory
+    assert apply_events(None, [event('seen-before')]) == [{
+        'idempotency_key': 'seen-before', 'application_id': 1, 'outcome': 'applied', 'detail': None,
+        'duplicate': True,
+    }]
+
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch):
+    monkeypatch.setattr(payments, 'recent_keys', RecentKeys(100))
+    monkeypatch.setattr(payments, 'audit_log', RecordedEvents())
+
+
+class RecordedEvents:
+    def __init__(self):
+        self.events = []
+
+    def record(self, event, application_id=None, user_id=None, actor='system', detail=None):
+        self.events.append((event, application_id))
+        return True
+
+
+@pytest.fixture
+def application(mysql_connect):
+    """A new rider with one unpaid 500.00 application; returns (connection, application id)."""
+    conn = mysql_connect()
+    cursor = conn.cursor()
+    cursor.execute(
+        "INSERT INTO users (name, email, password_hash, phone_number) VALUES (%s, %s, '!unusable', '9999999999')",
+        ('Payments Test', f"payments-{uuid.uuid4().hex}@example.com")
+    )
+    cursor.execute(
+        "INSERT INTO applications (user_id, start_point, end_point, amount, status, payment_status, "
+        "application_date) VALUES (%s, 'Majestic', 'Jayanagar', 500.00, 'PENDING', 'PENDING', NOW())",
+        (cursor.lastrowid,)
+    )
+    app_id = cursor.lastrowid
+    conn.commit()
+    cursor.close()
+    return conn, app_id
+
+
+def payment_status(conn, app_id):
+    cursor = conn.cursor()
+    cursor.execute("SELECT payment_status FROM applications WHERE id = %s", (app_id,))
+    status = cursor.fetchone()[0]
+    conn.commit()
+    cursor.close()
+    return status
+
+
+@requires_mysql
+def test_duplicate_keys_apply_once(application):
+    conn, app_id = application
+
+    first = apply_events(conn, [event(ledger_key('dup'), application_id=app_id),
+                                event(ledger_key('dup'), application_id=app_id)])
+    assert [(r['outcome'], r['duplicate']) for r in first] == [('applied', False), ('applied', True)]
+
+    # A later replay is answered from the ledger once it is no longer in memory
+    payments.recent_keys = RecentKeys(100)
+    replay = apply_events(conn, [event(ledger_key('dup'), application_id=app_id)])
+    assert (replay[0]['outcome'], replay[0]['duplicate']) == ('applied', True)
+    assert payment_status(conn, app_id) == 'COMPLETED'
+    assert payments.audit_log.events == [('payment_succeeded', app_id)]
+
+
+@requires_mysql
+def test_amount_mismatch_is_rejected(application):
+    conn, app_id = application
+
+    result = apply_events(conn, [event(ledger_key('short'), application_id=app_id, amount='1.00')])
+
+    assert (result[0]['outcome'], result[0]['detail']) == ('rejected', 'amount mismatch (expected 500.00)')
+    assert payment_status(conn, app_id) == 'PENDING'
+
+
+@requires_mysql
+def test_failed_payment_can_then_succeed(application):
+    conn, app_id = application
+
+    failed = apply_events(conn, [event(ledger_key('fail'), 'failed', application_id=app_id)])
+    assert failed[0]['outcome'] == 'applied'
+    assert payment_status(conn, app_id) == 'FAILED'
+
+    paid = apply_events(conn, [event(ledger_key('retry'), application_id=app_id, amount='500')])
+    assert paid[0]['outcome'] == 'applied'
+    assert payment_status(conn, app_id) == 'COMPLETED'
+
+    # A late failure for a completed payment is ignored
+    late = apply_events(conn, [event(ledger_key('late-fail'), 'failed', application_id=app_id)])
+    assert (late[0]['outcome'], late[0]['detail']) == ('ignored', 'payment already completed')
+    assert payment_status(conn, app_id) == 'COMPLETED'
@@ -0,0 +1,266 @@
+# validation_snapshot.py
+#
+# Compact binary snapshot of the active pass set for offline conductor devices.
+#
+# Every blob is zlib-compressed. Decompressed layout (little-endian):
+#   header  : magic b'BPS1', u8 kind (0 = full, 1 = delta), u64 version, u64 base_version,
+#             u32 route_count, u32 add_count, u32 remove_count
+#   routes  : route_count x (u16 length, UTF-8 "start-end")
+#   adds    : add_count x (u64 key, u16 route index, u16 expiry day), sorted by key
+#   removes : remove_count x u64 key, sorted
+#
+# key = first 8 bytes of BLAKE2b(pass_number) read as a big-endian integer, so a
+# device binary-searches the adds for the key of a scanned pass number. The expiry
+# day counts days since 1970-01-01 and the pass is valid through that day. A
+# delta applies on top of a snapshot at base_version: remove the removed keys,
+# then upsert the added records.
+
+import hmac
+import zlib
+import bisect
+import struct
+import hashlib
+import datetime
+import threading
+
+import click
+from flask.cli import AppGroup
+
+from config import (
+    SNAPSHOT_DELTA_MAX_CHANGES, SNAPSHOT_DEVICE_KEYS, SNAPSHOT_ALLOWED_IPS, PASS_CHANGES_RETENTION_DAYS,
+)
+from db import pool as db_pool
+
+MAGIC = b'BPS1'
+KIND_FULL, KIND_DELTA = 0, 1
+HEADER = struct.Struct('<4sBQQIII')
+RECORD = struct.Struct('<QHH')
+KEY = struct.Struct('<Q')
+EPOCH = datetime.date(1970, 1, 1)
+
+
+def pass_key(pass_number: str) -> int:
+    return int.from_bytes(hashlib.blake2b(pass_number.encode(), digest_size=8).digest(), 'big')
+
+
+def expiry_day(valid_until: datetime.date) -> int:
+    return (valid_until - EPOCH).days
+
+
+def encode(kind, version, base_version, adds, removes) -> bytes:
+    """
+    Serialises a snapshot or delta. `adds` maps key -> (route, expiry day) and
+    `removes` is an iterable of keys.
+    """
+    routes, route_index = [], {}
+    records = []
+    for key in sorted(adds):
+        route, expires = adds[key]
+        index = route_index.get(route)
+        if index is None:
+            index = route_index[route] = len(routes)
+            routes.append(route)
+        records.append(RECORD.pack(key, index, expires))
+    removes = sorted(removes)
+
+    parts = [HEADER.pack(MAGIC, kind, version, base_version, len(routes), len(records), len(removes))]
+    for route in routes:
+        encoded = route.encode()
+        parts.append(struct.pack('<H', len(encoded)) + encoded)
+    parts.extend(records)
+    parts.extend(KEY.pack(key) for key in removes)
+    return zlib.compress(b''.join(parts), 6)
+
+
+def build_snapshot(rows, version, today=None) -> bytes:
+    """
+    Full snapshot from (pass_number, start_point, end_point, valid_until) rows;
+    passes already expired on `today` are left out.
+    """
+    today = expiry_day(today or datetime.date.today())
+    adds = {}
+    for pass_number, start_point, end_point, valid_until in rows:
+        expires = expiry_day(valid_until)
+        if expires >= today:
+            adds[pass_key(pass_number)] = (f"{start_point}-{end_point}", expires)
+    return encode(KIND_FULL, version, 0, adds, ())
+
+
+def build_delta(changes, base_version, version) -> bytes:
+    """
+    Delta from pass_changes rows (op, pass_number, start_point, end_point,
+    valid_until) in seq order; only the last change per pass survives.
+    """
+    adds, removes = {}, set()
+    for op, pass_number, start_point, end_point, valid_until in changes:
+        key = pass_key(pass_number)
+        if op == 'ADD':
+            removes.discard(key)
+            adds[key] = (f"{start_point}-{end_point}", expiry_day(valid_until))
+        else:
+            adds.pop(key, None)
+            removes.add(key)
+    return encode(KIND_DELTA, version, base_version, adds, removes)
+
+
+class SnapshotReader:
+    """Decodes a blob and answers lookups by binary search, as a device would."""
+
+    def __init__(self, blob: bytes):
+        data = zlib.decompress(blob)
+        magic, self.kind, self.version, self.base_version, route_count, add_count, remove_count = \
+            HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError('not a pass snapshot')
+        offset = HEADER.size
+        self.routes = []
+        for _ in range(route_count):
+            (length,) = struct.unpack_from('<H', data, offset)
+            self.routes.append(data[offset + 2:offset + 2 + length].decode())
+            offset += 2 + length
+        self._records = memoryview(data)[offset:offset + add_count * RECORD.size]
+        self._keys = [key for (key, _, _) in RECORD.iter_unpack(self._records)]
+        offset += add_count * RECORD.size
+        self.removed = [key for (key,) in KEY.iter_unpack(data[offset:offset + remove_count * KEY.size])]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def lookup(self, pass_number, on=None):
+        """Returns (route, valid_until) if the pass is present and unexpired on `on`, else None."""
+        key = pass_key(pass_number)
+        i = bisect.bisect_left(self._keys, key)
+        if i == len(self._keys) or self._keys[i] != key:
+            return None
+        _, route_index, expires = RECORD.unpack_from(self._records, i * RECORD.size)
+        if expires < expiry_day(on or datetime.date.today()):
+            return None
+        return self.routes[route_index], EPOCH + datetime.timedelta(days=expires)
+
+
+def client_allowed(remote_addr, authorization) -> bool:
+    """
+    True for addresses in SNAPSHOT_ALLOWED_IPS and for devices presenting one of
+    SNAPSHOT_DEVICE_KEYS as a bearer token. The snapshot lists every active pass,
+    and pass numbers are guessable, so it is never served to anyone else.
+    """
+    if SNAPSHOT_ALLOWED_IPS is None or remote_addr in SNAPSHOT_ALLOWED_IPS:
+        return True
+    scheme, _, key = (authorization or '').partition(' ')
+    if scheme.lower() != 'bearer' or not key.strip():
+        return False
+    key = key.strip().encode()
+    return any(hmac.compare_digest(key, device_key.encode()) for device_key in SNAPSHOT_DEVICE_KEYS)
+
+
+def record_pass_changes(cursor, changes):
+    """
+    Logs changes to the active pass set inside the caller's transaction.
+    `changes` is a list of (pass_number, op, start_point, end_point, valid_until).
+
+    The seqs come from the pass_change_seq row, which stays locked until the
+    caller commits, so writers commit in seq order: a device that synced up to
+    seq N can never have a lower seq commit after it. Call this last, just
+    before committing, to keep that lock short.
+    """
+    if changes:
+        # LAST_INSERT_ID(expr) hands the new value back as the cursor's lastrowid
+        cursor.execute(
+            "UPDATE pass_change_seq SET seq = LAST_INSERT_ID(seq + %s) WHERE id = 1",
+            (len(changes),)
+        )
+        first = cursor.lastrowid - len(changes) + 1
+        cursor.executemany(
+            "INSERT INTO pass_changes (seq, pass_number, op, start_point, end_point, valid_until) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            [(first + offset, *change) for offset, change in enumerate(changes)]
+        )
+
+
+def current_version(cursor):
+    cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM pass_changes")
+    return cursor.fetchone()[0]
+
+
+_cache_lock = threading.Lock()
+_cached_full = (None, None)  # (version, blob)
+
+
+def full_snapshot(conn):
+    """Returns (version, blob), rebuilding only when the change log has moved on."""
+    global _cached_full
+    cursor = conn.cursor()
+    try:
+        # Read the version and the pass set from one consistent view, so the
+        # snapshot matches its version exactly
+        cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT")
+        version = current_version(cursor)
+        cached_version, blob = _cached_full
+        if cached_version == version:
+            return version, blob
+        cursor.execute(
+            "SELECT pass_number, start_point, end_point, valid_until "
+            "FROM applications WHERE status = 'APPROVED'"
+        )
+        rows = iter(cursor)
+        blob = build_snapshot(rows, version)
+    finally:
+        conn.commit()
+        cursor.close()
+    with _cache_lock:
+        if _cached_full[0] is None or _cached_full[0] < version:
+            _cached_full = (version, blob)
+    return version, blob
+
+
+def delta_since(conn, since):
+    """
+    Returns (version, blob) for the changes after `since`, or None when a full
+    snapshot is needed instead (log pruned past `since`, or too many changes).
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT COALESCE(MIN(seq), 1), COALESCE(MAX(seq), 0) FROM pass_changes")
+        oldest, version = cursor.fetchone()
+        if since > version:
+            return None
+        if since < oldest - 1:
+            return None
+        cursor.execute(
+            "SELECT op, pass_number, start_point, end_point, valid_until FROM pass_changes "
+            "WHERE seq > %s AND seq <= %s ORDER BY seq LIMIT %s",
+            (since, version, SNAPSHOT_DELTA_MAX_CHANGES + 1)
+        )
+        changes = cursor.fetchall()
+    finally:
+        cursor.close()
+    if len(changes) > SNAPSHOT_DELTA_MAX_CHANGES:
+        return None
+    return version, build_delta(changes, since, version)
+
+
+snapshot_cli = AppGroup('snapshot', help='Offline validation snapshots.')
+
+
+@snapshot_cli.command('prune')
+@click.option('--keep-days', default=PASS_CHANGES_RETENTION_DAYS, show_default=True)
+def prune_command(keep_days):
+    """Delete old pass change log entries (devices older than this resync in full)."""
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            version = current_version(cursor)
+            # Always keep the newest entry so the snapshot version never goes backwards
+            cursor.execute(
+                "DELETE FROM pass_changes WHERE changed_at < NOW() - INTERVAL %s DAY AND seq < %s",
+                (keep_days, version)
+            )
+            deleted = cursor.rowcount
+            conn.commit()
+        finally:
+            cursor.close()
+    click.echo(f"Deleted {deleted} change(s).")
+
+
+def init_app(app):
+    app.cli.add_command(snapshot_cli)